@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: analyzer checkpoint size, delta save time (paid on the analyzer thread), background
+compaction time and warm-restart load time.
+Usage: python benchmarks/bench_checkpoint.py [--keys 1000000]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import logging
+import argparse
+import tempfile
+# room for every synthetic key, so nothing is evicted while filling
+os.environ.setdefault('ANALYZER_MAX_KEYS', '10000000')
+os.environ.setdefault('ANALYZER_MAX_EVENTS', '100000000')
+from collector.analyzer import Analyzer
+from collector.checkpoint import Checkpointer
+
+def fill(analyzer, keys):
+    # spread keys over both default rules, with a few events each
+    fails, seq = analyzer.rules[0].state, analyzer.rules[1].state
+    base = 1700000000
+    for i in range(keys):
+        ip = '10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255)
+        for j in range(1 + i % 4):
+            fails.add(ip, base + j)
+        if i % 2:
+            seq.add(ip, base + 5)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR)
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--keys', type=int, default=1000000)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        a = Analyzer(None)
+        cp = Checkpointer(a, directory=d)
+        fill(a, args.keys)
+        t0 = time.perf_counter()
+        cp.save(compact=True)
+        first_s = time.perf_counter() - t0
+        cp.wait()
+        compact_s = time.perf_counter() - t0 - first_s
+        size = os.path.getsize(cp.snapshot_path)
+
+        # touch 1% of keys and write a delta
+        fails = a.rules[0].state
+        for i in range(0, args.keys, 100):
+            fails.add('10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255), 1700000010)
+        t0 = time.perf_counter()
+        cp.save()
+        delta_s = time.perf_counter() - t0
+        cp.wait()
+
+        b = Analyzer(None)
+        t0 = time.perf_counter()
+        loaded = Checkpointer(b, directory=d).load()
+        load_s = time.perf_counter() - t0
+        assert b.rules[0].state.count('10.0.0.3') == a.rules[0].state.count('10.0.0.3')
+    total = sum(len(state) for state in cp.stores.values())
+    print(f'tracked keys:        {total:,}')
+    print(f'snapshot size:       {size / 1e6:.1f} MB')
+    print(f'first save (all keys): {first_s:.3f}s')
+    print(f'compaction (background): {compact_s:.3f}s')
+    print(f'1% delta save:       {delta_s:.3f}s')
+    print(f'load (snap + delta): {load_s:.3f}s for {loaded:,} keys')
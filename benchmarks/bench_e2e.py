@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark: the collector's real receive path (UDP protocol / TCP handler -> ingest queue ->
+consumers -> dedupe, parser, batch writer to SQLite, analyzer) driven by benchmarks/loadgen.py from a separate
+process at a series of target rates, over UDP and over TCP.
+Reports, per run: achieved send rate, drop rate (sent but never stored: kernel socket drops plus ingest
+overflow), receive-to-stored and receive-to-alert latency percentiles, and collector CPU per message.
+"Receive" is when the line reaches the ingest queue; "stored" is when the batch holding it is committed,
+so stored latency includes the writer's batching (WRITE_BATCH_SIZE / WRITE_FLUSH_INTERVAL apply as usual).
+Usage: python benchmarks/bench_e2e.py [--rates 1000,5000,20000] [--duration 5] [--protocols udp,tcp]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from collector import main as collector
+from collector.storage import Storage
+from collector.writer import BatchWriter
+from collector.dedupe import DedupeCache
+from collector.analyzer import Analyzer
+from collector.ingest import IngestQueue
+from loadgen import LogGenerator, send
+
+class StampedIngest(IngestQueue):
+    # records when each line was received; lines are unique, so the text is the key
+    def __init__(self, received, *args):
+        super().__init__(*args)
+        self.received = received
+
+    def offer(self, item):
+        self.received[item[0]] = time.monotonic()
+        return super().offer(item)
+
+    async def put(self, item):
+        self.received[item[0]] = time.monotonic()
+        await super().put(item)
+
+    async def put_many(self, items):
+        now = time.monotonic()
+        for item in items:
+            self.received[item[0]] = now
+        await super().put_many(items)
+
+class CountingAlerting:
+    # stands in for the email/Slack sinks
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, alert):
+        self.sent += 1
+
+def timed_storage(storage, received, latencies):
+    index_many = storage.index_many
+    def timed(docs):
+        n = index_many(docs)
+        now = time.monotonic()
+        latencies.extend(now - received[doc.raw] for doc in docs)
+        return n
+    storage.index_many = timed
+    return storage
+
+def timed_analyzer(analyzer, received, latencies):
+    process_all = analyzer.process_all
+    def timed(doc):
+        alerts = process_all(doc)
+        if alerts:
+            now = time.monotonic()
+            latencies.extend([now - received[doc.raw]] * len(alerts))
+        return alerts
+    analyzer.process_all = timed
+    return analyzer
+
+def percentiles(values, ps=(50, 95, 99)):
+    if not values:
+        return [float('nan')] * len(ps)
+    values = sorted(values)
+    return [values[min(len(values) - 1, int(len(values) * p / 100))] for p in ps]
+
+def _sender(results, protocol, port, rate, duration):
+    logging.getLogger().setLevel(logging.CRITICAL)
+    results.put(send(LogGenerator(), '127.0.0.1', port, protocol, rate, duration))
+
+async def run(protocol, rate, duration, db_path):
+    received = {}
+    stored_lat = []
+    alert_lat = []
+    collector.RECENT_MSGS = DedupeCache(ttl=collector.DEDUPE_TTL, max_entries=collector.DEDUPE_MAX_ENTRIES)
+    storage = timed_storage(Storage(es_host='http://invalid:9999', db_path=db_path), received, stored_lat)
+    writer = BatchWriter(storage).start()
+    analyzer = timed_analyzer(Analyzer(storage), received, alert_lat)
+    alerting = CountingAlerting()
+    ingest = StampedIngest(received, collector.INGEST_QUEUE_MAX, collector.INGEST_OVERFLOW_POLICY, collector.INGEST_SAMPLE_EVERY)
+    loop = asyncio.get_running_loop()
+    tasks = [asyncio.create_task(collector.consume(ingest, writer, analyzer, alerting)) for _ in range(collector.INGEST_CONSUMERS)]
+    if protocol == 'udp':
+        transport, _ = await loop.create_datagram_endpoint(lambda: collector.UDPServerProtocol(ingest), local_addr=('127.0.0.1', 0))
+        port = transport.get_extra_info('sockname')[1]
+    else:
+        server = await asyncio.start_server(lambda r, w: collector.tcp_client_handler(r, w, ingest), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+
+    results = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_sender, args=(results, protocol, port, rate, duration))
+    cpu0 = time.process_time()
+    proc.start()
+    await loop.run_in_executor(None, proc.join)
+    sent = results.get()
+    # let the consumers drain, then flush the writer; datagrams the kernel dropped never arrive,
+    # so stop waiting once receipts go quiet
+    deadline = time.monotonic() + 30
+    last = -1
+    while time.monotonic() < deadline:
+        if not len(ingest) and (len(received) >= sent['sent'] or len(received) == last):
+            break
+        last = len(received)
+        await asyncio.sleep(0.2)
+    await loop.run_in_executor(None, writer.stop)
+    cpu = time.process_time() - cpu0
+
+    for task in tasks:
+        task.cancel()
+    if protocol == 'udp':
+        transport.close()
+    else:
+        server.close()
+    return {
+        'sent': sent['sent'],
+        'send_rate': sent['rate'],
+        'received': len(received),
+        'stored': writer.written,
+        'alerts': alerting.sent,
+        'stored_ms': [v * 1000 for v in percentiles(stored_lat)],
+        'alert_ms': [v * 1000 for v in percentiles(alert_lat)],
+        'cpu_us': cpu / max(1, len(received)) * 1e6,
+    }
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rates', default='1000,5000,20000', help='comma-separated target messages/sec')
+    ap.add_argument('--duration', type=float, default=5, help='seconds per run')
+    ap.add_argument('--protocols', default='udp,tcp')
+    args = ap.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+    print(f'{os.cpu_count()} CPUs; the load generator runs in its own process and competes for them')
+    print(f'{"proto":5s} {"target/s":>9s} {"sent/s":>9s} {"stored":>9s} {"drop%":>6s} {"alerts":>7s} '
+          f'{"stored ms p50/p95/p99":>24s} {"alert ms p50/p95/p99":>24s} {"cpu us/msg":>10s}')
+    with tempfile.TemporaryDirectory() as d:
+        for protocol in args.protocols.split(','):
+            for rate in (float(r) for r in args.rates.split(',')):
+                db_path = os.path.join(d, f'{protocol}-{rate:.0f}.db')
+                r = asyncio.run(run(protocol, rate, args.duration, db_path))
+                drop = 100.0 * (r['sent'] - r['stored']) / max(1, r['sent'])
+                print(f'{protocol:5s} {rate:9,.0f} {r["send_rate"]:9,.0f} {r["stored"]:9,d} {drop:6.2f} {r["alerts"]:7d} '
+                      f'{"/".join("%.1f" % v for v in r["stored_ms"]):>24s} {"/".join("%.1f" % v for v in r["alert_ms"]):>24s} '
+                      f'{r["cpu_us"]:10.1f}')
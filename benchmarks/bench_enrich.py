@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: asset enrichment cost. A synthetic CIDR table of nested /8../28 IPv4 prefixes plus some IPv6 ones
+is written to CSV and loaded; then lookups of uniformly random addresses (mostly cache misses) and of a hot
+set of a few hundred addresses (Zipf-distributed, mostly cache hits) are timed through the bare table and
+through the Enricher's LRU cache, and normalize_syslog is timed on the load generator's mix with and without
+the enrichment stage.
+Usage: python benchmarks/bench_enrich.py [--prefixes 50000] [--lookups 200000]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import random
+import argparse
+import tempfile
+from collector.enrich import CidrTable, Enricher
+from collector.parser import normalize_syslog
+from loadgen import LogGenerator
+
+def write_table(path, count, seed=5):
+    rnd = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('cidr,site,owner,vlan\n')
+        # /8s and /16s for the big picture, then many /20../28 inside them, like a real IPAM export
+        for a in (10, 172, 192, 203):
+            f.write(f'{a}.0.0.0/8,region-{a},netops,\n')
+        for i in range(count // 20):
+            f.write(f'{rnd.choice((10, 172, 192, 203))}.{rnd.randrange(256)}.0.0/16,site-{i % 300},team-{i % 40},\n')
+        for i in range(count - count // 20 - 4 - count // 100):
+            bits = rnd.choice((20, 22, 24, 24, 24, 26, 28))
+            addr = (rnd.choice((10, 172, 192, 203)) << 24) | rnd.getrandbits(24)
+            addr &= ~((1 << (32 - bits)) - 1) & 0xffffffff
+            f.write('%d.%d.%d.%d/%d,site-%d,team-%d,%d\n' % (addr >> 24, addr >> 16 & 255, addr >> 8 & 255, addr & 255, bits,
+                                                          i % 300, i % 40, i % 4000))
+        for i in range(count // 100):
+            f.write(f'2001:db8:{i:x}::/48,v6-site-{i % 50},netops,\n')
+
+def random_ips(count, seed=6):
+    rnd = random.Random(seed)
+    return ['%d.%d.%d.%d' % (rnd.choice((10, 172, 192, 203, 8)), rnd.randrange(256), rnd.randrange(256), rnd.randrange(256))
+            for _ in range(count)]
+
+def hot_ips(count, seed=7):
+    rnd = random.Random(seed)
+    pool = random_ips(500, seed)
+    return [pool[min(len(pool) - 1, int(rnd.paretovariate(1.1)) - 1)] for _ in range(count)]
+
+def per_lookup(fn, ips):
+    t0 = time.perf_counter()
+    for ip in ips:
+        fn(ip)
+    return (time.perf_counter() - t0) / len(ips) * 1e6
+
+def per_message(lines, enricher):
+    t0 = time.perf_counter()
+    for line in lines:
+        doc = normalize_syslog(line, '10.0.0.1', '2024-11-04T10:00:00Z')
+        if enricher is not None:
+            enricher.enrich(doc)
+    return (time.perf_counter() - t0) / len(lines) * 1e6
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--prefixes', type=int, default=50000)
+    ap.add_argument('--lookups', type=int, default=200000)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'assets.csv')
+        write_table(path, args.prefixes)
+        t0 = time.perf_counter()
+        table = CidrTable.load(path)
+        load_s = time.perf_counter() - t0
+    ranges = sum(len(starts) for starts, _, _ in table.families)
+    print(f'{len(table):,} prefixes -> {ranges:,} disjoint ranges, loaded in {load_s * 1000:.0f} ms')
+    for label, ips in (('uniform random', random_ips(args.lookups)), ('hot set (Zipf)', hot_ips(args.lookups))):
+        enricher = Enricher(table=table)
+        bare = min(per_lookup(table.lookup, ips) for _ in range(3))
+        cached = min(per_lookup(enricher.lookup, ips) for _ in range(3))
+        stats = enricher.stats()
+        print(f'{label:15s} table {bare:5.2f} us/lookup   with LRU cache {cached:5.2f} us/lookup '
+              f'({stats["cache_hits"] / stats["lookups"]:.0%} hits)')
+    lines = LogGenerator().lines(args.lookups)
+    off = min(per_message(lines, None) for _ in range(3))
+    on = min(per_message(lines, Enricher(table=table)) for _ in range(3))
+    print(f'normalize_syslog {off:.2f} us/msg, with enrichment {on:.2f} us/msg (+{on - off:.2f})')
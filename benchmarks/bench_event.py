@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: memory per normalized message and per-message pipeline throughput (normalize, SQLite row,
+JSON line for ES bulk / spool, analyzer dispatch) with dict docs vs LogEvent. The dict numbers come from a
+verbatim copy of the previous dict-building normalize_syslog.
+Usage: python benchmarks/bench_event.py [--count 100000]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import gc
+import json
+import time
+import logging
+import argparse
+import tracemalloc
+from collector import parser as p
+from collector.analyzer import Analyzer
+from collector.storage import _row
+from collector.event import dumps
+from bench_parser import make_lines
+
+def normalize_syslog_dict(raw, src_ip, received_ts):
+    if raw[:1] == '<':
+        m5 = p.RE_RFC5424.match(raw)
+        if m5:
+            raise NotImplementedError
+    m = p.RE_SYSLOG.match(raw)
+    doc = {'raw': raw, 'src_ip': src_ip, 'received_ts': received_ts, 'timestamp': None, 'host': None,
+           'program': None, 'pid': None, 'severity': None, 'message': None, 'parsed': {}}
+    if m:
+        ts = m.group('timestamp')
+        doc['host'] = m.group('host')
+        doc['message'] = m.group('rest')
+        if ts:
+            try:
+                doc['timestamp'] = p.parse_timestamp(ts)
+            except Exception:
+                doc['timestamp'] = received_ts
+        else:
+            doc['timestamp'] = received_ts
+    else:
+        doc['message'] = raw
+        doc['timestamp'] = received_ts
+    prog = p.RE_PROGRAM.match(doc['message'])
+    if prog:
+        doc['program'] = prog.group('prog')
+        doc['pid'] = prog.group('pid')
+        doc['message'] = prog.group('msg')
+    parsed = p.REGISTRY.classify(doc['program'], doc['message'])
+    if parsed:
+        doc['parsed'].update(parsed)
+    else:
+        doc['parsed']['event_type'] = 'unclassified'
+    return doc
+
+def memory(normalize, lines):
+    gc.collect()
+    tracemalloc.start()
+    docs = [normalize(line, '10.0.0.1', '2024-11-04T10:00:00Z') for line in lines]
+    # timestamps are part of what a doc holds once written
+    for doc in docs:
+        doc['timestamp']
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the raw lines were allocated before tracing started, so only per-doc allocations are counted
+    return size / len(docs)
+
+def pipeline(normalize, serialize, lines, repeat=3):
+    best = 0.0
+    for _ in range(repeat):
+        analyzer = Analyzer(None)
+        t0 = time.perf_counter()
+        for line in lines:
+            doc = normalize(line, '10.0.0.1', '2024-11-04T10:00:00Z')
+            _row(doc)
+            serialize(doc)
+            analyzer.process_all(doc)
+        best = max(best, len(lines) / (time.perf_counter() - t0))
+    return best
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.CRITICAL)
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--count', type=int, default=100000)
+    args = ap.parse_args()
+    lines = make_lines(args.count)
+    mem_dict = memory(normalize_syslog_dict, lines)
+    mem_event = memory(p.normalize_syslog, lines)
+    dict_rate = pipeline(normalize_syslog_dict, lambda d: json.dumps(d, separators=(',', ':')), lines)
+    event_rate = pipeline(p.normalize_syslog, dumps, lines)
+    print(f'messages: {len(lines):,}')
+    print(f'memory per doc:  dict {mem_dict:7.0f} B   LogEvent {mem_event:7.0f} B   ({mem_dict / mem_event:.1f}x less)')
+    print(f'pipeline:        dict {dict_rate:9,.0f} msgs/s   LogEvent {event_rate:9,.0f} msgs/s   ({event_rate / dict_rate:.2f}x)')
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: cost of registering many extractors for messages that cannot match them.
+Compares normalize_syslog with the built-in extractors, with 50 extra event types registered,
+and the old approach of running every pattern's .search() in sequence.
+Usage: python benchmarks/bench_extractors.py [--count 50000] [--extra 50]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import re
+import time
+import argparse
+from collector import parser as p
+from bench_parser import make_lines, bench
+
+def extra_patterns(n):
+    pats = []
+    for i in range(n):
+        prog = ['sshd', 'sudo', 'postfix/smtpd', 'named', 'dhcpd'][i % 5]
+        lit = f'event{i} detected'
+        pats.append((f'custom_{i}', prog, re.compile(re.escape(lit) + r' for (?P<user>\S+) from (?P<ip>[\d.]+)'), lit))
+    return pats
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--count', type=int, default=50000)
+    ap.add_argument('--extra', type=int, default=50)
+    args = ap.parse_args()
+    lines = make_lines(args.count)
+    pats = extra_patterns(args.extra)
+
+    builtin = bench(p.normalize_syslog, lines)
+
+    # old style: every pattern searched against every message
+    sequential = [p.SSH_FAILED, p.SSH_SUCCESS, p.CISCO_LOGIN] + [pat for _, _, pat, _ in pats]
+    def classify_sequential(program, message):
+        for pat in sequential:
+            if pat.search(message):
+                return {'event_type': 'x'}
+        return None
+    registry = p.REGISTRY
+    p.REGISTRY = type('Seq', (), {'classify': staticmethod(classify_sequential)})()
+    seq = bench(p.normalize_syslog, lines)
+    p.REGISTRY = registry
+
+    for et, prog, pat, lit in pats:
+        p.register_extractor(et, pat, [lit], programs=[prog])
+    with_extra = bench(p.normalize_syslog, lines)
+
+    print(f'messages:                       {len(lines)}')
+    print(f'registry, built-in extractors:  {builtin:12,.0f} msgs/sec')
+    print(f'registry, +{args.extra} extractors:        {with_extra:12,.0f} msgs/sec')
+    print(f'sequential .search(), +{args.extra}:       {seq:12,.0f} msgs/sec')
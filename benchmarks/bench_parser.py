@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: normalize_syslog throughput on sample_data-style input, before and after the
+timestamp/header fast path. The "before" numbers come from a verbatim copy of the old dateutil-based parser.
+Usage: python benchmarks/bench_parser.py [--count 50000]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import re
+import time
+import random
+import argparse
+from dateutil import parser as dateparser
+from collector.parser import normalize_syslog, RE_SYSLOG, SSH_FAILED, SSH_SUCCESS, CISCO_LOGIN
+
+def normalize_syslog_legacy(raw, src_ip, received_ts):
+    m = RE_SYSLOG.match(raw)
+    doc = {'raw': raw, 'src_ip': src_ip, 'received_ts': received_ts, 'timestamp': None, 'host': None,
+           'program': None, 'pid': None, 'severity': None, 'message': None, 'parsed': {}}
+    if m:
+        ts = m.group('timestamp')
+        doc['host'] = m.group('host')
+        doc['message'] = m.group('rest')
+        if ts:
+            try:
+                doc['timestamp'] = dateparser.parse(ts).isoformat()
+            except Exception:
+                doc['timestamp'] = received_ts
+        else:
+            doc['timestamp'] = received_ts
+    else:
+        doc['message'] = raw
+        doc['timestamp'] = received_ts
+    prog = re.match(r'(?P<prog>[\w/\-\.]+)(?:\[(?P<pid>\d+)\])?:\s*(?P<msg>.*)', doc['message'])
+    if prog:
+        doc['program'] = prog.group('prog')
+        doc['pid'] = prog.group('pid')
+        doc['message'] = prog.group('msg')
+    for et, pat in (('ssh_failed', SSH_FAILED), ('ssh_success', SSH_SUCCESS), ('cisco_login', CISCO_LOGIN)):
+        mm = pat.search(doc['message'])
+        if mm:
+            doc['parsed'].update(event_type=et, user=mm.group('user'), src_ip=mm.group('ip'))
+            return doc
+    doc['parsed']['event_type'] = 'unclassified'
+    return doc
+
+def make_lines(count, seed=1):
+    rnd = random.Random(seed)
+    templates = [
+        'sshd[{pid}]: Failed password for invalid user {user} from 10.0.{a}.{b} port {port} ssh2',
+        'sshd[{pid}]: Accepted password for {user} from 10.0.{a}.{b} port {port} ssh2',
+        'CRON[{pid}]: (root) CMD (run-parts /etc/cron.hourly)',
+        'kernel: [UFW BLOCK] IN=eth0 OUT= SRC=10.0.{a}.{b} DST=10.1.0.1 PROTO=TCP DPT={port}',
+        'systemd[1]: Started Session {pid} of user {user}.',
+    ]
+    lines = []
+    sec = 0
+    for i in range(count):
+        # several messages per second, like a busy host
+        if rnd.random() < 0.2:
+            sec += 1
+        ts = 'Nov %2d %02d:%02d:%02d' % (4 + sec // 86400, (sec // 3600) % 24, (sec // 60) % 60, sec % 60)
+        body = rnd.choice(templates).format(pid=rnd.randint(100, 65000), user=rnd.choice(['alice', 'bob', 'root', 'admin']),
+                                            a=rnd.randint(0, 255), b=rnd.randint(1, 254), port=rnd.randint(1024, 65535))
+        lines.append('%s lab-server-%d %s' % (ts, rnd.randint(1, 20), body))
+    return lines
+
+def bench(fn, lines, repeat=3):
+    # best of several runs, to keep scheduler noise out of the comparison
+    best = 0.0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for line in lines:
+            fn(line, '10.0.0.1', '2024-11-04T10:00:00Z')
+        best = max(best, len(lines) / (time.perf_counter() - t0))
+    return best
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--count', type=int, default=50000)
+    args = ap.parse_args()
+    lines = make_lines(args.count)
+    before = bench(normalize_syslog_legacy, lines)
+    after = bench(normalize_syslog, lines)
+    print(f'messages:         {len(lines)}')
+    print(f'before (dateutil): {before:12,.0f} msgs/sec')
+    print(f'after (fast path): {after:12,.0f} msgs/sec')
+    print(f'speedup:           {after / before:12.1f}x')
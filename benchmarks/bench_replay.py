@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Benchmark: `collector replay` throughput on a generated gzip archive, with one parser process vs a pool,
+detectors only and with SQLite bulk storage.
+Usage: python benchmarks/bench_replay.py [--lines 1000000] [--workers 4]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import gzip
+import logging
+import argparse
+import tempfile
+from collector.analyzer import Analyzer
+from collector.storage import Storage
+from collector.replay import Replay
+from bench_parser import make_lines
+
+def run(path, workers, db_path=None):
+    storage = Storage(es_host='http://invalid:9999', db_path=db_path) if db_path else None
+    return Replay(Analyzer(storage), storage, workers=workers).run([path])
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.CRITICAL)
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--lines', type=int, default=1000000)
+    ap.add_argument('--workers', type=int, default=os.cpu_count())
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'syslog.gz')
+        with gzip.open(path, 'wt') as f:
+            for i in range(0, args.lines, 100000):
+                f.write('\n'.join(make_lines(min(100000, args.lines - i), seed=i)) + '\n')
+        print(f'{args.lines:,} lines, {os.path.getsize(path) / 1e6:.1f} MB gzip')
+        for label, workers, db in (('detectors only, 1 worker', 1, None),
+                                   (f'detectors only, {args.workers} workers', args.workers, None),
+                                   ('SQLite storage, 1 worker', 1, 'one.db'),
+                                   (f'SQLite storage, {args.workers} workers', args.workers, 'pool.db')):
+            stats = run(path, workers, os.path.join(d, db) if db else None)
+            print(f'{label:32s} {stats["lines_per_sec"]:10,.0f} lines/s  ({stats["seconds"]:.1f}s)')
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: per-doc cost of Rollup.observe() and /api/stats query latency over 1h / 24h / 7d of
+rollups with a full top-K per minute (the query never touches raw logs, so raw volume does not matter).
+Usage: python benchmarks/bench_rollups.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta
+from collector.rollups import Rollup, RollupStore
+
+def make_docs(n, minute):
+    rng = random.Random(1)
+    ts = minute.isoformat() + 'Z'
+    return [{'timestamp': ts, 'host': 'host%d' % rng.randrange(500),
+             'parsed': {'event_type': rng.choice(['ssh_failed', 'ssh_success', 'unclassified']),
+                        'src_ip': '10.%d.%d.%d' % (rng.randrange(256), rng.randrange(256), rng.randrange(256))}}
+            for _ in range(n)]
+
+if __name__ == '__main__':
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    docs = make_docs(100000, now)
+    best = float('inf')
+    for _ in range(3):
+        r = Rollup()
+        t0 = time.perf_counter()
+        for doc in docs:
+            r.observe(doc)
+        best = min(best, time.perf_counter() - t0)
+    per_doc = best / len(docs)
+    print(f'observe(): {per_doc * 1e6:.2f} us/doc')
+    with tempfile.TemporaryDirectory() as d:
+        store = RollupStore(os.path.join(d, 'rollups.db'))
+        minute_rows = Rollup()
+        for doc in make_docs(5000, now):
+            minute_rows.observe(doc)
+        template, hour_template = minute_rows.drain(everything=True)
+        for m in range(7 * 24 * 60):
+            minute = (now - timedelta(minutes=m)).isoformat()[:16]
+            store.write([(minute,) + row[1:] for row in template])
+        for h in range(7 * 24):
+            hour = (now - timedelta(hours=h)).isoformat()[:13]
+            store.write([], [(hour,) + row[1:] for row in hour_template])
+        for label, minutes in (('1h', 60), ('24h', 1440), ('7d', 10080)):
+            for dim in ('event_type', 'src_ip'):
+                t0 = time.perf_counter()
+                store.query(dim, minutes=minutes)
+                print(f'/api/stats {dim:10s} {label:>3s}: {(time.perf_counter() - t0) * 1000:.1f} ms')
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: Analyzer throughput with the default rules and with 100 loaded rules.
+Events are a mix of rule-consumed types and unclassified noise, over a few thousand source IPs.
+Usage: python benchmarks/bench_rules.py [--count 200000] [--rules 100]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import random
+import logging
+import argparse
+from collector.analyzer import Analyzer
+from collector.rules import load_rules
+
+def make_rules(n, event_types):
+    specs = list(load_rules())
+    kinds = ['threshold', 'sequence', 'distinct']
+    for i in range(n - len(specs)):
+        et = event_types[i % len(event_types)]
+        kind = kinds[i % 3]
+        spec = {'name': f'rule_{i}', 'type': kind, 'window': 300, 'threshold': 50}
+        if kind == 'sequence':
+            spec.update(first=et, then=event_types[(i + 1) % len(event_types)])
+        else:
+            spec['event_type'] = et
+        if kind == 'distinct':
+            spec['field'] = 'user'
+        specs.append(spec)
+    return specs
+
+def make_events(count, event_types, seed=1):
+    rnd = random.Random(seed)
+    types = ['unclassified'] * 6 + ['ssh_failed', 'ssh_success'] + event_types
+    events = []
+    for i in range(count):
+        sec = i // 50
+        events.append({
+            'parsed': {'event_type': rnd.choice(types), 'src_ip': '10.%d.%d.%d' % (rnd.randint(0, 3), rnd.randint(0, 255), rnd.randint(1, 254)),
+                       'user': rnd.choice(['alice', 'bob', 'root', 'admin', 'oracle'])},
+            'timestamp': '2024-11-04T%02d:%02d:%02d' % (sec // 3600 % 24, sec // 60 % 60, sec % 60),
+        })
+    return events
+
+def bench(analyzer, events):
+    t0 = time.perf_counter()
+    for doc in events:
+        analyzer.process_all(doc)
+    return len(events) / (time.perf_counter() - t0)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR)
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--count', type=int, default=200000)
+    ap.add_argument('--rules', type=int, default=100)
+    args = ap.parse_args()
+    custom_types = [f'custom_{i}' for i in range(25)]
+    events = make_events(args.count, custom_types)
+    default = bench(Analyzer(None), events)
+    many = Analyzer(None, rules=make_rules(args.rules, custom_types))
+    loaded = bench(many, events)
+    per_type = max(len(rs) for rs in many.dispatch.values())
+    print(f'events:                   {len(events)}')
+    print(f'default rules ({len(Analyzer(None).rules)}):         {default:12,.0f} events/sec')
+    print(f'{len(many.rules)} rules:                {loaded:12,.0f} events/sec  (max {per_type} rules per event type)')
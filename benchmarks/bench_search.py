@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: full-text search over raw messages, FTS5 index vs a LIKE scan of the same partitions,
+plus the insert cost of maintaining the index.
+Usage: python benchmarks/bench_search.py [--days 7] [--per-day 200000]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import random
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+import collector.storage
+from collector.storage import Storage, COLUMNS
+
+WORDS = ['session', 'opened', 'closed', 'connection', 'from', 'port', 'user', 'kernel', 'eth0', 'link', 'up', 'down',
+         'cron', 'job', 'started', 'finished', 'disk', 'usage', 'warning', 'timeout', 'retry', 'dhcp', 'lease']
+
+def make_docs(days, per_day, seed=1):
+    rnd = random.Random(seed)
+    start = datetime.utcnow() - timedelta(days=days)
+    step = 86400 / per_day
+    for i in range(days * per_day):
+        ts = start + timedelta(seconds=i * step)
+        words = ' '.join(rnd.choice(WORDS) for _ in range(8))
+        if i % 10000 == 0:
+            raw = f'Failed password for invalid user oracle from 10.0.{i % 250}.9 port 22 ssh2'
+        else:
+            raw = f'{words} id={i}'
+        yield {'timestamp': ts.isoformat() + 'Z', 'received_ts': ts.isoformat() + 'Z', 'src_ip': '10.0.0.1', 'host': 'h', 'program': 'sshd', 'pid': '1',
+               'parsed': {'event_type': 'other'}, 'raw': raw}
+
+def load(path, docs, fts):
+    collector.storage.SQLITE_FTS = fts
+    s = Storage(es_host='http://invalid:9999', db_path=path)
+    t0 = time.perf_counter()
+    for i in range(0, len(docs), 10000):
+        s.index_many(docs[i:i + 10000])
+    return s, time.perf_counter() - t0
+
+def bench(fn, runs=5):
+    best = float('inf')
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def like_search(s, phrase, limit=50):
+    # what the dashboard would have to do without an index
+    results = []
+    for table in sorted(s._list_partitions(), reverse=True):
+        q = f'SELECT {COLUMNS} FROM {table} WHERE raw LIKE ? ORDER BY id DESC LIMIT {limit - len(results)}'
+        results.extend(s.conn.execute(q, (f'%{phrase}%',)).fetchall())
+        if len(results) >= limit:
+            break
+    return results
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR)
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--days', type=int, default=7)
+    ap.add_argument('--per-day', type=int, default=200000)
+    args = ap.parse_args()
+    docs = list(make_docs(args.days, args.per_day))
+    with tempfile.TemporaryDirectory() as d:
+        plain, plain_s = load(os.path.join(d, 'plain.db'), docs, False)
+        indexed, fts_s = load(os.path.join(d, 'fts.db'), docs, True)
+        print(f'rows: {len(docs):,} over {args.days} days')
+        print(f'insert: no index {len(docs) / plain_s:,.0f} docs/s   FTS5 {len(docs) / fts_s:,.0f} docs/s')
+        for label, q, phrase in (('rare phrase', '"invalid user oracle"', 'invalid user oracle'),
+                                 ('common word', 'timeout', 'timeout')):
+            like = bench(lambda: like_search(plain, phrase))
+            fts = bench(lambda: indexed.search_text(q, limit=50))
+            print(f'{label:12s} first page: LIKE scan {like * 1000:8.2f} ms   FTS5 {fts * 1000:6.2f} ms')
+        rows, cursor = indexed.search_text('"invalid user oracle"', limit=20)
+        deep = bench(lambda: indexed.search_text('"invalid user oracle"', limit=20, cursor=cursor))
+        print(f'second page via cursor: {deep * 1000:.2f} ms')
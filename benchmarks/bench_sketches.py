@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark: accuracy, memory and cost of the fixed-memory sketch rules (collector/sketches.py) against exact
+per-key state, as the number of source IPs in the window grows.
+Traffic is background failed logins (each IP tries one to three usernames from a common pool) plus a few
+password sprayers (one IP, many usernames) and distributed brute forces (one username, many IPs), all inside one
+window. For DistinctWindow, both directions (distinct users per IP, distinct IPs per user) are scored against
+exact sets: relative error on the attackers, the largest estimate any background key got, and false
+positives/negatives at the alert threshold. For CountMinWindow, the overestimate on per-IP failure counts is
+compared with the e / width * events bound. Memory is tracemalloc's count for the exact structures and the
+sketch's fixed size.
+Usage: python benchmarks/bench_sketches.py [--ips 10000,100000,500000] [--threshold 50] [--registers 1048576] [--virtual 128]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import math
+import time
+import random
+import argparse
+import tracemalloc
+from collections import Counter
+from collector.sketches import CountMinWindow, DistinctWindow, SKETCH_REGISTERS, SKETCH_VIRTUAL, SKETCH_WIDTH, SKETCH_DEPTH
+
+ATTACKS = (30, 50, 100, 300, 1000)
+
+def traffic(ips, seed=7):
+    """[(ip, user)] in random order: background, plus one sprayer and one distributed attack per ATTACKS size."""
+    rnd = random.Random(seed)
+    events = []
+    for i in range(ips):
+        ip = '10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255)
+        for _ in range(rnd.randint(1, 3)):
+            events.append((ip, 'user%d' % int(rnd.paretovariate(1.2))))
+    for n in ATTACKS:
+        events.extend(('203.0.113.%d' % (n % 256), 'spray%d-%d' % (n, j)) for j in range(n))
+        events.extend(('198.%d.%d.%d' % (n % 256, j >> 8 & 255, j & 255), 'target%d' % n) for j in range(n))
+    rnd.shuffle(events)
+    return events
+
+def exact(events, key_index):
+    tracemalloc.start()
+    sets = {}
+    for event in events:
+        sets.setdefault(event[key_index], set()).add(event[1 - key_index])
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {k: len(v) for k, v in sets.items()}, size
+
+def score_distinct(events, key_index, threshold, registers, virtual):
+    truth, exact_bytes = exact(events, key_index)
+    sketch = DistinctWindow(600, registers=registers, virtual=virtual)
+    estimates = {}
+    t0 = time.perf_counter()
+    for event in events:
+        key = event[key_index]
+        estimates[key] = sketch.add(key, event[1 - key_index], 100)
+    us = (time.perf_counter() - t0) / len(events) * 1e6
+    attackers = [k for k, n in truth.items() if n >= threshold]
+    errors = sorted(abs(estimates[k] / truth[k] - 1) for k in attackers)
+    background = [k for k, n in truth.items() if n < threshold]
+    return {
+        'keys': len(truth),
+        'pairs': sum(truth.values()),
+        'median_error': errors[len(errors) // 2],
+        'max_error': errors[-1],
+        'background_max': max(estimates[k] for k in background),
+        'false_positives': sum(estimates[k] >= threshold for k in background),
+        'false_negatives': sum(estimates[k] < threshold for k in attackers),
+        'exact_bytes': exact_bytes,
+        'sketch_bytes': sketch.approx_bytes(),
+        'us': us,
+    }
+
+def score_counts(events, width, depth):
+    tracemalloc.start()
+    truth = Counter(ip for ip, _ in events)
+    exact_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    sketch = CountMinWindow(600, width=width, depth=depth)
+    t0 = time.perf_counter()
+    for ip, _ in events:
+        sketch.add(ip, 100)
+    us = (time.perf_counter() - t0) / len(events) * 1e6
+    over = [sketch.count(ip) - n for ip, n in truth.items()]
+    bound = math.e / width * len(events)
+    return {
+        'keys': len(truth),
+        'mean_over': sum(over) / len(over),
+        'max_over': max(over),
+        'bound': bound,
+        'beyond_bound': sum(o > bound for o in over) / len(over),
+        'exact_bytes': exact_bytes,
+        'sketch_bytes': sketch.approx_bytes(),
+        'us': us,
+    }
+
+def mib(n):
+    return n / 1048576
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--ips', default='10000,100000,500000', help='comma-separated background IP counts')
+    ap.add_argument('--threshold', type=int, default=50)
+    ap.add_argument('--registers', type=int, default=SKETCH_REGISTERS)
+    ap.add_argument('--virtual', type=int, default=SKETCH_VIRTUAL)
+    ap.add_argument('--width', type=int, default=SKETCH_WIDTH)
+    ap.add_argument('--depth', type=int, default=SKETCH_DEPTH)
+    args = ap.parse_args()
+    print(f'sketch_distinct: {args.registers:,} registers, {args.virtual} per key '
+          f'(1.04 / sqrt({args.virtual}) = {1.04 / math.sqrt(args.virtual):.1%}), threshold {args.threshold}, '
+          f'attacks of {", ".join(map(str, ATTACKS))}')
+    print(f'{"ips":>8s} {"direction":14s} {"keys":>8s} {"pairs":>9s} {"err p50":>8s} {"err max":>8s} {"bg max":>7s} '
+          f'{"FP":>4s} {"FN":>4s} {"exact MiB":>10s} {"sketch MiB":>10s} {"us/event":>8s}')
+    for ips in (int(n) for n in args.ips.split(',')):
+        events = traffic(ips)
+        for direction, key_index in (('users per ip', 0), ('ips per user', 1)):
+            r = score_distinct(events, key_index, args.threshold, args.registers, args.virtual)
+            print(f'{ips:8,d} {direction:14s} {r["keys"]:8,d} {r["pairs"]:9,d} {r["median_error"]:8.1%} {r["max_error"]:8.1%} '
+                  f'{r["background_max"]:7d} {r["false_positives"]:4d} {r["false_negatives"]:4d} '
+                  f'{mib(r["exact_bytes"]):10.1f} {mib(r["sketch_bytes"]):10.1f} {r["us"]:8.2f}')
+    print()
+    print(f'sketch_threshold: count-min {args.depth} x {args.width}, failures per ip')
+    print(f'{"ips":>8s} {"events":>9s} {"mean over":>9s} {"max over":>9s} {"e/w*N":>7s} {"> bound":>8s} '
+          f'{"exact MiB":>10s} {"sketch MiB":>10s} {"us/event":>8s}')
+    for ips in (int(n) for n in args.ips.split(',')):
+        events = traffic(ips)
+        r = score_counts(events, args.width, args.depth)
+        print(f'{ips:8,d} {len(events):9,d} {r["mean_over"]:9.2f} {r["max_over"]:9d} {r["bound"]:7.1f} {r["beyond_bound"]:8.2%} '
+              f'{mib(r["exact_bytes"]):10.1f} {mib(r["sketch_bytes"]):10.1f} {r["us"]:8.2f}')
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: a simulated 3 second storage outage (each write hangs 1s, then fails) at a steady ingest
+rate, with and without the disk spool. Reports submit() latency and how many docs reached storage.
+Usage: python benchmarks/bench_spool.py [--rate 20000]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import logging
+import argparse
+import tempfile
+from collector.spool import Spool
+from collector.writer import BatchWriter
+
+class OutageStorage:
+    def __init__(self, down_from, down_until):
+        self.down_from = down_from
+        self.down_until = down_until
+        self.written = 0
+
+    def _down(self):
+        return self.down_from <= time.monotonic() < self.down_until
+
+    def ping(self):
+        return not self._down()
+
+    def index_many(self, docs):
+        if self._down():
+            time.sleep(1)
+            raise ConnectionError('backend down')
+        self.written += len(docs)
+        return len(docs)
+
+def run(rate, seconds, spool_dir):
+    start = time.monotonic()
+    storage = OutageStorage(start + 1, start + 4)
+    spool = Spool(spool_dir, fsync=True) if spool_dir else None
+    w = BatchWriter(storage, max_queue=10000, spool=spool)
+    if w.replayer is not None:
+        w.replayer.probe_interval = 0.5
+    w.start()
+    lat = []
+    total = int(rate * seconds)
+    for i in range(total):
+        t0 = time.perf_counter()
+        w.submit({'raw': 'line %d' % i, 'src_ip': '10.0.0.1'})
+        lat.append(time.perf_counter() - t0)
+        # pace to the target rate
+        delay = start + (i + 1) / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    deadline = time.monotonic() + 30
+    while storage.written + w.dropped < total and time.monotonic() < deadline:
+        if spool is None and w.queue.empty() and not w.errors:
+            break
+        time.sleep(0.05)
+    w.stop()
+    lat.sort()
+    return total, storage.written, lat[len(lat) // 2], lat[int(len(lat) * 0.999)]
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.CRITICAL)
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rate', type=int, default=20000)
+    ap.add_argument('--seconds', type=float, default=6)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        for label, spool_dir in (('no spool', None), ('spool', d)):
+            total, written, p50, p999 = run(args.rate, args.seconds, spool_dir)
+            print(f'{label:9s} sent {total:,}  stored {written:,}  lost {total - written:,}  '
+                  f'submit p50 {p50 * 1e6:.1f} us  p99.9 {p999 * 1e6:.1f} us')
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Per-stage microbenchmarks on the load generator's traffic mix: parser, dedupe, analyzer and storage
+(SQLite bulk insert in writer-sized batches), each timed on its own so a regression points at its stage.
+Save a baseline on a known-good build and compare against it before deploying; --compare exits non-zero
+if any stage got slower than the tolerance.
+Usage: python benchmarks/bench_stages.py [--count 100000] [--save baseline.json] [--compare baseline.json] [--tolerance 0.15]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import json
+import time
+import logging
+import argparse
+import tempfile
+from collector.parser import normalize_syslog
+from collector.dedupe import DedupeCache
+from collector.analyzer import Analyzer
+from collector.storage import Storage
+from collector.writer import WRITE_BATCH_SIZE
+from loadgen import LogGenerator
+
+RECEIVED_TS = '2024-11-04T10:00:00Z'
+
+def _docs(lines):
+    docs = [normalize_syslog(line, '10.0.0.1', RECEIVED_TS) for line in lines]
+    for doc in docs:
+        doc.timestamp
+    return docs
+
+def bench_parser(lines):
+    # includes the lazy timestamp conversion, which every doc pays once storage reads it
+    t0 = time.perf_counter()
+    for line in lines:
+        normalize_syslog(line, '10.0.0.1', RECEIVED_TS).timestamp
+    return time.perf_counter() - t0
+
+def bench_dedupe(lines):
+    cache = DedupeCache(ttl=60, max_entries=10000)
+    t0 = time.perf_counter()
+    for line in lines:
+        cache.seen(line, '10.0.0.1')
+    return time.perf_counter() - t0
+
+def bench_analyzer(docs):
+    analyzer = Analyzer(None)
+    t0 = time.perf_counter()
+    for doc in docs:
+        analyzer.process_all(doc)
+    return time.perf_counter() - t0
+
+def bench_storage(docs):
+    with tempfile.TemporaryDirectory() as d:
+        storage = Storage(es_host='http://invalid:9999', db_path=os.path.join(d, 'bench.db'))
+        t0 = time.perf_counter()
+        for i in range(0, len(docs), WRITE_BATCH_SIZE):
+            storage.index_many(docs[i:i + WRITE_BATCH_SIZE])
+        return time.perf_counter() - t0
+
+def run(count, repeat=3):
+    """{stage: msgs/sec}, best of `repeat` runs each."""
+    lines = LogGenerator().lines(count)
+    stages = {
+        'parser': (bench_parser, lambda: lines),
+        'dedupe': (bench_dedupe, lambda: lines),
+        'analyzer': (bench_analyzer, lambda: _docs(lines)),
+        'storage': (bench_storage, lambda: _docs(lines)),
+    }
+    results = {}
+    for name, (fn, make_input) in stages.items():
+        best = 0.0
+        for _ in range(repeat):
+            data = make_input()
+            best = max(best, count / fn(data))
+        results[name] = best
+    return results
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--count', type=int, default=100000)
+    ap.add_argument('--save', help='write the results to this JSON file as a baseline')
+    ap.add_argument('--compare', help='baseline JSON file to compare against')
+    ap.add_argument('--tolerance', type=float, default=0.15, help='allowed slowdown per stage, as a fraction')
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    results = run(args.count)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    regressed = []
+    for name, rate in results.items():
+        line = f'{name:9s} {rate:12,.0f} msgs/sec {1e6 / rate:8.2f} us/msg'
+        if baseline and name in baseline:
+            change = rate / baseline[name] - 1
+            line += f'   {change:+7.1%} vs baseline'
+            if change < -args.tolerance:
+                regressed.append(name)
+                line += '  REGRESSION'
+        print(line)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if regressed:
+        print(f'Slower than baseline by more than {args.tolerance:.0%}: {", ".join(regressed)}')
+        sys.exit(1)
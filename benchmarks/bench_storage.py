@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: dashboard query latency on a SQLite store holding months of logs, single `logs` table
+(the old layout) vs daily partitions with (ts) / (src_ip, ts) indexes.
+Usage: python benchmarks/bench_storage.py [--days 90] [--per-day 5000]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import logging
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from collector.storage import Storage, COLUMNS
+
+def make_docs(days, per_day):
+    now = datetime.utcnow()
+    step = 86400 / per_day
+    for d in range(days, -1, -1):
+        for i in range(per_day):
+            ts = now - timedelta(days=d, seconds=i * step)
+            yield {'timestamp': ts.isoformat() + 'Z', 'received_ts': ts.isoformat() + 'Z', 'src_ip': '10.0.%d.%d' % (i % 50, i % 200), 'host': 'h',
+                   'program': 'sshd', 'pid': '1', 'parsed': {'event_type': 'ssh_failed'}, 'raw': 'line %d' % i}
+
+def legacy_store(path, docs):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE old_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT, src_ip TEXT, host TEXT, program TEXT, pid TEXT, event_type TEXT, raw TEXT)')
+    conn.execute('CREATE INDEX idx_event ON old_logs(event_type)')
+    rows = [(d['timestamp'], d['src_ip'], d['host'], d['program'], d['pid'], d['parsed']['event_type'], d['raw']) for d in docs]
+    with conn:
+        conn.executemany(f'INSERT INTO old_logs ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    return conn
+
+def bench(fn, runs=20):
+    best = float('inf')
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR)
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--days', type=int, default=90)
+    ap.add_argument('--per-day', type=int, default=5000)
+    args = ap.parse_args()
+    docs = list(make_docs(args.days, args.per_day))
+    with tempfile.TemporaryDirectory() as d:
+        old = legacy_store(os.path.join(d, 'old.db'), docs)
+        new = Storage(es_host='http://invalid:9999', db_path=os.path.join(d, 'new.db'))
+        for i in range(0, len(docs), 10000):
+            new.index_many(docs[i:i + 10000])
+        ip = '10.0.7.7'
+        # the old query ignored the time range entirely
+        old_q = f'SELECT {COLUMNS} FROM old_logs WHERE src_ip = ? ORDER BY id DESC LIMIT 200'
+        old_s = bench(lambda: old.execute(old_q, (ip,)).fetchall())
+        new_s = bench(lambda: new.search_recent(minutes=60 * 24, src_ip=ip))
+        old_all = bench(lambda: old.execute(f'SELECT {COLUMNS} FROM old_logs ORDER BY id DESC LIMIT 200').fetchall())
+        new_all = bench(lambda: new.search_recent(minutes=60))
+    print(f'rows: {len(docs):,} over {args.days} days')
+    print(f'by src_ip:  single table {old_s * 1000:.2f} ms   partitioned (last 24h) {new_s * 1000:.2f} ms')
+    print(f'latest 200: single table {old_all * 1000:.2f} ms   partitioned (last 1h) {new_all * 1000:.2f} ms')
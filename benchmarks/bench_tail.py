@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: cost of the live tail to the ingest pipeline (TailBuffer.append per doc) and fan-out of
+a doc stream to many SSE clients over localhost, some filtered, plus one client that never reads.
+The clients run in the same process, so the delivery rate includes their parsing.
+Usage: python benchmarks/bench_tail.py [--clients 50] [--docs 100000]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import asyncio
+import logging
+import argparse
+from collector.tail import TailBuffer, TailServer
+
+def make_docs(n):
+    return [{'timestamp': '2024-11-04T10:01:01.%06dZ' % (i % 1000000), 'src_ip': '10.0.%d.%d' % (i % 4, i % 250), 'host': 'h%d' % (i % 10),
+             'program': 'sshd', 'parsed': {'event_type': 'ssh_failed', 'src_ip': '10.0.%d.%d' % (i % 4, i % 250)},
+             'raw': 'Failed password for invalid user admin from 10.0.%d.%d port 22 ssh2' % (i % 4, i % 250)} for i in range(n)]
+
+async def client(port, path, expected, counts, key):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: x\r\n\r\n'.encode())
+    await reader.readuntil(b'\r\n\r\n')
+    got = 0
+    while got < expected:
+        block = await reader.readuntil(b'\n\n')
+        if block.startswith(b'id: '):
+            got += 1
+        elif block.startswith(b'event: skipped'):
+            got += int(block.split(b'data: ')[1])
+    counts[key] = got
+    writer.close()
+
+async def fan_out(docs, n_clients):
+    ring = TailBuffer(capacity=len(docs))
+    tail = await TailServer(ring, slow_timeout=1).start('127.0.0.1', 0)
+    port = tail.server.sockets[0].getsockname()[1]
+    counts = {}
+    tasks = []
+    for i in range(n_clients):
+        # every fourth client filters on one source IP
+        if i % 4 == 3:
+            tasks.append(asyncio.create_task(client(port, '/tail?ip=10.0.1.1', len(docs) // 1000, counts, i)))
+        else:
+            tasks.append(asyncio.create_task(client(port, '/tail', len(docs), counts, i)))
+    # a client that connects and never reads
+    stalled_reader, stalled_writer = await asyncio.open_connection('127.0.0.1', port)
+    stalled_writer.write(b'GET /tail HTTP/1.1\r\nHost: x\r\n\r\n')
+    await asyncio.sleep(0.2)
+    t0 = time.perf_counter()
+    for i in range(0, len(docs), 1000):
+        for doc in docs[i:i + 1000]:
+            ring.append(doc)
+        await asyncio.sleep(0)
+    await asyncio.wait_for(asyncio.gather(*tasks), 120)
+    elapsed = time.perf_counter() - t0
+    tail.close()
+    stalled_writer.close()
+    return elapsed, tail.stats()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR)
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--clients', type=int, default=50)
+    ap.add_argument('--docs', type=int, default=100000)
+    args = ap.parse_args()
+    docs = make_docs(args.docs)
+    ring = TailBuffer()
+    t0 = time.perf_counter()
+    for doc in docs:
+        ring.append(doc)
+    per_doc = (time.perf_counter() - t0) / len(docs)
+    print(f'append (no clients): {per_doc * 1e9:.0f} ns/doc')
+    elapsed, stats = asyncio.run(fan_out(docs, args.clients))
+    delivered = stats['sent'] + stats['skipped']
+    print(f'{args.docs:,} docs to {args.clients} clients in {elapsed:.2f}s: {delivered / elapsed:,.0f} events/s delivered '
+          f'({stats["skipped"]:,} skipped), {stats["dropped"]} stalled client(s) dropped')
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark: TCP receive throughput of one connection, framing and handoff only. A sender process pushes a
+pre-framed payload of load generator lines over loopback as fast as the socket takes it; the collector side
+is collector.main.tcp_client_handler feeding an IngestQueue drained by a consumer that does nothing else, so
+the number is the ceiling the receive path puts on the pipeline behind it. Compared with the previous
+per-line handler (readline, decode, put), for newline framing and octet counting. The Framer alone is also
+timed on the same payload.
+Usage: python benchmarks/bench_tcp.py [--messages 500000] [--read-bytes 262144]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import socket
+import asyncio
+import argparse
+import multiprocessing
+from collector import main as collector
+from collector.framing import Framer
+from collector.ingest import IngestQueue
+from loadgen import LogGenerator
+
+def payload(lines, octet_counting):
+    # as a relay sends them: with a PRI, which is also how octet counting is recognized
+    encoded = [b'<13>' + line.encode() for line in lines]
+    if octet_counting:
+        return b''.join(b'%d %s' % (len(m), m) for m in encoded)
+    return b'\n'.join(encoded) + b'\n'
+
+def sender(port, data):
+    with socket.create_connection(('127.0.0.1', port)) as s:
+        s.sendall(data)
+
+async def readline_handler(reader, conn, ingest):
+    # the handler before framing.py, one await per line
+    peer = conn.get_extra_info('peername')
+    src_ip = peer[0] if peer else 'unknown'
+    while True:
+        data = await reader.readline()
+        if not data:
+            break
+        await ingest.put((data.decode(errors='ignore').strip(), src_ip))
+    conn.close()
+
+async def receive(handler, data, expected):
+    ingest = IngestQueue(collector.INGEST_QUEUE_MAX)
+    done = asyncio.Event()
+    received = 0
+
+    async def drain():
+        nonlocal received
+        while True:
+            await ingest.get()
+            received += 1
+            if received == expected:
+                done.set()
+
+    consumer = asyncio.create_task(drain())
+    server = await asyncio.start_server(lambda r, w: handler(r, w, ingest), '127.0.0.1', 0, limit=1 << 20)
+    port = server.sockets[0].getsockname()[1]
+    proc = multiprocessing.Process(target=sender, args=(port, data))
+    t0 = time.perf_counter()
+    proc.start()
+    await asyncio.wait_for(done.wait(), 300)
+    elapsed = time.perf_counter() - t0
+    proc.join()
+    consumer.cancel()
+    server.close()
+    return elapsed
+
+def frame_only(data, read_bytes):
+    framer = Framer()
+    t0 = time.perf_counter()
+    count = 0
+    for i in range(0, len(data), read_bytes):
+        count += len(framer.feed(data[i:i + read_bytes]))
+    return count, time.perf_counter() - t0
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--messages', type=int, default=500000)
+    ap.add_argument('--read-bytes', type=int, default=collector.TCP_READ_BYTES)
+    args = ap.parse_args()
+    collector.TCP_READ_BYTES = args.read_bytes
+    lines = LogGenerator().lines(args.messages)
+    print(f'{args.messages:,} messages, avg {sum(map(len, lines)) / len(lines):.0f} bytes, reads of {args.read_bytes:,} bytes')
+    print(f'{"framing":15s} {"handler":10s} {"msgs/sec":>10s} {"MB/sec":>7s}')
+    for label, octets in (('newline', False), ('octet counting', True)):
+        data = payload(lines, octets)
+        count, seconds = frame_only(data, args.read_bytes)
+        assert count == len(lines)
+        print(f'{label:15s} {"Framer":10s} {count / seconds:10,.0f} {len(data) / seconds / 1e6:7.1f}')
+        handlers = [('framed', collector.tcp_client_handler)]
+        if not octets:
+            handlers.append(('readline', readline_handler))
+        for name, handler in handlers:
+            seconds = asyncio.run(receive(handler, data, len(lines)))
+            print(f'{label:15s} {name:10s} {len(lines) / seconds:10,.0f} {len(data) / seconds / 1e6:7.1f}')
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-message cost of template mining on the ingest path. normalize_syslog msgs/sec with mining
+off vs on, for the load generator's mix (mostly unclassified noise from a few templates) and for a
+high-variety stream (2,000 synthetic templates with variable words and numbers), plus save/load time
+of the learned templates.
+Usage: python benchmarks/bench_templates.py [--count 200000] [--templates 2000]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import random
+import argparse
+import tempfile
+from collector import templates
+from collector.parser import normalize_syslog
+from collector.templates import TemplateMiner
+from loadgen import LogGenerator
+
+WORDS = ('connection', 'reset', 'by', 'peer', 'client', 'request', 'timeout', 'cache', 'miss', 'worker', 'queue',
+         'job', 'started', 'finished', 'failed', 'retrying', 'disk', 'usage', 'high', 'low', 'backup', 'volume')
+
+def variety_lines(count, n_templates, seed=3):
+    rnd = random.Random(seed)
+    shapes = []
+    for i in range(n_templates):
+        words = [rnd.choice(WORDS) for _ in range(rnd.randint(4, 12))]
+        # a few variable slots: numbers, hex ids, or one of several words
+        for slot in rnd.sample(range(len(words)), min(len(words) - 2, rnd.randint(1, 3))):
+            words[slot] = rnd.choice(['{n}', '{hex}', '{word}'])
+        shapes.append(('app%d' % (i % 50), ' '.join(words)))
+    lines = []
+    for _ in range(count):
+        program, shape = rnd.choice(shapes)
+        msg = shape.format(n=rnd.randint(0, 99999), hex='%x' % rnd.getrandbits(32), word=rnd.choice(['alpha', 'beta', 'gamma']))
+        lines.append('Nov  4 10:01:01 host-%d %s[%d]: %s' % (rnd.randint(1, 20), program, rnd.randint(100, 60000), msg))
+    return lines
+
+def rate(lines, miner):
+    templates.MINER = miner
+    t0 = time.perf_counter()
+    for line in lines:
+        normalize_syslog(line, '10.0.0.1', '2024-11-04T10:00:00Z')
+    return len(lines) / (time.perf_counter() - t0)
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--count', type=int, default=200000)
+    ap.add_argument('--templates', type=int, default=2000)
+    args = ap.parse_args()
+    for label, lines in (('loadgen mix', LogGenerator().lines(args.count)),
+                         (f'{args.templates} templates', variety_lines(args.count, args.templates))):
+        off = max(rate(lines, None) for _ in range(3))
+        miner = TemplateMiner()
+        cold = rate(lines, miner)
+        warm = rate(lines, miner)
+        stats = miner.stats()
+        print(f'{label}: {args.count:,} messages, {stats["templates"]:,} templates learned, '
+              f'{stats["memo_hits"] / max(1, stats["matched"]):.0%} byte-memo hits, '
+              f'{stats["shape_hits"] / max(1, stats["matched"]):.0%} shape-memo hits')
+        print(f'  mining off:   {off:10,.0f} msgs/sec')
+        print(f'  cold miner:   {cold:10,.0f} msgs/sec  (+{1e6 / cold - 1e6 / off:.2f} us/msg)')
+        print(f'  warm miner:   {warm:10,.0f} msgs/sec  (+{1e6 / warm - 1e6 / off:.2f} us/msg)')
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'templates.json')
+            t0 = time.perf_counter()
+            miner.save(path)
+            t1 = time.perf_counter()
+            TemplateMiner().load(path)
+            t2 = time.perf_counter()
+            print(f'  save {(t1 - t0) * 1000:.1f} ms, load {(t2 - t1) * 1000:.1f} ms ({os.path.getsize(path) / 1024:.0f} KiB)')
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Synthetic syslog load generator: a configurable mix of sshd failures and successes, Cisco logins and noise,
+plus periodic brute-force bursts (a run of failures from one attacker, then a success), sent to a collector
+over UDP or TCP at a target rate.
+Usage: python benchmarks/loadgen.py [--host localhost] [--port 5514] [--protocol udp] [--rate 5000] [--duration 10]
+                                    [--mix ssh_failed=10,ssh_success=5,cisco_login=2,noise=83] [--burst-every 2000]
+Every line carries a sequence number (as the pid, or the Cisco sequence field), so no two lines are equal:
+the collector's dedupe never mistakes generated traffic for retransmits, and a harness can match what was
+stored back to what was sent. Timestamps are the current UTC time, so the detectors' windows behave as live.
+"""
+import time
+import random
+import socket
+import argparse
+
+DEFAULT_MIX = {'ssh_failed': 10, 'ssh_success': 5, 'cisco_login': 2, 'noise': 83}
+USERS = ('alice', 'bob', 'root', 'admin', 'oracle', 'test')
+
+TEMPLATES = {
+    'ssh_failed': ('{host} sshd[{seq}]: Failed password for invalid user {user} from {ip} port {port} ssh2',),
+    'ssh_success': ('{host} sshd[{seq}]: Accepted publickey for {user} from {ip} port {port} ssh2',),
+    'cisco_login': ('core-sw{n} {seq}: %SEC-6-IPACCESSLOGP: line vty{n}: Login Authentication for user {user}, src {ip}',),
+    'noise': (
+        '{host} CRON[{seq}]: (root) CMD (run-parts /etc/cron.hourly)',
+        '{host} systemd[{seq}]: Started Session {port} of user {user}.',
+        '{host} kernel: [{seq}.000000] UFW BLOCK IN=eth0 OUT= SRC={ip} DST=10.1.0.1 PROTO=TCP DPT={port}',
+        '{host} postfix/smtpd[{seq}]: connect from unknown[{ip}]',
+    ),
+}
+
+def parse_mix(text):
+    """'ssh_failed=10,noise=90' -> {'ssh_failed': 10.0, 'noise': 90.0}"""
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        if kind.strip() not in TEMPLATES:
+            raise ValueError(f'Unknown message kind {kind!r}, expected one of {sorted(TEMPLATES)}')
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+class LogGenerator:
+    """Endless stream of unique syslog lines. Every burst_every lines a brute-force burst is inserted:
+    burst_size failures from a fresh attacker address followed by one success from it (0 disables bursts)."""
+    def __init__(self, mix=DEFAULT_MIX, burst_every=2000, burst_size=8, hosts=20, seed=1, clock=time.time):
+        self.kinds = list(mix)
+        self.weights = [mix[k] for k in self.kinds]
+        self.burst_every = burst_every
+        self.burst_size = burst_size
+        self.hosts = ['lab-server-%d' % i for i in range(1, hosts + 1)]
+        self.rnd = random.Random(seed)
+        self.clock = clock
+        self.seq = 0
+        self.bursts = 0
+        self.pending = []
+        self._second = None
+        self._prefix = None
+
+    def _timestamp(self):
+        # RFC3164 header, rebuilt once per second
+        now = int(self.clock())
+        if now != self._second:
+            t = time.gmtime(now)
+            self._second = now
+            self._prefix = '%s %2d %s ' % (time.strftime('%b', t), t.tm_mday, time.strftime('%H:%M:%S', t))
+        return self._prefix
+
+    def _line(self, kind, ip=None):
+        rnd = self.rnd
+        self.seq += 1
+        body = rnd.choice(TEMPLATES[kind]).format(
+            seq=self.seq, host=rnd.choice(self.hosts), user=rnd.choice(USERS), n=rnd.randint(0, 4),
+            ip=ip or '10.%d.%d.%d' % (rnd.randint(0, 3), rnd.randint(0, 255), rnd.randint(1, 254)),
+            port=rnd.randint(1024, 65535))
+        return self._timestamp() + body
+
+    def _burst(self):
+        self.bursts += 1
+        ip = '203.0.%d.%d' % (self.bursts // 254 % 256, self.bursts % 254 + 1)
+        lines = [self._line('ssh_failed', ip) for _ in range(self.burst_size)]
+        lines.append(self._line('ssh_success', ip))
+        return lines
+
+    def next_line(self):
+        if self.pending:
+            return self.pending.pop()
+        if self.burst_every and self.seq and self.seq % self.burst_every == 0:
+            self.pending = self._burst()[::-1]
+            return self.pending.pop()
+        return self._line(self.rnd.choices(self.kinds, self.weights)[0])
+
+    def lines(self, count):
+        return [self.next_line() for _ in range(count)]
+
+def send(generator, host, port, protocol='udp', rate=5000, duration=10.0, tick=0.001):
+    """Send generated lines at `rate` per second for `duration` seconds. Returns what was actually sent;
+    over TCP a collector applying backpressure shows up as an achieved rate below the target."""
+    if protocol == 'udp':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect((host, port))
+    else:
+        sock = socket.create_connection((host, port))
+    sent = 0
+    start = time.monotonic()
+    try:
+        while True:
+            elapsed = time.monotonic() - start
+            if elapsed >= duration:
+                break
+            due = int(rate * elapsed) - sent
+            if due <= 0:
+                time.sleep(tick)
+                continue
+            lines = [generator.next_line() for _ in range(min(due, 1000))]
+            if protocol == 'udp':
+                for line in lines:
+                    try:
+                        sock.send(line.encode())
+                    except (BlockingIOError, ConnectionRefusedError):
+                        # a full socket buffer or a closed port loses the datagram, as it would on the wire
+                        pass
+            else:
+                sock.sendall(('\n'.join(lines) + '\n').encode())
+            sent += len(lines)
+    finally:
+        sock.close()
+    seconds = time.monotonic() - start
+    return {'sent': sent, 'seconds': round(seconds, 3), 'rate': sent / seconds, 'bursts': generator.bursts}
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='Send synthetic syslog traffic to a collector at a target rate')
+    ap.add_argument('--host', default='localhost')
+    ap.add_argument('--port', type=int, default=5514)
+    ap.add_argument('--protocol', choices=['udp', 'tcp'], default='udp')
+    ap.add_argument('--rate', type=float, default=5000, help='messages per second')
+    ap.add_argument('--duration', type=float, default=10, help='seconds')
+    ap.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help='relative weights, e.g. ssh_failed=10,noise=90')
+    ap.add_argument('--burst-every', type=int, default=2000, help='lines between brute-force bursts (0 disables)')
+    ap.add_argument('--burst-size', type=int, default=8, help='failed logins per burst')
+    ap.add_argument('--seed', type=int, default=1)
+    args = ap.parse_args()
+    gen = LogGenerator(args.mix, args.burst_every, args.burst_size, seed=args.seed)
+    result = send(gen, args.host, args.port, args.protocol, args.rate, args.duration)
+    print(f"sent {result['sent']:,} lines in {result['seconds']:.1f}s ({result['rate']:,.0f}/s, "
+          f"target {args.rate:,.0f}/s), {result['bursts']} brute-force bursts")
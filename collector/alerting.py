@@ -1,10 +1,16 @@
 """
 Alerting: send email & Slack webhook. Keep configuration via env vars or simple constants here for demo.
+Delivery runs on background threads, one per sink, so a slow SMTP server or webhook never blocks ingestion.
+Each sink keeps its connection open between alerts, coalesces alerts arriving within a short window into
+one digest, and has its own rate limit and retry/backoff.
 """
 import os
+import time
+import queue
 import smtplib
 import json
 import logging
+import threading
 import requests
 from email.message import EmailMessage
 
@@ -16,31 +22,222 @@ ALERT_EMAIL_TO = os.getenv('ALERT_EMAIL_TO', 'itsec@example.com')
 SMTP_HOST = os.getenv('SMTP_HOST', 'localhost')
 SMTP_PORT = int(os.getenv('SMTP_PORT', '25'))
 SLACK_WEBHOOK = os.getenv('SLACK_WEBHOOK')
+# alerts reaching a sink within this many seconds of each other go out as one digest
+ALERT_COALESCE_WINDOW = float(os.getenv('ALERT_COALESCE_WINDOW', '2'))
+# max deliveries per minute per sink (a delivery may be a digest of many alerts)
+ALERT_EMAIL_RATE = float(os.getenv('ALERT_EMAIL_RATE', '6'))
+ALERT_SLACK_RATE = float(os.getenv('ALERT_SLACK_RATE', '30'))
+ALERT_MAX_RETRIES = int(os.getenv('ALERT_MAX_RETRIES', '3'))
+ALERT_RETRY_BACKOFF = float(os.getenv('ALERT_RETRY_BACKOFF', '1'))
+ALERT_QUEUE_MAX = int(os.getenv('ALERT_QUEUE_MAX', '10000'))
 
-class Alerting:
-    def __init__(self):
-        pass
+class RateLimiter:
+    """Token bucket: `rate` tokens per minute, bursts up to `burst`."""
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.per_sec = rate / 60.0
+        self.burst = burst or max(1.0, rate / 6.0)
+        self.tokens = self.burst
+        self.clock = clock
+        self.updated = clock()
 
-    def send(self, alert):
-        text = json.dumps(alert, indent=2)
-        logger.info('ALERT: %s', text)
-        # send email
+    def wait_time(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.per_sec)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.per_sec
+
+    def acquire(self, sleep=time.sleep):
+        """Block until a token is available; returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            delay = self.wait_time()
+            if delay <= 0:
+                self.tokens -= 1
+                return waited
+            sleep(delay)
+            waited += delay
+
+def _digest_subject(alerts):
+    if len(alerts) == 1:
+        return 'Syslog Alert: ' + str(alerts[0].get('type'))
+    types = sorted({str(a.get('type')) for a in alerts})
+    return f'Syslog Alerts: {len(alerts)} alerts ({", ".join(types)})'
+
+def _asset_suffix(alert):
+    # the subnet/site/owner the enrichment stage matched for the alert's ip, if any
+    asset = alert.get('asset')
+    if not asset:
+        return ''
+    return ' (' + ', '.join(f'{k}: {v}' for k, v in asset.items()) + ')'
+
+class EmailSink:
+    name = 'email'
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, sender=ALERT_EMAIL_FROM, to=ALERT_EMAIL_TO, timeout=10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.to = to
+        self.timeout = timeout
+        self.smtp = None
+
+    def deliver(self, alerts):
+        msg = EmailMessage()
+        msg['From'] = self.sender
+        msg['To'] = self.to
+        msg['Subject'] = _digest_subject(alerts)
+        msg.set_content('\n\n'.join(json.dumps(a, indent=2) for a in alerts))
+        if self.smtp is None:
+            self.smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            self.smtp.send_message(msg)
+        except Exception:
+            # the server may have dropped an idle connection; reconnect on the next attempt
+            self.close()
+            raise
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+class SlackSink:
+    name = 'slack'
+
+    def __init__(self, webhook=SLACK_WEBHOOK, timeout=10):
+        self.webhook = webhook
+        self.timeout = timeout
+        # pooled keep-alive connections to the webhook host
+        self.session = requests.Session()
+
+    def deliver(self, alerts):
+        lines = ['*' + str(a.get('type')) + '*\n' + str(a.get('message')) + _asset_suffix(a) for a in alerts]
+        resp = self.session.post(self.webhook, json={'text': '\n'.join(lines)}, timeout=self.timeout)
+        resp.raise_for_status()
+
+    def close(self):
+        self.session.close()
+
+class SinkWorker:
+    """Background delivery for one sink: queue -> coalesce -> rate limit -> deliver with retries."""
+    def __init__(self, sink, rate, coalesce_window=ALERT_COALESCE_WINDOW, max_retries=ALERT_MAX_RETRIES,
+                 backoff=ALERT_RETRY_BACKOFF, max_queue=ALERT_QUEUE_MAX):
+        self.sink = sink
+        self.limiter = RateLimiter(rate)
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.delivered = 0
+        self.digests = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.thread = threading.Thread(target=self._run, name=f'alert-{sink.name}', daemon=True)
+        self.thread.start()
+
+    def submit(self, alert):
         try:
-            self._send_email('Syslog Alert: ' + alert.get('type'), text)
-        except Exception as e:
-            logger.exception('Email alert failed: %s', e)
-        # send slack
-        if SLACK_WEBHOOK:
+            self.queue.put_nowait((time.monotonic(), alert))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning('%s alert queue full, dropped alert %s', self.sink.name, alert.get('type'))
+
+    def stop(self, timeout=10):
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.sink.close()
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'delivered': self.delivered,
+            'digests': self.digests,
+            'failed': self.failed,
+            'retries': self.retries,
+            'dropped': self.dropped,
+            'last_latency_ms': round(self.last_latency_ms, 1),
+            'max_latency_ms': round(self.max_latency_ms, 1),
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = item[0] + self.coalesce_window
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    nxt = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stopping = True
+                    break
+                batch.append(nxt)
+            self.limiter.acquire()
+            # anything that queued up while we waited for the rate limit joins this digest
+            while not stopping:
+                try:
+                    nxt = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stopping = True
+                else:
+                    batch.append(nxt)
+            self._deliver(batch)
+
+    def _deliver(self, batch):
+        alerts = [alert for _, alert in batch]
+        for attempt in range(self.max_retries + 1):
             try:
-                requests.post(SLACK_WEBHOOK, json={'text': '*' + alert.get('type') + '*\n' + alert.get('message')})
+                self.sink.deliver(alerts)
+                break
             except Exception as e:
-                logger.exception('Slack notify failed: %s', e)
+                if attempt == self.max_retries:
+                    self.failed += len(alerts)
+                    logger.error('%s delivery of %d alerts failed after %d attempts: %s', self.sink.name, len(alerts), attempt + 1, e)
+                    return
+                self.retries += 1
+                delay = self.backoff * (2 ** attempt)
+                logger.warning('%s delivery failed (%s), retrying in %.1fs', self.sink.name, e, delay)
+                time.sleep(delay)
+        now = time.monotonic()
+        self.delivered += len(alerts)
+        self.digests += 1
+        self.last_latency_ms = (now - batch[0][0]) * 1000
+        self.max_latency_ms = max(self.max_latency_ms, self.last_latency_ms)
 
-    def _send_email(self, subject, body):
-        msg = EmailMessage()
-        msg['From'] = ALERT_EMAIL_FROM
-        msg['To'] = ALERT_EMAIL_TO
-        msg['Subject'] = subject
-        msg.set_content(body)
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as s:
-            s.send_message(msg)
+class Alerting:
+    def __init__(self, sinks=None):
+        if sinks is None:
+            sinks = [(EmailSink(), ALERT_EMAIL_RATE)]
+            if SLACK_WEBHOOK:
+                sinks.append((SlackSink(), ALERT_SLACK_RATE))
+        self.workers = [SinkWorker(sink, rate) for sink, rate in sinks]
+
+    def send(self, alert):
+        """Queue an alert for every sink; never blocks on delivery."""
+        logger.info('ALERT: %s', json.dumps(alert, indent=2))
+        for worker in self.workers:
+            worker.submit(alert)
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def stats(self):
+        return {w.sink.name: w.stats() for w in self.workers}
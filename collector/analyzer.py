@@ -1,23 +1,48 @@
 """
 Simple rule-based correlation engine.
-Rule example implemented:
-- If >= N failed ssh attempts from same IP within T minutes, followed by a successful ssh login from same IP within T2 minutes -> raise an alert.
+Rules are declared in a JSON file (collector/rules.json by default, see collector/rules.py) and compiled at
+startup into a table keyed by event_type, so each event only touches the rules that can consume it.
+Default rules:
+- If >= N failed ssh attempts from same IP within T minutes -> ssh_bruteforce_threshold.
+- Failed ssh attempts followed by a successful ssh login from same IP within T2 minutes -> intrusion_suspected.
+- Failed ssh or Cisco logins for many distinct usernames from one IP -> password_spraying, or from many
+  distinct IPs for one username -> distributed_bruteforce (estimated in fixed memory, see collector/sketches.py).
+A rule matches again on every event past its threshold; alerts go out once per (rule, key) per cooldown,
+with periodic updates while the incident goes on (collector/suppression.py).
 """
+import os
 import logging
-from collections import deque, defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
+from collector.rules import load_rules, compile_rules
+from collector.suppression import AlertSuppressor
 
 logger = logging.getLogger('analyzer')
 
+# Rules file; defaults to collector/rules.json
+ANALYZER_RULES = os.getenv('ANALYZER_RULES')
+# Caps on in-memory window state, per rule; least recently active keys are evicted first
+ANALYZER_MAX_KEYS = int(os.getenv('ANALYZER_MAX_KEYS', '200000'))
+ANALYZER_MAX_EVENTS = int(os.getenv('ANALYZER_MAX_EVENTS', '2000000'))
+# Seconds an event's own timestamp may run ahead of when it was received; later ones are capped to that
+ANALYZER_MAX_SKEW = int(os.getenv('ANALYZER_MAX_SKEW', '60'))
+# Seconds between alerts for the same rule and key (rules may set their own `cooldown`; 0 alerts on every match)
+ANALYZER_ALERT_COOLDOWN = int(os.getenv('ANALYZER_ALERT_COOLDOWN', '300'))
+# Cap on open incidents tracked for suppression, per rule
+ANALYZER_MAX_INCIDENTS = int(os.getenv('ANALYZER_MAX_INCIDENTS', '100000'))
+
 class Analyzer:
-    def __init__(self, storage):
+    def __init__(self, storage, rules=None):
         self.storage = storage
-        # keep an in-memory window of recent failed attempts: ip -> deque of timestamps
-        self.failed_ssh = defaultdict(deque)
-        # settings
-        self.fail_window = timedelta(minutes=10)
-        self.fail_threshold = 5
-        self.success_follow_window = timedelta(minutes=5)
+        specs = rules if rules is not None else load_rules(ANALYZER_RULES)
+        self.rules, self.dispatch = compile_rules(specs, ANALYZER_MAX_KEYS, ANALYZER_MAX_EVENTS)
+        # event types process() acts on; anything else can skip the analyzer entirely
+        self.event_types = frozenset(self.dispatch)
+        self.suppressors = {}
+        for rule in self.rules:
+            cooldown = ANALYZER_ALERT_COOLDOWN if rule.cooldown is None else rule.cooldown
+            if cooldown > 0:
+                self.suppressors[rule.name] = AlertSuppressor(cooldown, ANALYZER_MAX_INCIDENTS)
+        logger.info('Loaded %d rules for %d event types', len(self.rules), len(self.dispatch))
 
     def _parse_time(self, ts):
         try:
@@ -25,38 +50,54 @@ class Analyzer:
         except Exception:
             return datetime.utcnow()
 
+    def _epoch(self, ts):
+        dt = self._parse_time(ts)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp())
+
+    def stats(self):
+        stats = {}
+        for rule in self.rules:
+            stats[rule.name] = rule.stats()
+            suppressor = self.suppressors.get(rule.name)
+            if suppressor is not None:
+                stats[rule.name].update(suppressor.stats())
+        return stats
+
+    def process_all(self, doc):
+        """Run every rule that consumes this event's type; returns the list of alerts to send."""
+        parsed = doc.get('parsed', {})
+        rules = self.dispatch.get(parsed.get('event_type'))
+        if not rules:
+            return []
+        et = parsed['event_type']
+        now = self._epoch(doc.get('timestamp'))
+        received = doc.get('received_ts')
+        if received:
+            # window state follows event time, so one forged or clock-ahead header must not drag it forward
+            now = min(now, self._epoch(received) + ANALYZER_MAX_SKEW)
+        # set by the enrichment stage (collector/enrich.py) for the same src_ip the rules key on
+        asset = parsed.get('asset')
+        alerts = []
+        for rule in rules:
+            suppressor = self.suppressors.get(rule.name)
+            raised = suppressor.expire(now) if suppressor is not None else []
+            key = parsed.get(rule.key) or doc.get(rule.key)
+            if key is not None:
+                alert = rule.on_event(doc, et, key, now)
+                if alert:
+                    if asset is not None and 'ip' in alert:
+                        alert['asset'] = asset
+                    if suppressor is None:
+                        raised.append(alert)
+                    else:
+                        raised.extend(suppressor.check(key, alert, now))
+            for alert in raised:
+                logger.log(logging.WARNING if rule.level == 'warning' else logging.INFO, '%s: %s', rule.name, alert['message'])
+            alerts.extend(raised)
+        return alerts
+
     def process(self, doc):
-        et = doc.get('parsed', {}).get('event_type')
-        if et == 'ssh_failed':
-            ip = doc.get('parsed', {}).get('src_ip') or doc.get('src_ip')
-            now = self._parse_time(doc.get('timestamp'))
-            dq = self.failed_ssh[ip]
-            dq.append(now)
-            # drop old
-            while dq and (now - dq[0]) > self.fail_window:
-                dq.popleft()
-            if len(dq) >= self.fail_threshold:
-                logger.info('SSH brute force suspect from %s: %d fails in %s', ip, len(dq), self.fail_window)
-                return {
-                    'type': 'ssh_bruteforce_threshold',
-                    'ip': ip,
-                    'count': len(dq),
-                    'message': f'Suspected brute force: {len(dq)} failed SSH logins from {ip} in {self.fail_window}'
-                }
-            return None
-        elif et == 'ssh_success':
-            ip = doc.get('parsed', {}).get('src_ip') or doc.get('src_ip')
-            now = self._parse_time(doc.get('timestamp'))
-            dq = self.failed_ssh.get(ip, deque())
-            # check if there were failed attempts in window before success
-            if dq and (now - dq[-1]) <= self.success_follow_window:
-                # correlation: failed attempts followed by success
-                logger.warning('Intrusion pattern: failed attempts then success from %s', ip)
-                return {
-                    'type': 'intrusion_suspected',
-                    'ip': ip,
-                    'message': f'Failed SSH attempts followed by success from {ip}'
-                }
-            return None
-        else:
-            return None
+        alerts = self.process_all(doc)
+        return alerts[0] if alerts else None
@@ -0,0 +1,282 @@
+"""
+Checkpoint and warm restart of Analyzer window state.
+The analyzer-owning thread only ever writes small deltas (analyzer.delta.N) holding the keys touched or
+dropped since the previous checkpoint. Every CHECKPOINT_COMPACT_EVERY deltas a background thread merges the
+current snapshot (analyzer.snap) and those deltas, file to file, into a new snapshot, so building a full
+snapshot never stalls event processing. A snapshot records the last delta number folded into it; older
+deltas left behind by a crash mid-compaction are ignored on load.
+The format is binary and columnar per rule: all keys in one NUL-separated blob, per-key counts as uint32 and
+all event times as one int64 array. Snapshot keys are sorted, so a warm restart is a handful of C-level
+splits and array copies and lookups into the restored state are a bisect (see collector/windows.py).
+"""
+import os
+import glob
+import time
+import queue
+import struct
+import logging
+import threading
+from array import array
+from itertools import islice
+from collections import OrderedDict
+from collector.windows import DistinctStore, _ColdEntries, _KeyedState
+
+logger = logging.getLogger('checkpoint')
+
+# Configure via environment variables
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR', 'state')
+CHECKPOINT_INTERVAL = float(os.getenv('CHECKPOINT_INTERVAL', '30'))
+CHECKPOINT_COMPACT_EVERY = int(os.getenv('CHECKPOINT_COMPACT_EVERY', '20'))
+
+MAGIC = b'SAFCKPT1'
+KIND_WINDOW = 0
+KIND_DISTINCT = 1
+SEP = '\0'
+SECTION = '<BIqI'
+
+def _blob(strings):
+    return SEP.join(strings).encode('utf-8', 'surrogatepass')
+
+def _unblob(data, n):
+    return data.decode('utf-8', 'surrogatepass').split(SEP) if n else []
+
+def _put(out, data):
+    out.append(struct.pack('<Q', len(data)))
+    out.append(data)
+
+def _kind(state):
+    return KIND_DISTINCT if isinstance(state, DistinctStore) else KIND_WINDOW
+
+def _pack_section(name, kind, high_water, keys, entries, deleted=(), order=None):
+    """Serialize one rule's entries (arrays of times, or value -> time dicts) in columnar form."""
+    counts = array('I')
+    times = array('q')
+    values = []
+    for entry in entries:
+        counts.append(len(entry))
+        if kind == KIND_WINDOW:
+            times.extend(entry)
+        else:
+            values.extend(map(str, entry))
+            times.extend(entry.values())
+    name_b = name.encode('utf-8')
+    out = [struct.pack('<H', len(name_b)), name_b, struct.pack(SECTION, kind, len(keys), high_water, len(deleted))]
+    _put(out, _blob(map(str, keys)))
+    _put(out, counts.tobytes())
+    _put(out, times.tobytes())
+    _put(out, _blob(values) if kind == KIND_DISTINCT else b'')
+    _put(out, _blob(map(str, deleted)))
+    _put(out, order.tobytes() if order is not None else b'')
+    return b''.join(out)
+
+def _header(number):
+    return MAGIC + struct.pack('<Q', number)
+
+def _read_number(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('not an analyzer checkpoint')
+    return struct.unpack_from('<Q', data, len(MAGIC))[0]
+
+def _read_sections(data):
+    """Yield (name, kind, high_water, keys, counts, times, values, deleted, order) per rule."""
+    pos = len(MAGIC) + 8
+    while pos < len(data):
+        (n,) = struct.unpack_from('<H', data, pos)
+        pos += 2
+        name = data[pos:pos + n].decode('utf-8')
+        pos += n
+        kind, nkeys, high_water, ndeleted = struct.unpack_from(SECTION, data, pos)
+        pos += struct.calcsize(SECTION)
+        blocks = []
+        for _ in range(6):
+            (size,) = struct.unpack_from('<Q', data, pos)
+            pos += 8
+            blocks.append(data[pos:pos + size])
+            pos += size
+        counts = array('I')
+        counts.frombytes(blocks[1])
+        times = array('q')
+        times.frombytes(blocks[2])
+        values = _unblob(blocks[3], len(times)) if kind == KIND_DISTINCT else None
+        order = None
+        if blocks[5]:
+            order = array('I')
+            order.frombytes(blocks[5])
+        yield name, kind, high_water, _unblob(blocks[0], nkeys), counts, times, values, _unblob(blocks[4], ndeleted), order
+
+def _read(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    return _read_number(data), data
+
+def _write_file(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class Checkpointer:
+    def __init__(self, analyzer, directory=CHECKPOINT_DIR, interval=CHECKPOINT_INTERVAL, compact_every=CHECKPOINT_COMPACT_EVERY, prefix='analyzer'):
+        self.analyzer = analyzer
+        self.directory = directory
+        self.interval = interval
+        self.compact_every = compact_every
+        self.prefix = prefix
+        self.snapshot_path = os.path.join(directory, prefix + '.snap')
+        # number of the newest delta written; the snapshot holds everything up to `base`
+        self.seq = 0
+        self.base = 0
+        self.uncompacted = 0
+        self.last_save = time.monotonic()
+        self.jobs = queue.Queue()
+        self.thread = None
+        # sketch rules (collector/sketches.py) hold at most a window of fixed-size state and start cold
+        self.stores = {rule.name: rule.state for rule in analyzer.rules if isinstance(rule.state, _KeyedState)}
+        for state in self.stores.values():
+            state.dirty = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def _delta_path(self, number):
+        return os.path.join(self.directory, f'{self.prefix}.delta.{number}')
+
+    def _deltas(self):
+        """(number, path) of every delta file, oldest first."""
+        paths = glob.glob(os.path.join(self.directory, self.prefix + '.delta.*[0-9]'))
+        return sorted((int(p.rsplit('.', 1)[1]), p) for p in paths)
+
+    def load(self):
+        """Restore state from the snapshot and any newer deltas. Returns the number of keys loaded."""
+        t0 = time.perf_counter()
+        files = 0
+        if os.path.exists(self.snapshot_path):
+            try:
+                self.base, data = _read(self.snapshot_path)
+                self._apply(data, snapshot=True)
+                files += 1
+            except Exception as e:
+                logger.exception('Skipping unreadable checkpoint %s: %s', self.snapshot_path, e)
+        self.seq = self.base
+        for number, path in self._deltas():
+            self.seq = max(self.seq, number)
+            if number <= self.base:
+                # already folded into the snapshot
+                continue
+            try:
+                self._apply(_read(path)[1], snapshot=False)
+                files += 1
+                self.uncompacted += 1
+            except Exception as e:
+                logger.exception('Skipping unreadable checkpoint %s: %s', path, e)
+        for state in self.stores.values():
+            state.dirty.clear()
+        keys = sum(len(s) for s in self.stores.values())
+        if files:
+            logger.info('Loaded analyzer state: %d keys from %d checkpoint files in %.3fs', keys, files, time.perf_counter() - t0)
+        else:
+            logger.info('No analyzer checkpoint in %s, starting cold', self.directory)
+        return keys
+
+    def _apply(self, data, snapshot):
+        for name, kind, high_water, keys, counts, times, values, deleted, order in _read_sections(data):
+            state = self.stores.get(name)
+            if state is None or kind != _kind(state):
+                # rule was removed or changed type since the checkpoint
+                continue
+            state.restore(keys, counts, times, values, high_water, order=order, replace=snapshot, deleted=deleted)
+
+    def maybe_save(self):
+        """Cheap enough to call per event: checkpoints once the interval has elapsed."""
+        if time.monotonic() - self.last_save >= self.interval:
+            self.save()
+
+    def save(self, compact=False):
+        """Serialize keys changed since the last checkpoint on the calling (analyzer-owning) thread and
+        hand the file to the background writer. Returns the number of keys written."""
+        self.last_save = time.monotonic()
+        t0 = time.perf_counter()
+        sections = [_header(self.seq + 1)]
+        changed = 0
+        for name, state in self.stores.items():
+            dirty = state.dirty
+            if not dirty:
+                continue
+            deleted = [k for k in dirty if k not in state]
+            # every key touched since the last save sits at the tail of the LRU map; keep that order so
+            # replaying the delta restores it
+            keys = list(islice(reversed(state.keys), len(dirty) - len(deleted)))[::-1]
+            dirty.clear()
+            changed += len(keys) + len(deleted)
+            sections.append(_pack_section(name, _kind(state), state.high_water, keys, [state.keys[k] for k in keys], deleted))
+        if changed:
+            self.seq += 1
+            self.uncompacted += 1
+            data = b''.join(sections)
+            logger.debug('Serialized checkpoint delta %d (%d keys, %d bytes) in %.3fs', self.seq, changed, len(data), time.perf_counter() - t0)
+            self._submit(self._write_delta, self.seq, data)
+        if self.uncompacted and (compact or self.uncompacted >= self.compact_every):
+            self.uncompacted = 0
+            self._submit(self._compact, self.seq)
+        return changed
+
+    def wait(self):
+        """Block until every queued checkpoint write and compaction has finished."""
+        self.jobs.join()
+
+    def _submit(self, fn, *args):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='checkpoint-writer', daemon=True)
+            self.thread.start()
+        self.jobs.put((fn, args))
+
+    def _run(self):
+        while True:
+            fn, args = self.jobs.get()
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.exception('Checkpoint %s failed: %s', fn.__name__.strip('_'), e)
+            finally:
+                self.jobs.task_done()
+
+    def _write_delta(self, number, data):
+        _write_file(self._delta_path(number), data)
+
+    def _compact(self, upto):
+        """Merge the snapshot and deltas up to `upto` into a new snapshot, without touching live state."""
+        t0 = time.perf_counter()
+        kinds = {name: _kind(state) for name, state in self.stores.items()}
+        merged = {name: (OrderedDict(), [0]) for name in kinds}
+        paths = [self.snapshot_path] if os.path.exists(self.snapshot_path) else []
+        paths += [p for n, p in self._deltas() if self.base < n <= upto]
+        for path in paths:
+            _, data = _read(path)
+            for name, kind, high_water, keys, counts, times, values, deleted, order in _read_sections(data):
+                if kinds.get(name) != kind:
+                    continue
+                entries, hw = merged[name]
+                hw[0] = max(hw[0], high_water)
+                cols = _ColdEntries(keys, counts, times, values)
+                for key in deleted:
+                    entries.pop(key, None)
+                for i in (order if order is not None else range(len(keys))):
+                    entries.pop(keys[i], None)
+                    entries[keys[i]] = cols.entry(i)
+        sections = [_header(upto)]
+        total = 0
+        for name, (entries, hw) in merged.items():
+            lru = list(entries)
+            ranks = sorted(range(len(lru)), key=lru.__getitem__)
+            order = array('I', bytes(4 * len(lru)))
+            for rank, i in enumerate(ranks):
+                order[i] = rank
+            keys = [lru[i] for i in ranks]
+            sections.append(_pack_section(name, kinds[name], hw[0], keys, [entries[k] for k in keys], order=order))
+            total += len(keys)
+        _write_file(self.snapshot_path, b''.join(sections))
+        self.base = upto
+        for number, path in self._deltas():
+            if number <= upto:
+                os.remove(path)
+        logger.info('Compacted analyzer checkpoint: %d keys from %d files in %.3fs', total, len(paths), time.perf_counter() - t0)
@@ -0,0 +1,61 @@
+"""
+Time-bounded dedupe cache for retransmitted syslog messages.
+Entries are keyed on a compact hash of (raw, src_ip) and kept in an OrderedDict ordered by first sighting,
+so insert, lookup and eviction are all O(1) and the oldest entries are always evicted first.
+A repeat does not refresh its entry: a message is suppressed for `ttl` seconds after it was first seen and
+then passes again, so a message that keeps repeating (a periodic "Failed password" flood) still reaches
+the analyzer once per ttl instead of being hidden for as long as it continues.
+"""
+import time
+from collections import OrderedDict
+
+class DedupeCache:
+    def __init__(self, ttl=60.0, max_entries=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        # key hash -> first seen (monotonic seconds), oldest first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def seen(self, raw, src_ip):
+        """Return True if this message was already seen within the TTL window, else record it."""
+        now = self.clock()
+        key = hash((raw, src_ip))
+        entries = self.entries
+        self._expire(now)
+        if key in entries:
+            self.hits += 1
+            return True
+        entries[key] = now
+        self.misses += 1
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return False
+
+    def _expire(self, now):
+        entries = self.entries
+        cutoff = now - self.ttl
+        # entries are ordered by first sighting, so stop at the first live one
+        while entries:
+            key, ts = next(iter(entries.items()))
+            if ts > cutoff:
+                break
+            entries.popitem(last=False)
+            self.expirations += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
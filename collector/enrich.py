@@ -0,0 +1,205 @@
+"""
+Asset enrichment: tags each doc's source IP (parsed src_ip, else the sender) with the most specific matching
+entry of a local CIDR table, as doc['parsed']['asset'], so stored docs, the live tail and alerts say which
+subnet, site or owner an address belongs to.
+The table is a CSV file with a `cidr` column plus any others (site, owner, vlan, ...); a match is a dict of
+the row's non-empty columns. Prefixes may nest, and the longest one wins. At load the prefixes are flattened
+into disjoint sorted address ranges (IPv4 and IPv6 apart), each pointing at the most specific prefix covering
+it, so a lookup is one bisect over a list of ints. Hot addresses skip even that through an LRU cache.
+The file is polled every ENRICH_RELOAD_INTERVAL seconds; a changed file is parsed on a worker thread and the
+new table swapped in with one assignment, so ingest never waits for a reload. A file that fails to load
+keeps the old table.
+"""
+import os
+import csv
+import socket
+import logging
+import ipaddress
+from bisect import bisect_right
+from collections import OrderedDict
+
+logger = logging.getLogger('enrich')
+
+# Configure via environment variables
+ENRICH_CIDR_FILE = os.getenv('ENRICH_CIDR_FILE', '')
+ENRICH_CACHE_SIZE = int(os.getenv('ENRICH_CACHE_SIZE', '65536'))
+ENRICH_RELOAD_INTERVAL = float(os.getenv('ENRICH_RELOAD_INTERVAL', '10'))
+
+def _address(ip):
+    # (family index, int) for an IPv4/IPv6 string; inet_pton is several times faster than ipaddress
+    try:
+        return 0, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except (OSError, TypeError):
+        pass
+    try:
+        return 1, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+    except (OSError, TypeError):
+        return None, None
+
+def _flatten(prefixes):
+    """[(first, last, record)] of nested-or-disjoint prefixes -> disjoint sorted (starts, ends, records) where
+    every range maps to its most specific prefix."""
+    starts, ends, records = [], [], []
+
+    def emit(lo, hi, record):
+        if lo <= hi:
+            starts.append(lo)
+            ends.append(hi)
+            records.append(record)
+
+    # outer prefixes before the ones they contain; for a repeated prefix the later row ends up innermost
+    prefixes = sorted(prefixes, key=lambda p: (p[0], -p[1]))
+    stack = []
+    cursor = 0
+    for first, last, record in prefixes:
+        while stack and stack[-1][0] < first:
+            end, outer = stack.pop()
+            emit(cursor, end, outer)
+            cursor = end + 1
+        if stack:
+            # the enclosing prefix up to where this one starts
+            emit(cursor, first - 1, stack[-1][1])
+        cursor = first
+        stack.append((last, record))
+    while stack:
+        end, outer = stack.pop()
+        emit(cursor, end, outer)
+        cursor = end + 1
+    return starts, ends, records
+
+class CidrTable:
+    """Longest-prefix match over a fixed set of CIDR prefixes; build a new table to change it."""
+    def __init__(self, rows=()):
+        # rows: (cidr, fields dict)
+        families = ([], [])
+        for cidr, fields in rows:
+            net = ipaddress.ip_network(cidr.strip(), strict=False)
+            record = {'cidr': str(net)}
+            record.update(fields)
+            families[net.version == 6].append((int(net.network_address), int(net.broadcast_address), record))
+        self.prefixes = len(families[0]) + len(families[1])
+        self.families = [_flatten(prefixes) for prefixes in families]
+
+    @classmethod
+    def load(cls, path):
+        """Read a CSV file with a header row and a `cidr` column; blank cells and lines starting with '#' are skipped."""
+        with open(path, newline='') as f:
+            lines = (line for line in f if line.strip() and not line.lstrip().startswith('#'))
+            reader = csv.DictReader(lines)
+            if not reader.fieldnames or 'cidr' not in reader.fieldnames:
+                raise ValueError(f'{path} has no cidr column')
+            rows = []
+            for n, row in enumerate(reader, 2):
+                cidr = row.pop('cidr')
+                if not cidr:
+                    raise ValueError(f'{path}: row {n} has no cidr')
+                rows.append((cidr, {k: v.strip() for k, v in row.items() if k and v and v.strip()}))
+        return cls(rows)
+
+    def lookup(self, ip):
+        """The record of the most specific prefix containing ip, or None (also for anything that is not an IP)."""
+        family, n = _address(ip)
+        if family is None:
+            return None
+        starts, ends, records = self.families[family]
+        i = bisect_right(starts, n) - 1
+        if i >= 0 and n <= ends[i]:
+            return records[i]
+        return None
+
+    def __len__(self):
+        return self.prefixes
+
+class Enricher:
+    """The enrichment stage: a CidrTable behind an LRU cache, reloaded from `path` when the file changes."""
+    def __init__(self, path=None, table=None, cache_size=ENRICH_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self.version = None
+        self.lookups = 0
+        self.hits = 0
+        self.matched = 0
+        self.reloads = 0
+        self.reload_errors = 0
+        if table is None and path:
+            self.version = self._version()
+            table = CidrTable.load(path)
+            logger.info('Loaded %d CIDR prefixes from %s', len(table), path)
+        self.swap(table if table is not None else CidrTable())
+
+    def swap(self, table):
+        # cached records belong to the old table
+        self.table = table
+        self.cache = OrderedDict()
+
+    def lookup(self, ip):
+        self.lookups += 1
+        cache = self.cache
+        try:
+            record = cache[ip]
+        except KeyError:
+            record = cache[ip] = self.table.lookup(ip)
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(ip)
+            self.hits += 1
+        return record
+
+    def enrich(self, doc):
+        """Set doc['parsed']['asset'] from the doc's source IP; returns the record or None."""
+        parsed = doc.get('parsed')
+        if parsed is None:
+            return None
+        record = self.lookup(parsed.get('src_ip') or doc.get('src_ip'))
+        if record is not None:
+            # shared by every doc from the same prefix; never modified
+            parsed['asset'] = record
+            self.matched += 1
+        return record
+
+    def _version(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def changed(self):
+        """True if the file was modified since it was last loaded (cheap: one stat)."""
+        if not self.path:
+            return False
+        try:
+            return self._version() != self.version
+        except OSError:
+            return False
+
+    def load_changed(self):
+        """Blocking: parse the file again. Returns the new table, or None if it failed (the old one stays)."""
+        try:
+            version = self._version()
+            table = CidrTable.load(self.path)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            self.reload_errors += 1
+            logger.error('Keeping the current CIDR table, could not load %s: %s', self.path, e)
+            # do not retry an unchanged broken file every interval
+            try:
+                self.version = self._version()
+            except OSError:
+                pass
+            return None
+        self.version = version
+        return table
+
+    def reload(self, table):
+        self.swap(table)
+        self.reloads += 1
+        logger.info('Reloaded %d CIDR prefixes from %s', len(table), self.path)
+
+    def stats(self):
+        return {
+            'prefixes': len(self.table),
+            'lookups': self.lookups,
+            'cache_hits': self.hits,
+            'matched': self.matched,
+            'cache_size': len(self.cache),
+            'reloads': self.reloads,
+            'reload_errors': self.reload_errors,
+        }
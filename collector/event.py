@@ -0,0 +1,179 @@
+"""
+Compact representation of one normalized log message.
+LogEvent keeps the fields in __slots__ instead of a per-message dict (plus an inner `parsed` dict built
+empty and then updated). The message is kept as an offset into `raw` and sliced out when read, the header
+timestamp is converted only when something first reads it, and the event serializes
+straight to the SQLite row tuple and the JSON line used for Elasticsearch bulk bodies, the spool and the
+live tail, without building an intermediate dict. It is a MutableMapping over the same keys the dict docs
+had, so code written against dicts (doc['host'], doc.get('parsed', {}), tests) keeps working; keys outside
+the schema go to a small side dict created on first use.
+"""
+import json
+from collections.abc import MutableMapping
+from json.encoder import encode_basestring_ascii
+
+# compact separators, built once; json.dumps(..., separators=...) constructs a new encoder per call
+_ENCODER = json.JSONEncoder(separators=(',', ':'), default=str)
+
+KEYS = ('raw', 'src_ip', 'received_ts', 'timestamp', 'host', 'program', 'pid', 'severity', 'message', 'parsed')
+_KEYSET = frozenset(KEYS)
+
+def _js(value):
+    if value is None:
+        return 'null'
+    if type(value) is str:
+        return encode_basestring_ascii(value)
+    return _ENCODER.encode(value)
+
+class LogEvent(MutableMapping):
+    # timestamp converter, installed by collector.parser (which imports this module)
+    parse_timestamp = None
+
+    __slots__ = ('raw', 'src_ip', 'received_ts', '_timestamp', '_ts_text', 'host', 'program', 'pid', 'severity',
+                 '_msg_at', '_message', 'parsed', '_extra')
+
+    def __init__(self, raw, src_ip, received_ts, ts_text=None, host=None, program=None, pid=None, msg_at=0, parsed=None):
+        self.raw = raw
+        self.src_ip = src_ip
+        self.received_ts = received_ts
+        # header timestamp as received; converted to ISO on first read of .timestamp
+        self._ts_text = ts_text
+        self._timestamp = None if ts_text else received_ts
+        self.host = host
+        self.program = program
+        self.pid = pid
+        self.severity = None
+        # message is raw[msg_at:] unless set to something else
+        self._msg_at = msg_at
+        self._message = None
+        self.parsed = parsed
+        self._extra = None
+
+    @property
+    def timestamp(self):
+        ts = self._timestamp
+        if ts is None:
+            ts = self.resolve_timestamp()
+        return ts
+
+    def resolve_timestamp(self, now=None):
+        """Convert the header timestamp now, inferring RFC3164 years relative to `now` (e.g. an archive's
+        mtime when replaying old files) instead of the current time."""
+        if self._timestamp is None:
+            try:
+                self._timestamp = self.parse_timestamp(self._ts_text, now)
+            except Exception:
+                self._timestamp = self.received_ts
+            self._ts_text = None
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, value):
+        self._timestamp = value
+        self._ts_text = None
+
+    @property
+    def message(self):
+        message = self._message
+        return self.raw[self._msg_at:] if message is None else message
+
+    @message.setter
+    def message(self, value):
+        self._message = value
+
+    @property
+    def event_type(self):
+        parsed = self.parsed
+        return parsed.get('event_type') if parsed else None
+
+    # mapping protocol, over KEYS plus any extra keys
+    def __getitem__(self, key):
+        if key in _KEYSET:
+            return getattr(self, key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        # hot path for the analyzer and rules; avoids the KeyError round trip of Mapping.get
+        if key in _KEYSET:
+            return getattr(self, key)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __setitem__(self, key, value):
+        if key in _KEYSET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _KEYSET:
+            raise TypeError(f'Cannot delete schema field {key!r} from a LogEvent')
+        if self._extra is None:
+            raise KeyError(key)
+        del self._extra[key]
+
+    def __contains__(self, key):
+        return key in _KEYSET or (self._extra is not None and key in self._extra)
+
+    def __iter__(self):
+        yield from KEYS
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return len(KEYS) + (len(self._extra) if self._extra else 0)
+
+    def __repr__(self):
+        return f'LogEvent({self.to_dict()!r})'
+
+    def __reduce__(self):
+        # compact pickling for the shard inboxes in --workers mode
+        return (_rebuild, (self.raw, self.src_ip, self.received_ts, self.timestamp, self.host, self.program, self.pid,
+                           self.severity, self._msg_at, self._message, self.parsed, self._extra))
+
+    def copy(self):
+        return self.to_dict()
+
+    def to_dict(self):
+        doc = {key: getattr(self, key) for key in KEYS}
+        if self._extra:
+            doc.update(self._extra)
+        return doc
+
+    def row(self):
+        """The SQLite row tuple, in storage.COLUMNS order."""
+        parsed = self.parsed
+        return (self.timestamp, self.src_ip, self.host, self.program, self.pid,
+                parsed.get('event_type') if parsed else None, self.raw)
+
+    def to_json(self):
+        """Compact JSON object, same as json.dumps(self.to_dict(), separators=(',', ':'))."""
+        parsed = self.parsed
+        out = ['{"raw":', _js(self.raw), ',"src_ip":', _js(self.src_ip), ',"received_ts":', _js(self.received_ts),
+               ',"timestamp":', _js(self.timestamp), ',"host":', _js(self.host), ',"program":', _js(self.program),
+               ',"pid":', _js(self.pid), ',"severity":', _js(self.severity), ',"message":', _js(self.message),
+               ',"parsed":', _js(parsed) if parsed is not None else 'null']
+        if self._extra:
+            for key, value in self._extra.items():
+                out.append(',' + encode_basestring_ascii(str(key)) + ':' + _js(value))
+        out.append('}')
+        return ''.join(out)
+
+def _rebuild(raw, src_ip, received_ts, timestamp, host, program, pid, severity, msg_at, message, parsed, extra):
+    event = LogEvent(raw, src_ip, received_ts, None, host, program, pid, msg_at, parsed)
+    event._message = message
+    event._timestamp = timestamp
+    event.severity = severity
+    event._extra = extra
+    return event
+
+def dumps(doc):
+    """Compact JSON for a LogEvent or a plain dict doc (e.g. one read back from the spool)."""
+    if type(doc) is LogEvent:
+        return doc.to_json()
+    return _ENCODER.encode(doc)
@@ -0,0 +1,200 @@
+"""
+Message framing for syslog over TCP (RFC 6587). The TCP handler reads the socket in large chunks and a Framer
+splits each chunk into messages in bulk, instead of one readline() await per message.
+Two framings, detected per connection from its first bytes:
+- octet counting: every frame is "MSG-LEN SP MSG" (e.g. "57 <34>1 2024-..."), so messages may contain
+  newlines. Chosen when the stream starts with digits, a space and '<' (the PRI every RFC syslog message
+  begins with).
+- non-transparent (newline) framing, everything else: one message per line. The complete lines of a chunk
+  are decoded in one go and split with str.split.
+Messages longer than TCP_MAX_MESSAGE bytes are cut to that length and the rest of the frame is skipped as it
+arrives, so one bad or hostile sender cannot grow the buffer without bound. A malformed octet-counting
+header cannot be resynchronized and ends the connection (FramingError); the messages framed before it in
+the same chunk travel on the error, so they are still delivered.
+"""
+import os
+
+# Configure via environment variables
+TCP_MAX_MESSAGE = int(os.getenv('TCP_MAX_MESSAGE', '65536'))
+TCP_READ_BYTES = int(os.getenv('TCP_READ_BYTES', '262144'))
+
+NEWLINE = 'newline'
+OCTET_COUNTING = 'octet_counting'
+# longest MSG-LEN accepted in an octet-counting header
+MAX_LEN_DIGITS = 9
+WHITESPACE = b' \t\r\n\0'
+
+class FramingError(ValueError):
+    def __init__(self, message, messages=()):
+        super().__init__(message)
+        # complete messages of the same chunk, framed before the bad header
+        self.messages = list(messages)
+
+def _text(frame):
+    return frame.decode(errors='ignore').strip()
+
+class Framer:
+    """Per-connection state: feed() raw chunks, get back complete messages (str, stripped, never empty)."""
+    def __init__(self, max_message=TCP_MAX_MESSAGE):
+        self.max_message = max_message
+        self.mode = None
+        self.buf = b''
+        # newline framing: drop everything up to the next newline (rest of an oversized line)
+        self.discard = False
+        # octet counting: bytes of an oversized frame still to skip
+        self.skip = 0
+        self.frames = 0
+        self.truncated = 0
+
+    def feed(self, data):
+        if self.mode is None:
+            data = self.buf + data
+            self.buf = b''
+            self.mode = self._detect(data)
+            if self.mode is None:
+                # not enough bytes to tell yet
+                self.buf = data
+                return []
+        if self.mode == NEWLINE:
+            messages = self._lines(data)
+        else:
+            try:
+                messages = self._octets(data)
+            except FramingError as e:
+                self.frames += len(e.messages)
+                raise
+        self.frames += len(messages)
+        return messages
+
+    def flush(self):
+        """Messages left at end of stream: an unterminated last line. A partial octet-counted frame is lost."""
+        buf, self.buf = self.buf, b''
+        if self.mode == OCTET_COUNTING or self.discard:
+            return []
+        text = _text(buf[:self.max_message])
+        if text:
+            self.frames += 1
+            return [text]
+        return []
+
+    def _detect(self, data):
+        start = len(data) - len(data.lstrip(WHITESPACE))
+        head = data[start:start + MAX_LEN_DIGITS + 2]
+        digits = len(head) - len(head.lstrip(b'0123456789'))
+        if digits == len(head) and digits <= MAX_LEN_DIGITS:
+            # only digits so far (or nothing): could still be a length header
+            return None
+        if 0 < digits <= MAX_LEN_DIGITS and head[digits:digits + 2] == b' <':
+            return OCTET_COUNTING
+        if 0 < digits and head[digits:digits + 1] == b' ' and len(head) == digits + 1:
+            return None
+        return NEWLINE
+
+    def _lines(self, data):
+        if self.discard:
+            i = data.find(b'\n')
+            if i < 0:
+                return []
+            self.discard = False
+            data = data[i + 1:]
+        buf = self.buf + data if self.buf else data
+        end = buf.rfind(b'\n')
+        if end < 0:
+            self.buf = buf
+            return self._oversized_line()
+        self.buf = buf[end + 1:]
+        messages = [line for line in map(str.strip, buf[:end].decode(errors='ignore').split('\n')) if line]
+        limit = self.max_message
+        if messages and max(map(len, messages)) > limit:
+            self.truncated += sum(len(m) > limit for m in messages)
+            messages = [m[:limit].strip() for m in messages]
+        return messages + self._oversized_line()
+
+    def _oversized_line(self):
+        # an unterminated line already past the limit: emit what fits, skip the rest of it
+        if len(self.buf) <= self.max_message:
+            return []
+        text = _text(self.buf[:self.max_message])
+        self.buf = b''
+        self.discard = True
+        self.truncated += 1
+        return [text] if text else []
+
+    def _octets(self, data):
+        if self.skip:
+            n = min(self.skip, len(data))
+            self.skip -= n
+            data = data[n:]
+        buf = self.buf + data if self.buf else data
+        messages = []
+        pos, size, limit = 0, len(buf), self.max_message
+        while True:
+            # tolerate newlines some senders put between frames
+            while pos < size and buf[pos] in WHITESPACE:
+                pos += 1
+            sp = buf.find(b' ', pos, pos + MAX_LEN_DIGITS + 1)
+            if sp < 0:
+                if size - pos > MAX_LEN_DIGITS:
+                    raise FramingError(f'bad octet-counting header {bytes(buf[pos:pos + 16])!r}', messages)
+                break
+            header = buf[pos:sp]
+            if not header.isdigit():
+                raise FramingError(f'bad octet-counting header {bytes(buf[pos:sp + 1])!r}', messages)
+            length = int(header)
+            start = sp + 1
+            if length > limit:
+                if size - start < limit:
+                    break
+                text = _text(buf[start:start + limit])
+                if text:
+                    messages.append(text)
+                self.truncated += 1
+                remaining = size - start - limit
+                if remaining < length - limit:
+                    # the rest of the frame has not arrived yet
+                    self.skip = length - limit - remaining
+                    pos = size
+                    break
+                pos = start + length
+                continue
+            end = start + length
+            if end > size:
+                break
+            text = _text(buf[start:end])
+            if text:
+                messages.append(text)
+            pos = end
+        self.buf = buf[pos:]
+        return messages
+
+class FramingStats:
+    """Counters across all TCP connections of a collector process, open ones included."""
+    def __init__(self):
+        self.active = set()
+        self.connections = 0
+        self.octet_counting = 0
+        self.messages = 0
+        self.truncated = 0
+        self.errors = 0
+
+    def opened(self, framer):
+        self.active.add(framer)
+        self.connections += 1
+
+    def closed(self, framer):
+        self.active.discard(framer)
+        self.messages += framer.frames
+        self.truncated += framer.truncated
+        if framer.mode == OCTET_COUNTING:
+            self.octet_counting += 1
+
+    def stats(self):
+        active = self.active
+        return {
+            'connections': self.connections,
+            'open': len(active),
+            'octet_counting': self.octet_counting + sum(f.mode == OCTET_COUNTING for f in active),
+            'messages': self.messages + sum(f.frames for f in active),
+            'truncated': self.truncated + sum(f.truncated for f in active),
+            'errors': self.errors,
+        }
@@ -0,0 +1,77 @@
+"""
+Bounded ingestion queue between the UDP/TCP receivers and a fixed pool of consumer coroutines.
+UDP receivers use offer(), which never waits and applies the overflow policy when the queue is full.
+TCP readers use put(), which waits for space, so a full queue stops the socket from being read and
+TCP flow control slows the sender down instead of the collector buffering without limit.
+A TCP read yields a whole batch of framed messages, handed over with put_many(), which only awaits
+when the queue is full rather than once per message.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger('ingest')
+
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+SAMPLE = 'sample'
+POLICIES = (DROP_NEWEST, DROP_OLDEST, SAMPLE)
+
+class IngestQueue:
+    def __init__(self, maxsize=10000, policy=DROP_NEWEST, sample_every=10):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown overflow policy {policy!r}, expected one of {POLICIES}')
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.policy = policy
+        # with the sample policy, every Nth message arriving at a full queue replaces the oldest one
+        self.sample_every = max(1, sample_every)
+        self.enqueued = 0
+        self.dropped = 0
+        self.overflows = 0
+
+    def __len__(self):
+        return self.queue.qsize()
+
+    def offer(self, item):
+        """Non-blocking enqueue. Returns False if the item (or an older one) was dropped."""
+        q = self.queue
+        if not q.full():
+            q.put_nowait(item)
+            self.enqueued += 1
+            return True
+        self.overflows += 1
+        self.dropped += 1
+        if self.dropped % 10000 == 1:
+            logger.warning('Ingest queue full (%d), policy %s, dropped %d so far', q.maxsize, self.policy, self.dropped)
+        if self.policy == DROP_NEWEST:
+            return False
+        if self.policy == SAMPLE and self.overflows % self.sample_every:
+            return False
+        q.get_nowait()
+        q.task_done()
+        q.put_nowait(item)
+        self.enqueued += 1
+        return False
+
+    async def put(self, item):
+        """Enqueue, waiting while the queue is full (backpressure for stream sources)."""
+        await self.queue.put(item)
+        self.enqueued += 1
+
+    async def put_many(self, items):
+        """put() for a batch, in order: enqueues without yielding while there is room."""
+        q = self.queue
+        for item in items:
+            if q.full():
+                await q.put(item)
+            else:
+                q.put_nowait(item)
+        self.enqueued += len(items)
+
+    async def get(self):
+        item = await self.queue.get()
+        self.queue.task_done()
+        return item
+
+    def stats(self):
+        return {'depth': self.queue.qsize(), 'maxsize': self.queue.maxsize, 'policy': self.policy,
+                'enqueued': self.enqueued, 'dropped': self.dropped}
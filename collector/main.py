@@ -11,92 +11,369 @@ import asyncio
 import logging
 import socket
 import json
+import time
+import threading
+import multiprocessing
 from datetime import datetime
 from collector.parser import normalize_syslog
 from collector.storage import Storage
+from collector.writer import BatchWriter
+from collector.spool import Spool, SPOOL_DIR
+from collector.dedupe import DedupeCache
 from collector.analyzer import Analyzer
 from collector.alerting import Alerting
+from collector.checkpoint import Checkpointer, CHECKPOINT_DIR, CHECKPOINT_INTERVAL
+from collector.rollups import Rollup, RollupStore, ROLLUP_DB, ROLLUP_FLUSH_INTERVAL
+from collector.tail import TailBuffer, TailServer, TAIL_PORT, TAIL_HOST
+from collector.metrics import Metrics, MetricsServer, StageTimings, METRICS_PORT
+from collector.sharding import ShardRouter, run_shard
+from collector import templates
+from collector.enrich import Enricher, ENRICH_CIDR_FILE, ENRICH_RELOAD_INTERVAL
+from collector.ingest import IngestQueue
+from collector.framing import Framer, FramingError, FramingStats, TCP_READ_BYTES
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("collector")
 
-# Short in-memory dedupe cache
-RECENT_MSGS = set()
+# Seconds between pipeline stats lines in the log
+STATS_INTERVAL = float(os.getenv('STATS_INTERVAL', '60'))
 
-async def handle_udp(reader, addr, storage, analyzer, alerting):
+# Bounded queue between receivers and consumers; policy is drop_newest, drop_oldest or sample
+INGEST_QUEUE_MAX = int(os.getenv('INGEST_QUEUE_MAX', '10000'))
+INGEST_OVERFLOW_POLICY = os.getenv('INGEST_OVERFLOW_POLICY', 'drop_newest')
+INGEST_SAMPLE_EVERY = int(os.getenv('INGEST_SAMPLE_EVERY', '10'))
+INGEST_CONSUMERS = int(os.getenv('INGEST_CONSUMERS', '4'))
+
+# Seconds between runs of the storage retention job
+RETENTION_INTERVAL = float(os.getenv('RETENTION_INTERVAL', '3600'))
+
+# Capacity of each analyzer shard's inbox in --workers mode
+SHARD_QUEUE_MAX = int(os.getenv('SHARD_QUEUE_MAX', '100000'))
+
+# Short in-memory dedupe cache (time-bounded, oldest first seen evicted first)
+DEDUPE_TTL = float(os.getenv('DEDUPE_TTL', '60'))
+DEDUPE_MAX_ENTRIES = int(os.getenv('DEDUPE_MAX_ENTRIES', '10000'))
+RECENT_MSGS = DedupeCache(ttl=DEDUPE_TTL, max_entries=DEDUPE_MAX_ENTRIES)
+
+# Receive-path stage latencies, for a sample of messages (served on /metrics)
+STAGE = StageTimings()
+
+# Framing counters over all TCP connections
+TCP_FRAMING = FramingStats()
+
+async def handle_udp(reader, addr, writer, analyzer, alerting):
     data, (ip, port) = reader
     text = data.decode(errors='ignore').strip()
-    await process_message(text, ip, storage, analyzer, alerting)
+    await process_message(text, ip, writer, analyzer, alerting)
 
-async def process_message(raw, src_ip, storage, analyzer, alerting):
-    # dedupe window: small set; production should use LRU with TTL
-    key = (raw, src_ip)
-    if key in RECENT_MSGS:
+async def process_message(raw, src_ip, writer, analyzer, alerting, observers=(), enricher=None):
+    # None unless this message is one of the sampled ones whose stages get timed
+    clock = STAGE.clock()
+    # drop relay retransmits seen within the dedupe window
+    duplicate = RECENT_MSGS.seen(raw, src_ip)
+    if clock is not None:
+        clock.mark(STAGE.dedupe)
+    if duplicate:
         return
-    RECENT_MSGS.add(key)
-    # Limit cache size - remove oldest when exceeding limit
-    if len(RECENT_MSGS) > 10000:
-        # Create new set with recent items to maintain reasonable size
-        oldest = list(RECENT_MSGS)[:5000]
-        for item in oldest:
-            RECENT_MSGS.discard(item)
 
     ts = datetime.utcnow().isoformat() + 'Z'
     normalized = normalize_syslog(raw, src_ip, ts)
-    # store
-    storage.index(normalized)
+    if clock is not None:
+        clock.mark(STAGE.parse)
+    # tag the source IP with its subnet/site/owner before anything stores or analyzes the doc
+    if enricher is not None:
+        enricher.enrich(normalized)
+        if clock is not None:
+            clock.mark(STAGE.enrich)
+    # store (batched, flushed off the event loop)
+    writer.submit(normalized)
+    if clock is not None:
+        clock.mark(STAGE.submit)
+    # in-memory consumers of every doc (rollups, ...); must be cheap, they run on the event loop
+    for observe in observers:
+        observe(normalized)
+    if clock is not None:
+        clock.mark(STAGE.observe)
     # analyze
-    alert = analyzer.process(normalized)
-    if alert:
+    alerts = analyzer.process_all(normalized)
+    if clock is not None:
+        clock.mark(STAGE.analyze)
+    for alert in alerts:
         alerting.send(alert)
+    if alerts and clock is not None:
+        clock.mark(STAGE.alert)
+
+async def consume(ingest, writer, analyzer, alerting, observers=(), enricher=None):
+    while True:
+        raw, src_ip = await ingest.get()
+        try:
+            await process_message(raw, src_ip, writer, analyzer, alerting, observers, enricher)
+        except Exception as e:
+            logger.exception('Failed to process message from %s: %s', src_ip, e)
+
+async def checkpoint_state(checkpointer):
+    # runs on the event loop, the same thread as the consumers, so the analyzer is never read mid-update
+    while True:
+        await asyncio.sleep(checkpointer.interval)
+        checkpointer.save()
+
+async def save_templates(miner, path):
+    # the snapshot is taken on the loop, which is the only thread mining; the file write is not
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        try:
+            await loop.run_in_executor(None, miner.save, path, miner.snapshot())
+        except Exception as e:
+            logger.exception('Saving log templates to %s failed: %s', path, e)
+
+async def reload_assets(enricher):
+    # the file is parsed on a worker thread; the swap happens here on the loop, between two messages
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(ENRICH_RELOAD_INTERVAL)
+        if enricher.changed():
+            table = await loop.run_in_executor(None, enricher.load_changed)
+            if table is not None:
+                enricher.reload(table)
+
+async def enforce_retention(storage):
+    # dropping partitions holds the storage lock, so keep it off the event loop
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, storage.drop_expired)
+        except Exception as e:
+            logger.exception('Retention job failed: %s', e)
+        await asyncio.sleep(RETENTION_INTERVAL)
+
+async def flush_rollups(rollup, store):
+    # closed minutes are collected on the loop (cheap) and written from a worker thread
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(ROLLUP_FLUSH_INTERVAL)
+        minute_rows, hour_rows = rollup.drain()
+        try:
+            await loop.run_in_executor(None, store.write, minute_rows, hour_rows)
+            await loop.run_in_executor(None, store.prune)
+        except Exception as e:
+            logger.exception('Rollup flush of %d rows failed: %s', len(minute_rows) + len(hour_rows), e)
+
+async def report_stats(components):
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        for name, component in components.items():
+            logger.info('%s stats: %s', name, json.dumps(component.stats()))
 
 class UDPServerProtocol(asyncio.DatagramProtocol):
-    def __init__(self, storage, analyzer, alerting):
-        self.storage = storage
-        self.analyzer = analyzer
-        self.alerting = alerting
+    def __init__(self, ingest):
+        self.ingest = ingest
 
     def datagram_received(self, data, addr):
+        clock = STAGE.decode_clock()
         text = data.decode(errors='ignore').strip()
+        if clock is not None:
+            clock.mark(STAGE.decode)
         src_ip = addr[0]
-        asyncio.create_task(process_message(text, src_ip, self.storage, self.analyzer, self.alerting))
+        # never waits: a full queue applies the overflow policy
+        self.ingest.offer((text, src_ip))
 
-async def tcp_client_handler(reader, writer, storage, analyzer, alerting):
-    peer = writer.get_extra_info('peername')
+async def tcp_client_handler(reader, conn, ingest):
+    peer = conn.get_extra_info('peername')
     src_ip = peer[0] if peer else 'unknown'
-    while True:
-        data = await reader.readline()
-        if not data:
-            break
-        text = data.decode(errors='ignore').strip()
-        await process_message(text, src_ip, storage, analyzer, alerting)
-    writer.close()
-    await writer.wait_closed()
+    framer = Framer()
+    TCP_FRAMING.opened(framer)
+    try:
+        while True:
+            data = await reader.read(TCP_READ_BYTES)
+            if not data:
+                messages = framer.flush()
+            else:
+                clock = STAGE.decode_clock()
+                messages = framer.feed(data)
+                if clock is not None and messages:
+                    # one sample per read: the per-message share of splitting and decoding the chunk
+                    STAGE.decode.observe((time.perf_counter() - clock.last) / len(messages))
+            if messages:
+                # waits while the queue is full, so the socket stops being read and the sender is throttled
+                await ingest.put_many([(text, src_ip) for text in messages])
+            if not data:
+                break
+    except FramingError as e:
+        TCP_FRAMING.errors += 1
+        logger.warning('Closing TCP connection from %s: %s', src_ip, e)
+        if e.messages:
+            await ingest.put_many([(text, src_ip) for text in e.messages])
+    finally:
+        TCP_FRAMING.closed(framer)
+    conn.close()
+    await conn.wait_closed()
 
-async def start_servers(udp_port, tcp_port, es_host):
+async def start_servers(udp_port, tcp_port, es_host, shard=None):
+    """Run the collector. shard is (index, inboxes) when running as one of several worker processes."""
+    started = time.monotonic()
     storage = Storage(es_host=es_host)
+    spool = None
+    if SPOOL_DIR:
+        # segment files are single-writer, so each worker process spools to its own directory
+        spool = Spool(SPOOL_DIR if shard is None else os.path.join(SPOOL_DIR, f'worker-{shard[0]}'))
+    writer = BatchWriter(storage, spool=spool).start()
     analyzer = Analyzer(storage)
     alerting = Alerting()
+    checkpointer = None
+    if CHECKPOINT_DIR:
+        # each shard owns its own slice of the window state, so each keeps its own checkpoint files
+        prefix = 'analyzer' if shard is None else f'analyzer-{shard[0]}'
+        checkpointer = Checkpointer(analyzer, prefix=prefix)
+        checkpointer.load()
+    miner = templates.MINER
+    templates_path = None
+    if miner is not None and CHECKPOINT_DIR:
+        # learned templates survive restarts; each worker learns from its own traffic, ids agree anyway
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        templates_path = os.path.join(CHECKPOINT_DIR, 'templates.json' if shard is None else f'templates-{shard[0]}.json')
+        miner.load(templates_path)
+    enricher = Enricher(ENRICH_CIDR_FILE) if ENRICH_CIDR_FILE else None
+    reuse_port = None
+    shard_thread = None
+    # what the pipeline hands events to: the analyzer itself, or in a worker the router to the owning shard
+    router = analyzer
+    if shard is not None:
+        index, inboxes = shard
+        # this worker's shard consumes routed events on its own thread; the pipeline only routes
+        shard_thread = threading.Thread(target=run_shard, args=(analyzer, alerting, inboxes[index], checkpointer), name='analyzer-shard', daemon=True)
+        shard_thread.start()
+        router = ShardRouter(inboxes, analyzer.event_types)
+        reuse_port = True
+
+    observers = []
+    components = {}
+    rollup = None
+    if ROLLUP_DB:
+        rollup = Rollup()
+        rollup_store = RollupStore(ROLLUP_DB)
+        observers.append(rollup.observe)
+        components['rollups'] = rollup
+    tail = None
+    if TAIL_PORT:
+        buffer = TailBuffer()
+        observers.append(buffer.append)
+        # each worker tails the share of traffic it receives, on its own port
+        tail_port = TAIL_PORT if shard is None else TAIL_PORT + shard[0]
+        tail = await TailServer(buffer).start(port=tail_port)
+        components['tail'] = tail
+        logger.info('Live tail on http://%s:%d/tail', TAIL_HOST, tail_port)
+
+    ingest = IngestQueue(INGEST_QUEUE_MAX, INGEST_OVERFLOW_POLICY, INGEST_SAMPLE_EVERY)
+    tasks = [asyncio.create_task(consume(ingest, writer, router, alerting, observers, enricher)) for _ in range(INGEST_CONSUMERS)]
+    if rollup is not None:
+        tasks.append(asyncio.create_task(flush_rollups(rollup, rollup_store)))
+    if checkpointer is not None and shard is None:
+        tasks.append(asyncio.create_task(checkpoint_state(checkpointer)))
+    if templates_path is not None:
+        tasks.append(asyncio.create_task(save_templates(miner, templates_path)))
+    if enricher is not None:
+        tasks.append(asyncio.create_task(reload_assets(enricher)))
+    if shard is None or shard[0] == 0:
+        # workers share one database, so only the first runs retention
+        tasks.append(asyncio.create_task(enforce_retention(storage)))
 
     loop = asyncio.get_running_loop()
     udp_transport, udp_proto = await loop.create_datagram_endpoint(
-        lambda: UDPServerProtocol(storage, analyzer, alerting),
-        local_addr=('0.0.0.0', udp_port))
+        lambda: UDPServerProtocol(ingest),
+        local_addr=('0.0.0.0', udp_port), reuse_port=reuse_port)
 
-    server = await asyncio.start_server(lambda r, w: tcp_client_handler(r, w, storage, analyzer, alerting), '0.0.0.0', tcp_port)
+    server = await asyncio.start_server(lambda r, w: tcp_client_handler(r, w, ingest), '0.0.0.0', tcp_port, reuse_port=reuse_port)
+    components.update({'ingest': ingest, 'tcp': TCP_FRAMING, 'writer': writer, 'dedupe': RECENT_MSGS, 'alerting': alerting, 'analyzer': analyzer})
+    if router is not analyzer:
+        # the shard's own window and sketch state is reported under 'analyzer' as in a single process; its
+        # stats are plain counters and sizes, safe to read while the shard thread updates them
+        components['router'] = router
+    if miner is not None:
+        components['templates'] = miner
+    if enricher is not None:
+        components['enrich'] = enricher
+    metrics_server = None
+    if METRICS_PORT:
+        metrics = Metrics(components, STAGE)
+        metrics.add_histogram('collector_storage_flush_seconds', writer.flush_seconds, 'Storage batch write latency')
+        # like the tail, each worker serves its own process's metrics on its own port
+        metrics_port = METRICS_PORT if shard is None else METRICS_PORT + shard[0]
+        metrics_server = await MetricsServer(metrics).start(port=metrics_port)
+        logger.info('Metrics on http://0.0.0.0:%d/metrics, sampled profiles on /profile?seconds=N', metrics_port)
+    tasks.append(asyncio.create_task(report_stats(components)))
 
     logger.info(f"UDP server listening on 0.0.0.0:{udp_port}, TCP on 0.0.0.0:{tcp_port}")
+    logger.info('Collector ready in %.2fs', time.monotonic() - started)
 
-    async with server:
-        await server.serve_forever()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+        udp_transport.close()
+        if tail is not None:
+            tail.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        if templates_path is not None:
+            miner.save(templates_path)
+        if rollup is not None:
+            # the current, still open minute too; a restart adds to it rather than overwriting
+            rollup_store.write(*rollup.drain(everything=True))
+        if shard_thread is not None:
+            # the shard thread writes its final checkpoint when it sees the sentinel
+            inboxes[index].put(None)
+            shard_thread.join(30)
+        elif checkpointer is not None:
+            checkpointer.save()
+            checkpointer.wait()
+        # drain pending docs to storage and pending alerts to their sinks before exit
+        writer.stop()
+        alerting.close()
+
+def run_worker(index, inboxes, udp_port, tcp_port, es_host):
+    try:
+        asyncio.run(start_servers(udp_port, tcp_port, es_host, shard=(index, inboxes)))
+    except KeyboardInterrupt:
+        pass
+
+def run_workers(workers, udp_port, tcp_port, es_host):
+    """Fork N workers that share the listening ports via SO_REUSEPORT, each owning one analyzer shard."""
+    inboxes = [multiprocessing.Queue(maxsize=SHARD_QUEUE_MAX) for _ in range(workers)]
+    procs = []
+    for i in range(workers):
+        p = multiprocessing.Process(target=run_worker, args=(i, inboxes, udp_port, tcp_port, es_host), name=f'collector-{i}')
+        p.start()
+        procs.append(p)
+    logger.info('Started %d collector workers', workers)
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        logger.info('Shutting down workers')
+        for p in procs:
+            p.join(10)
+            if p.is_alive():
+                p.terminate()
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['replay']:
+        # offline mode: python collector/main.py replay FILE... (see collector/replay.py)
+        from collector.replay import main as replay_main
+        replay_main(sys.argv[2:])
+        sys.exit(0)
     parser = argparse.ArgumentParser()
     parser.add_argument('--udp-port', type=int, default=5514)
     parser.add_argument('--tcp-port', type=int, default=5514)
     parser.add_argument('--es-host', type=str, default='http://localhost:9200')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes sharing the ports via SO_REUSEPORT')
     args = parser.parse_args()
 
+    if args.workers > 1:
+        run_workers(args.workers, args.udp_port, args.tcp_port, args.es_host)
+        sys.exit(0)
     try:
         asyncio.run(start_servers(args.udp_port, args.tcp_port, args.es_host))
     except KeyboardInterrupt:
@@ -0,0 +1,271 @@
+"""
+Collector metrics in the Prometheus text format, served over HTTP (GET /metrics), plus an on-demand
+sampling profiler (GET /profile?seconds=N).
+- Per-stage latency histograms for the receive path (decode, dedupe, parse, asset enrichment, submit to the
+  writer, observers, analyze, alert dispatch). Timing is sampled: one message in METRICS_SAMPLE_EVERY is timed, so the cost on the
+  hot path is a counter increment for the rest. Storage batch flushes are timed individually by the writer.
+- Every number in the components' stats() (the same dicts the periodic stats log line prints) is exported at
+  scrape time: queue depths, dedupe cache size, analyzer window state per rule, writer/alert counters, ...
+  Nothing is kept up to date in between; a scrape costs what one stats line does.
+- The profiler is off until asked for: a thread samples the event loop's stack (or every thread's) at a fixed
+  interval for N seconds and returns collapsed stacks ("frame;frame;frame count" lines, the input format of
+  flamegraph.pl and speedscope).
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger('metrics')
+
+# Configure via environment variables
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9516') or 0)
+METRICS_SAMPLE_EVERY = int(os.getenv('METRICS_SAMPLE_EVERY', '10'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '300'))
+
+# latency bucket upper bounds in seconds, 5us .. 2.5s
+BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+STAGES = ('decode', 'dedupe', 'parse', 'enrich', 'submit', 'observe', 'analyze', 'alert')
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        # counts[i] is observations <= bounds[i] and > bounds[i - 1]; the last slot is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+class StageClock:
+    """Times consecutive stages of one message: each mark() records the time since the previous one."""
+    __slots__ = ('last',)
+
+    def __init__(self):
+        self.last = time.perf_counter()
+
+    def mark(self, histogram):
+        now = time.perf_counter()
+        histogram.observe(now - self.last)
+        self.last = now
+
+class StageTimings:
+    """One histogram per receive-path stage, as attributes (STAGES names)."""
+    def __init__(self, sample_every=METRICS_SAMPLE_EVERY):
+        self.sample_every = max(1, sample_every)
+        self.calls = 0
+        self.decodes = 0
+        for stage in STAGES:
+            setattr(self, stage, Histogram())
+
+    def clock(self):
+        """A started StageClock for one call in sample_every, else None (the caller skips timing)."""
+        self.calls += 1
+        if self.calls % self.sample_every:
+            return None
+        return StageClock()
+
+    def decode_clock(self):
+        # receivers count separately: sharing clock()'s counter could phase-lock with the consumers
+        # and leave one side never sampled
+        self.decodes += 1
+        if self.decodes % self.sample_every:
+            return None
+        return StageClock()
+
+    def histograms(self):
+        return {stage: getattr(self, stage) for stage in STAGES}
+
+def _value(v):
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels.items()) + '}'
+
+def render_histogram(name, histogram, labels=None):
+    labels = labels or {}
+    lines = []
+    cumulative = 0
+    for bound, n in zip(histogram.bounds + (float('inf'),), histogram.counts):
+        cumulative += n
+        lines.append(f'{name}_bucket{_labels({**labels, "le": _value(bound)})} {cumulative}')
+    lines.append(f'{name}_sum{_labels(labels)} {_value(histogram.sum)}')
+    lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return lines
+
+def render_stats(component, stats):
+    """Numeric stats as samples named collector_<component>_<key>; a nested dict of numbers (per rule, per
+    sink, ...) becomes a `name` label. Strings are skipped."""
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            for field, v in _numbers(value):
+                lines.append(f'collector_{component}_{field}{_labels({"name": key})} {_value(v)}')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f'collector_{component}_{key} {_value(value)}')
+    return lines
+
+def _numbers(d):
+    return [(k, v) for k, v in d.items() if isinstance(v, (int, float)) and not isinstance(v, bool)]
+
+class Metrics:
+    """What GET /metrics returns: stage timings, extra histograms, and the components' stats()."""
+    def __init__(self, components, stages=None):
+        # name -> object with stats(); the collector passes the same dict its stats log line reads
+        self.components = components
+        self.stages = stages
+        self.histograms = []
+        self.started = time.monotonic()
+
+    def add_histogram(self, name, histogram, help_text, labels=None):
+        self.histograms.append((name, histogram, help_text, labels))
+
+    def render(self):
+        lines = [
+            '# TYPE collector_uptime_seconds gauge',
+            f'collector_uptime_seconds {time.monotonic() - self.started:.3f}',
+            '# TYPE process_cpu_seconds_total counter',
+            f'process_cpu_seconds_total {time.process_time():.3f}',
+        ]
+        if self.stages is not None:
+            lines.append('# HELP collector_stage_seconds Receive-path stage latency, sampled 1 in %d messages' % self.stages.sample_every)
+            lines.append('# TYPE collector_stage_seconds histogram')
+            for stage, histogram in self.stages.histograms().items():
+                lines.extend(render_histogram('collector_stage_seconds', histogram, {'stage': stage}))
+        for name, histogram, help_text, labels in self.histograms:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            lines.extend(render_histogram(name, histogram, labels))
+        for component, obj in self.components.items():
+            try:
+                lines.extend(render_stats(component, obj.stats()))
+            except Exception as e:
+                logger.warning('Could not collect %s stats: %s', component, e)
+        return '\n'.join(lines) + '\n'
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+class Profiler:
+    """Sampling profiler: a background thread records the stack of the target thread (or of every other
+    thread) each `interval` seconds. At most one profile runs at a time."""
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.running = False
+        self.profiles = 0
+
+    def sample(self, seconds, thread_id=None):
+        """Blocking: sample for `seconds` and return {collapsed stack: count}. thread_id None means every
+        thread but the sampler itself; stacks are then rooted at the thread's name."""
+        with self.lock:
+            if self.running:
+                raise RuntimeError('a profile is already running')
+            self.running = True
+        try:
+            return self._sample(min(seconds, PROFILE_MAX_SECONDS), thread_id)
+        finally:
+            self.running = False
+            self.profiles += 1
+
+    def _sample(self, seconds, thread_id):
+        me = threading.get_ident()
+        counts = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (thread_id is not None and ident != thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if thread_id is None:
+                    stack.append(names.get(ident, str(ident)))
+                counts[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        return counts
+
+def collapsed(counts):
+    return ''.join(f'{stack} {n}\n' for stack, n in counts.most_common())
+
+class MetricsServer:
+    """Minimal HTTP server for GET /metrics and GET /profile?seconds=N[&threads=all]."""
+    def __init__(self, metrics, profiler=None):
+        self.metrics = metrics
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.scrapes = 0
+        self.server = None
+
+    async def start(self, host='0.0.0.0', port=METRICS_PORT):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        parts = request.decode('latin-1').split('\r\n')[0].split()
+        url = urlsplit(parts[1]) if len(parts) == 3 and parts[0] == 'GET' else None
+        if url is not None and url.path == '/metrics':
+            self.scrapes += 1
+            await self._reply(writer, '200 OK', self.metrics.render(), 'text/plain; version=0.0.4')
+        elif url is not None and url.path == '/profile':
+            await self._profile(writer, {k: v[0] for k, v in parse_qs(url.query).items()})
+        else:
+            await self._reply(writer, '404 Not Found', 'not found\n')
+
+    async def _profile(self, writer, args):
+        try:
+            seconds = float(args.get('seconds', '10'))
+        except ValueError:
+            await self._reply(writer, '400 Bad Request', 'bad seconds\n')
+            return
+        # the handler runs on the event loop thread, which is what we profile unless asked for all threads
+        thread_id = None if args.get('threads') == 'all' else threading.get_ident()
+        loop = asyncio.get_running_loop()
+        try:
+            counts = await loop.run_in_executor(None, self.profiler.sample, seconds, thread_id)
+        except RuntimeError as e:
+            await self._reply(writer, '409 Conflict', f'{e}\n')
+            return
+        await self._reply(writer, '200 OK', collapsed(counts))
+
+    async def _reply(self, writer, status, body, content_type='text/plain'):
+        data = body.encode()
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode() + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def stats(self):
+        return {'scrapes': self.scrapes, 'profiles': self.profiler.profiles}
@@ -2,79 +2,233 @@
 Normalize various syslog formats into JSON documents with a consistent schema.
 This includes parsing timestamps, host, program, pid, message, and extracting fields from common message types.
 """
+import os
 import re
+from datetime import datetime, timezone
 from dateutil import parser as dateparser
+from collector.event import LogEvent
+from collector import templates
 
 # Example schema keys: timestamp, src_ip, host, program, pid, severity, message, parsed
+# Docs are LogEvent objects (collector/event.py), which behave like dicts with these keys
 
-RE_SYSLOG = re.compile(r'^(?:<\d+>)?(?:(?P<timestamp>\w{3}\s+\d+\s+\d{2}:\d{2}:\d{2})\s+)?(?P<host>[^\s]+)\s+(?P<rest>.+)$')
+RE_SYSLOG = re.compile(r'^(?:<\d+>)?(?:(?P<timestamp>\w{3}\s+\d+\s+\d{2}:\d{2}:\d{2}|\d{4}-\d{2}-\d{2}T\S+)\s+)?(?P<host>[^\s]+)\s+(?P<rest>.+)$', re.S)
+# RFC5424: <PRI>VERSION TIMESTAMP HOSTNAME APP-NAME PROCID MSGID STRUCTURED-DATA MSG
+RE_RFC5424 = re.compile(r'^<\d+>\d{1,2} (?P<timestamp>\S+) (?P<host>\S+) (?P<app>\S+) (?P<procid>\S+) (?P<msgid>\S+) (?P<sd>-|(?:\[(?:[^\]\\]|\\.)*\])+)(?: (?P<msg>.*))?$', re.S)
+RE_PROGRAM = re.compile(r'(?P<prog>[\w/\-\.]+)(?:\[(?P<pid>\d+)\])?:\s*(?P<msg>.*)', re.S)
+
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+# Consecutive messages mostly share a timestamp, so remember the last few conversions
+_TS_MEMO = {}
+_TS_MEMO_MAX = 256
 
 SSH_FAILED = re.compile(r'Failed password for (?:invalid user )?(?P<user>[^\s]+) from (?P<ip>[\d.]+)')
 SSH_SUCCESS = re.compile(r'Accepted (?:password|publickey) for (?P<user>[^\s]+) from (?P<ip>[\d.]+)')
 
 CISCO_LOGIN = re.compile(r'%SEC-.*line.*: Login Authentication for user (?P<user>[^,]+), src (?P<ip>[\d.]+)')
 
+def _infer_year(month, now):
+    # RFC3164 timestamps carry no year: a December message arriving in January belongs to last year
+    if month > now.month + 1:
+        return now.year - 1
+    return now.year
+
+def parse_rfc3164_timestamp(ts, now=None):
+    """Parse 'Mmm dd hh:mm:ss' into an ISO string, inferring the year. Returns None if malformed."""
+    now = now or datetime.utcnow()
+    memo_key = (ts, now.year, now.month)
+    iso = _TS_MEMO.get(memo_key)
+    if iso is not None:
+        return iso
+    parts = ts.split()
+    if len(parts) != 3:
+        return None
+    month = MONTHS.get(parts[0].title())
+    if month is None:
+        return None
+    try:
+        hh, mm, ss = parts[2].split(':')
+        dt = datetime(_infer_year(month, now), month, int(parts[1]), int(hh), int(mm), int(ss))
+    except ValueError:
+        return None
+    iso = dt.isoformat()
+    if len(_TS_MEMO) >= _TS_MEMO_MAX:
+        _TS_MEMO.clear()
+    _TS_MEMO[memo_key] = iso
+    return iso
+
+def parse_timestamp(ts, now=None):
+    """Fast path for RFC3164 and ISO 8601 / RFC5424 timestamps; dateutil only for anything else.
+    Timestamps with a UTC offset come back converted to UTC (+00:00).
+    now is the reference time for inferring RFC3164 years (default: the current time)."""
+    if ts[:1].isdigit():
+        try:
+            return _utc(datetime.fromisoformat(ts)).isoformat()
+        except ValueError:
+            pass
+    else:
+        iso = parse_rfc3164_timestamp(ts, now)
+        if iso is not None:
+            return iso
+    return _utc(dateparser.parse(ts)).isoformat()
+
+def _utc(dt):
+    # stored timestamps are compared as strings and cut into partition keys, so offsets become UTC;
+    # headers without a zone are already taken as UTC
+    offset = dt.utcoffset()
+    if offset:
+        return dt.astimezone(timezone.utc)
+    return dt
+
+LogEvent.parse_timestamp = staticmethod(parse_timestamp)
+
 def normalize_syslog(raw, src_ip, received_ts):
+    # RFC5424 messages carry app-name and procid as header fields
+    if raw[:1] == '<':
+        m5 = RE_RFC5424.match(raw)
+        if m5:
+            return _normalize_rfc5424(m5, raw, src_ip, received_ts)
     # Try to split into timestamp, host, rest
     m = RE_SYSLOG.match(raw)
-    doc = {
-        'raw': raw,
-        'src_ip': src_ip,
-        'received_ts': received_ts,
-        'timestamp': None,
-        'host': None,
-        'program': None,
-        'pid': None,
-        'severity': None,
-        'message': None,
-        'parsed': {}
-    }
     if m:
-        ts = m.group('timestamp')
-        host = m.group('host')
-        rest = m.group('rest')
-        doc['host'] = host
-        doc['message'] = rest
-        if ts:
-            # parse syslog timestamp (no year) => assume current year
-            try:
-                dt = dateparser.parse(ts)
-                doc['timestamp'] = dt.isoformat()
-            except Exception:
-                doc['timestamp'] = received_ts
-        else:
-            doc['timestamp'] = received_ts
+        # the timestamp is converted lazily, on first read of doc['timestamp']
+        doc = LogEvent(raw, src_ip, received_ts, m.group('timestamp'), m.group('host'), msg_at=m.start('rest'))
     else:
-        doc['message'] = raw
-        doc['timestamp'] = received_ts
+        doc = LogEvent(raw, src_ip, received_ts)
 
     # Extract program/pid if present like: program[123]: message
-    prog = re.match(r'(?P<prog>[\w/\-\.]+)(?:\[(?P<pid>\d+)\])?:\s*(?P<msg>.*)', doc['message'])
+    # (matched in place; the message is kept as an offset into raw)
+    prog = RE_PROGRAM.match(raw, doc._msg_at)
     if prog:
-        doc['program'] = prog.group('prog')
-        doc['pid'] = prog.group('pid')
-        doc['message'] = prog.group('msg')
-
-    # Pattern matches
-    m1 = SSH_FAILED.search(doc['message'])
-    if m1:
-        doc['parsed']['event_type'] = 'ssh_failed'
-        doc['parsed']['user'] = m1.group('user')
-        doc['parsed']['src_ip'] = m1.group('ip')
-        return doc
-    m2 = SSH_SUCCESS.search(doc['message'])
-    if m2:
-        doc['parsed']['event_type'] = 'ssh_success'
-        doc['parsed']['user'] = m2.group('user')
-        doc['parsed']['src_ip'] = m2.group('ip')
-        return doc
-    m3 = CISCO_LOGIN.search(doc['message'])
-    if m3:
-        doc['parsed']['event_type'] = 'cisco_login'
-        doc['parsed']['user'] = m3.group('user')
-        doc['parsed']['src_ip'] = m3.group('ip')
-        return doc
-
-    # Fallback: no structured parse
-    doc['parsed']['event_type'] = 'unclassified'
+        doc.program = prog.group('prog')
+        doc.pid = prog.group('pid')
+        doc._msg_at = prog.start('msg')
+
+    return _classify(doc)
+
+def _normalize_rfc5424(m, raw, src_ip, received_ts):
+    app = m.group('app')
+    procid = m.group('procid')
+    host = m.group('host')
+    ts = m.group('timestamp')
+    msg_at = m.start('msg')
+    doc = LogEvent(raw, src_ip, received_ts, None if ts == '-' else ts, None if host == '-' else host,
+                   None if app == '-' else app, None if procid == '-' else procid, len(raw) if msg_at < 0 else msg_at)
+    return _classify(doc)
+
+def _classify(doc):
+    # the extractor's dict becomes doc['parsed'] as is
+    parsed = REGISTRY.classify(doc.program, doc.message)
+    if parsed is None:
+        # no extractor knows it: still 'unclassified', plus its mined template (collector/templates.py)
+        miner = templates.MINER
+        parsed = miner.match(doc.program, doc.message) if miner is not None else {'event_type': 'unclassified'}
+    doc.parsed = parsed
     return doc
+
+class Extractor:
+    """One event type: a regex plus literals, at least one of which must appear in a message for the regex to run.
+    The first word of each literal must appear in the message as a whole whitespace-separated token.
+    fields maps output keys in doc['parsed'] to regex group names."""
+    def __init__(self, event_type, pattern, literals, fields=None):
+        self.event_type = event_type
+        self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        self.literals = tuple(literals)
+        self.fields = fields or {'user': 'user', 'src_ip': 'ip'}
+
+    def extract(self, message):
+        m = self.pattern.search(message)
+        if not m:
+            return None
+        parsed = {'event_type': self.event_type}
+        for key, group in self.fields.items():
+            parsed[key] = m.group(group)
+        return parsed
+
+class _Bucket:
+    # Extractors sharing a dispatch key, prefiltered by literal. Literals are indexed by their first word,
+    # so finding candidates is one set intersection with the message's tokens no matter how many extractors exist.
+    def __init__(self):
+        self.extractors = []
+        self.by_anchor = {}
+
+    def add(self, extractor):
+        self.extractors.append(extractor)
+        for lit in extractor.literals:
+            self.by_anchor.setdefault(lit.split()[0], []).append((lit, extractor))
+
+    def classify(self, message, tokens):
+        anchors = self.by_anchor.keys() & tokens
+        if not anchors:
+            return None
+        candidates = set()
+        for anchor in anchors:
+            for lit, ex in self.by_anchor[anchor]:
+                if lit in message:
+                    candidates.add(ex)
+        # keep registration order so earlier extractors win ties
+        for ex in self.extractors:
+            if ex in candidates:
+                parsed = ex.extract(message)
+                if parsed:
+                    return parsed
+        return None
+
+class ExtractorRegistry:
+    """Extractors indexed by program name (e.g. sshd) and by Cisco-style %FACILITY- message tag.
+    A message is only checked against the buckets for its own program/facility, plus any generic extractors."""
+    def __init__(self):
+        self.by_program = {}
+        self.by_facility = {}
+        self.generic = _Bucket()
+
+    def register(self, extractor, programs=(), facilities=()):
+        for prog in programs:
+            self.by_program.setdefault(prog, _Bucket()).add(extractor)
+        for fac in facilities:
+            self.by_facility.setdefault(fac, _Bucket()).add(extractor)
+        if not programs and not facilities:
+            self.generic.add(extractor)
+        return extractor
+
+    def classify(self, program, message):
+        tokens = None
+        if program is not None:
+            bucket = self.by_program.get(program)
+            if bucket is None and '/' in program:
+                # logged as a full path, e.g. /usr/sbin/sshd
+                bucket = self.by_program.get(os.path.basename(program))
+            if bucket is not None:
+                tokens = set(message.split())
+                parsed = bucket.classify(message, tokens)
+                if parsed:
+                    return parsed
+        if self.by_facility:
+            # every %FACILITY-SEVERITY-MNEMONIC candidate: a '%' may also appear before the real tag
+            i = message.find('%')
+            while i >= 0:
+                j = message.find('-', i)
+                if j < 0:
+                    break
+                bucket = self.by_facility.get(message[i + 1:j])
+                if bucket is not None:
+                    tokens = tokens or set(message.split())
+                    parsed = bucket.classify(message, tokens)
+                    if parsed:
+                        return parsed
+                i = message.find('%', i + 1)
+        if self.generic.extractors:
+            return self.generic.classify(message, tokens or set(message.split()))
+        return None
+
+REGISTRY = ExtractorRegistry()
+
+def register_extractor(event_type, pattern, literals, programs=(), facilities=(), fields=None):
+    return REGISTRY.register(Extractor(event_type, pattern, literals, fields), programs, facilities)
+
+SSHD_PROGRAMS = ('sshd', 'sshd-session')
+register_extractor('ssh_failed', SSH_FAILED, ['Failed password'], programs=SSHD_PROGRAMS)
+register_extractor('ssh_success', SSH_SUCCESS, ['Accepted password', 'Accepted publickey'], programs=SSHD_PROGRAMS)
+register_extractor('cisco_login', CISCO_LOGIN, ['Login Authentication'], facilities=['SEC'])
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Offline replay of archived syslog files (plain or gzip) through the parser, the analyzer and storage.
+Usage: python collector/main.py replay [--workers N] [--es-host URL] [--no-store] [--send-alerts] FILE...
+
+Files are read in newline-aligned blocks of REPLAY_CHUNK_BYTES. A process pool normalizes the blocks,
+with a bounded number in flight per file so memory stays flat on multi-GB archives, and returns each
+block's docs sorted by event time; the blocks of several files are merged by timestamp, so the analyzer
+sees one event-time ordered stream (rule windows use event time, not replay time). Docs are written
+with Storage.index_many from a writer thread, overlapping storage I/O with analysis.
+RFC3164 timestamps carry no year; it is inferred relative to each file's mtime rather than today.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import gzip
+import time
+import heapq
+import queue
+import logging
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from datetime import datetime
+from collector.parser import normalize_syslog
+
+logger = logging.getLogger('replay')
+
+# Configure via environment variables
+REPLAY_WORKERS = int(os.getenv('REPLAY_WORKERS', '0')) or os.cpu_count() or 1
+REPLAY_CHUNK_BYTES = int(os.getenv('REPLAY_CHUNK_BYTES', str(4 * 1024 * 1024)))
+REPLAY_PROGRESS_INTERVAL = float(os.getenv('REPLAY_PROGRESS_INTERVAL', '5'))
+
+# sender address recorded for replayed lines, which carry none
+REPLAY_SRC_IP = '0.0.0.0'
+_STOP = object()
+
+def open_log(path):
+    """Binary file object for a plain or gzip-compressed log (detected by magic bytes, not extension)."""
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    return gzip.open(path, 'rb') if magic == b'\x1f\x8b' else open(path, 'rb')
+
+def read_blocks(path, chunk_bytes=REPLAY_CHUNK_BYTES):
+    """Yield blocks of whole lines, about chunk_bytes each."""
+    with open_log(path) as f:
+        tail = b''
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            data = tail + data
+            cut = data.rfind(b'\n') + 1
+            if cut == 0:
+                tail = data
+                continue
+            tail = data[cut:]
+            yield data[:cut]
+        if tail:
+            yield tail
+
+def _event_time(doc):
+    return doc.timestamp
+
+def parse_block(block, src_ip, received_ts, reference):
+    """Pool worker: normalize one block. Returns (lines, docs sorted by event time)."""
+    now = datetime.fromisoformat(reference)
+    docs = []
+    lines = block.decode('utf-8', errors='ignore').splitlines()
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        doc = normalize_syslog(line, src_ip, received_ts)
+        doc.resolve_timestamp(now)
+        docs.append(doc)
+    docs.sort(key=_event_time)
+    return len(lines), docs
+
+class _Inline:
+    # stands in for a pool when running with one worker
+    def apply_async(self, fn, args):
+        return _Done(fn(*args))
+
+class _Done:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+class Replay:
+    """One replay run over a set of files; counters are read through stats()."""
+    def __init__(self, analyzer, storage=None, alerting=None, workers=REPLAY_WORKERS, chunk_bytes=REPLAY_CHUNK_BYTES,
+                 src_ip=REPLAY_SRC_IP, progress_interval=REPLAY_PROGRESS_INTERVAL, enricher=None):
+        self.analyzer = analyzer
+        self.enricher = enricher
+        self.storage = storage
+        self.alerting = alerting
+        self.workers = max(1, workers)
+        self.chunk_bytes = chunk_bytes
+        self.src_ip = src_ip
+        self.progress_interval = progress_interval
+        self.lines = 0
+        self.bytes = 0
+        self.docs = 0
+        self.stored = 0
+        self.alerts = {}
+        self.started = None
+        self.write_error = None
+
+    def _stream(self, pool, path, window):
+        # docs of one file in block order, with up to `window` blocks being parsed ahead
+        mtime = datetime.utcfromtimestamp(os.path.getmtime(path))
+        received_ts = mtime.isoformat() + 'Z'
+        pending = deque()
+        blocks = read_blocks(path, self.chunk_bytes)
+        while True:
+            for block in blocks:
+                self.bytes += len(block)
+                pending.append(pool.apply_async(parse_block, (block, self.src_ip, received_ts, mtime.isoformat())))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                return
+            lines, docs = pending.popleft().get()
+            self.lines += lines
+            yield from docs
+
+    def _write(self, batches):
+        while True:
+            batch = batches.get()
+            if batch is _STOP:
+                return
+            if self.write_error is not None:
+                continue
+            try:
+                self.stored += self.storage.index_many(batch)
+            except Exception as e:
+                logger.exception('Storage write failed, replay will stop: %s', e)
+                self.write_error = e
+
+    def run(self, paths):
+        """Replay the files; returns stats(). Raises if storage writes failed."""
+        self.started = time.monotonic()
+        pool = _Inline() if self.workers == 1 else multiprocessing.Pool(self.workers)
+        batches = queue.Queue(maxsize=4)
+        writer = None
+        if self.storage is not None:
+            writer = threading.Thread(target=self._write, args=(batches,), name='replay-writer', daemon=True)
+            writer.start()
+        # keep every worker busy while bounding the blocks held in memory across all files
+        window = max(2, 2 * self.workers // len(paths))
+        streams = [self._stream(pool, path, window) for path in paths]
+        merged = streams[0] if len(streams) == 1 else heapq.merge(*streams, key=_event_time)
+        last_report = time.monotonic()
+        batch = []
+        try:
+            for doc in merged:
+                self.docs += 1
+                if self.enricher is not None:
+                    self.enricher.enrich(doc)
+                for alert in self.analyzer.process_all(doc):
+                    self.alerts[alert['type']] = self.alerts.get(alert['type'], 0) + 1
+                    if self.alerting is not None:
+                        self.alerting.send(alert)
+                if writer is not None:
+                    batch.append(doc)
+                    if len(batch) >= 10000:
+                        batches.put(batch)
+                        batch = []
+                        if self.write_error is not None:
+                            break
+                if self.docs % 10000 == 0 and time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    stats = self.stats()
+                    logger.info('Replayed %d lines (%.0f lines/s, %.1f MB/s), %d alerts', stats['lines'], stats['lines_per_sec'],
+                                stats['mb_per_sec'], sum(self.alerts.values()))
+        finally:
+            if writer is not None:
+                if batch:
+                    batches.put(batch)
+                batches.put(_STOP)
+                writer.join()
+            if not isinstance(pool, _Inline):
+                pool.terminate()
+        if self.write_error is not None:
+            raise self.write_error
+        return self.stats()
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9) if self.started else 0.0
+        return {
+            'lines': self.lines,
+            'docs': self.docs,
+            'stored': self.stored,
+            'alerts': dict(self.alerts),
+            'seconds': round(elapsed, 3),
+            'lines_per_sec': self.lines / elapsed if elapsed else 0.0,
+            'mb_per_sec': self.bytes / elapsed / 1e6 if elapsed else 0.0,
+        }
+
+def main(argv=None):
+    from collector.storage import Storage
+    from collector.analyzer import Analyzer
+    from collector.alerting import Alerting
+    from collector.enrich import Enricher, ENRICH_CIDR_FILE
+    parser = argparse.ArgumentParser(prog='collector replay', description='Replay archived syslog files through the detectors and into storage')
+    parser.add_argument('files', nargs='+', help='plain or gzip-compressed syslog files')
+    parser.add_argument('--workers', type=int, default=REPLAY_WORKERS, help='parser processes (default: CPU count)')
+    parser.add_argument('--es-host', type=str, default='http://localhost:9200')
+    parser.add_argument('--src-ip', type=str, default=REPLAY_SRC_IP, help='sender address to record for replayed lines')
+    parser.add_argument('--no-store', action='store_true', help='only run the detectors')
+    parser.add_argument('--send-alerts', action='store_true', help='dispatch alerts to the configured sinks instead of only counting them')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    storage = None if args.no_store else Storage(es_host=args.es_host)
+    analyzer = Analyzer(storage)
+    alerting = Alerting() if args.send_alerts else None
+    enricher = Enricher(ENRICH_CIDR_FILE) if ENRICH_CIDR_FILE else None
+    replay = Replay(analyzer, storage, alerting, workers=args.workers, src_ip=args.src_ip, enricher=enricher)
+    try:
+        stats = replay.run(args.files)
+    finally:
+        if alerting is not None:
+            alerting.close()
+    logger.info('Replayed %d lines (%d docs, %d stored) in %.1fs: %.0f lines/s, %.1f MB/s; alerts: %s', stats['lines'], stats['docs'],
+                stats['stored'], stats['seconds'], stats['lines_per_sec'], stats['mb_per_sec'], stats['alerts'] or 'none')
+    return stats
+
+if __name__ == '__main__':
+    main()
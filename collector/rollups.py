@@ -0,0 +1,242 @@
+"""
+Per-minute rollups maintained by the collector as it ingests, so dashboard charts never GROUP BY raw logs.
+Each minute keeps exact counts per event_type and approximate top-K counts per host, source IP and mined
+log template of unclassified messages (Space-Saving sketches, fixed memory no matter how many distinct
+values arrive). Closed minutes are
+flushed to a small SQLite database (rollups.db) together with hourly rollups merged from them, and
+/api/stats reads only those; the rows it touches depend on the time range and K, never on raw log volume.
+"""
+import os
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger('rollups')
+
+# Configure via environment variables
+ROLLUP_DB = os.getenv('ROLLUP_DB', 'rollups.db')
+ROLLUP_TOP_K = int(os.getenv('ROLLUP_TOP_K', '100'))
+ROLLUP_FLUSH_INTERVAL = float(os.getenv('ROLLUP_FLUSH_INTERVAL', '10'))
+ROLLUP_RETENTION_DAYS = float(os.getenv('ROLLUP_RETENTION_DAYS', '30'))
+
+# ranges longer than this are answered from the hourly table
+ROLLUP_HOURLY_AFTER = 360
+
+DIMENSIONS = ('total', 'event_type', 'host', 'src_ip', 'template')
+TABLES = ('rollups', 'rollups_hourly')
+
+class SpaceSaving:
+    """Space-Saving heavy-hitters sketch with k counters and O(1) updates.
+    Any value seen more than n/k times is guaranteed to be tracked; a tracked count overestimates the
+    true count by at most the count it inherited when it replaced another value."""
+    def __init__(self, k):
+        self.k = k
+        self.counts = {}
+        # count -> values holding that count, so the minimum is found without scanning
+        self.by_count = {}
+        self.min_count = 0
+
+    def _move(self, value, old, new):
+        self.by_count.setdefault(new, set()).add(value)
+        self.counts[value] = new
+        if old:
+            values = self.by_count[old]
+            values.discard(value)
+            if not values:
+                del self.by_count[old]
+                if self.min_count == old:
+                    # with unit increments nothing can sit between old and new
+                    self.min_count = new if new == old + 1 else min(self.by_count)
+
+    def add(self, value, n=1):
+        count = self.counts.get(value)
+        if count is not None:
+            self._move(value, count, count + n)
+        elif len(self.counts) < self.k:
+            self._move(value, 0, n)
+            self.min_count = n if len(self.counts) == 1 else min(self.min_count, n)
+        else:
+            # replace a value holding the minimum count; the newcomer inherits that count
+            floor = self.min_count
+            victim = next(iter(self.by_count[floor]))
+            del self.counts[victim]
+            self.counts[value] = floor
+            self.by_count[floor].discard(victim)
+            self.by_count[floor].add(value)
+            self._move(value, floor, floor + n)
+
+    def top(self, n=None):
+        items = sorted(self.counts.items(), key=lambda kv: (-kv[1], kv[0]))
+        return items[:n] if n else items
+
+class _Bucket:
+    # counts for one minute (or one hour, merged from its minutes)
+    def __init__(self, top_k):
+        self.total = 0
+        self.event_types = {}
+        self.hosts = SpaceSaving(top_k)
+        self.ips = SpaceSaving(top_k)
+        self.templates = SpaceSaving(top_k)
+
+    def merge(self, other):
+        self.total += other.total
+        for et, n in other.event_types.items():
+            self.event_types[et] = self.event_types.get(et, 0) + n
+        for value, n in other.hosts.counts.items():
+            self.hosts.add(value, n)
+        for value, n in other.ips.counts.items():
+            self.ips.add(value, n)
+        for value, n in other.templates.counts.items():
+            self.templates.add(value, n)
+
+    def rows(self, period):
+        yield period, 'total', '', self.total
+        for et, n in self.event_types.items():
+            yield period, 'event_type', et, n
+        for host, n in self.hosts.top():
+            yield period, 'host', host, n
+        for ip, n in self.ips.top():
+            yield period, 'src_ip', ip, n
+        for template, n in self.templates.top():
+            yield period, 'template', template, n
+
+class Rollup:
+    """Counts normalized docs into per-minute buckets. drain() hands closed minutes to the store and folds
+    them into hourly buckets (merged sketches, so still K values per hour) that are handed over once the
+    hour closes."""
+    def __init__(self, top_k=ROLLUP_TOP_K):
+        self.top_k = top_k
+        self.minutes = {}
+        self.hours = {}
+        self.observed = 0
+
+    def observe(self, doc):
+        # 'YYYY-MM-DDTHH:MM' of the collector's own UTC receive time: header times can be skewed, far in the
+        # future or in another zone, and a minute drain() never sees close would stay in memory
+        ts = doc.get('received_ts') or doc.get('timestamp') or ''
+        minute = ts[:16]
+        bucket = self.minutes.get(minute)
+        if bucket is None:
+            bucket = self.minutes[minute] = _Bucket(self.top_k)
+        bucket.total += 1
+        parsed = doc.get('parsed', {})
+        et = parsed.get('event_type') or 'unclassified'
+        bucket.event_types[et] = bucket.event_types.get(et, 0) + 1
+        host = doc.get('host')
+        if host:
+            bucket.hosts.add(host)
+        ip = parsed.get('src_ip') or doc.get('src_ip')
+        if ip:
+            bucket.ips.add(ip)
+        template = parsed.get('template')
+        if template:
+            bucket.templates.add(template)
+        self.observed += 1
+
+    def drain(self, now=None, everything=False):
+        """(minute_rows, hour_rows) of (period, dim, value, count) for closed minutes and hours, removing
+        them from memory. everything=True also drains the open ones (at shutdown)."""
+        current = (now or datetime.utcnow()).isoformat()[:16]
+        minute_rows = []
+        for minute in [m for m in self.minutes if everything or m < current]:
+            bucket = self.minutes.pop(minute)
+            minute_rows.extend(bucket.rows(minute))
+            hour = self.hours.get(minute[:13])
+            if hour is None:
+                hour = self.hours[minute[:13]] = _Bucket(self.top_k)
+            hour.merge(bucket)
+        hour_rows = []
+        for hour in [h for h in self.hours if everything or h < current[:13]]:
+            hour_rows.extend(self.hours.pop(hour).rows(hour))
+        return minute_rows, hour_rows
+
+    def stats(self):
+        return {'observed': self.observed, 'open_minutes': len(self.minutes), 'open_hours': len(self.hours)}
+
+class RollupStore:
+    """SQLite tables of rollup rows, per minute and per hour; shared by the collector (writes) and the
+    dashboard (reads)."""
+    def __init__(self, db_path=ROLLUP_DB):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        for table in TABLES:
+            self.conn.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+                dim TEXT,
+                period TEXT,
+                value TEXT,
+                count INTEGER,
+                PRIMARY KEY (dim, period, value)
+            ) WITHOUT ROWID''')
+        self.conn.commit()
+
+    def write(self, minute_rows, hour_rows=()):
+        """Add rows to the tables; counts for a period flushed more than once (late events, restarts,
+        several workers) are summed."""
+        with self.lock:
+            with self.conn:
+                for table, rows in zip(TABLES, (minute_rows, hour_rows)):
+                    self.conn.executemany(f'''INSERT INTO {table} (period, dim, value, count) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (dim, period, value) DO UPDATE SET count = count + excluded.count''', rows)
+        return len(minute_rows) + len(hour_rows)
+
+    def prune(self, retention_days=ROLLUP_RETENTION_DAYS, now=None):
+        if not retention_days or retention_days <= 0:
+            return 0
+        cutoff = ((now or datetime.utcnow()) - timedelta(days=retention_days)).isoformat()[:16]
+        deleted = 0
+        with self.lock:
+            with self.conn:
+                for table, width in zip(TABLES, (16, 13)):
+                    for dim in DIMENSIONS:
+                        deleted += self.conn.execute(f'DELETE FROM {table} WHERE dim = ? AND period < ?', (dim, cutoff[:width])).rowcount
+        return deleted
+
+    def _rows(self, table, dim, start, end=None):
+        q = f'SELECT period, value, count FROM {table} WHERE dim = ? AND period >= ?'
+        params = [dim, start]
+        if end is not None:
+            q += ' AND period < ?'
+            params.append(end)
+        return self.conn.execute(q + ' ORDER BY period', params).fetchall()
+
+    def query(self, dim, minutes=60, limit=10, now=None):
+        """Series and range totals for one dimension over the last `minutes`: per minute, or per hour for
+        ranges longer than ROLLUP_HOURLY_AFTER minutes. For host and src_ip only the `limit` values with
+        the highest totals are returned."""
+        if dim not in DIMENSIONS:
+            raise ValueError(f'Unknown rollup dimension {dim!r}, expected one of {list(DIMENSIONS)}')
+        now = now or datetime.utcnow()
+        start = (now - timedelta(minutes=minutes)).isoformat()[:16]
+        hourly = minutes > ROLLUP_HOURLY_AFTER
+        with self.lock:
+            if not hourly:
+                rows = self._rows('rollups', dim, start)
+            else:
+                # whole hours from the hourly table, the partial first and current hours from minutes
+                first = (now - timedelta(minutes=minutes) + timedelta(hours=1)).isoformat()[:13]
+                current = now.isoformat()[:13]
+                rows = [(p[:13], v, c) for p, v, c in self._rows('rollups', dim, start, first)]
+                rows += self._rows('rollups_hourly', dim, first, current)
+                rows += [(p[:13], v, c) for p, v, c in self._rows('rollups', dim, current)]
+        totals = {}
+        series = {}
+        for period, value, count in rows:
+            totals[value] = totals.get(value, 0) + count
+            counts = series.setdefault(period, {})
+            counts[value] = counts.get(value, 0) + count
+        top = sorted(totals.items(), key=lambda kv: (-kv[1], kv[0]))
+        if dim in ('host', 'src_ip', 'template'):
+            top = top[:limit]
+            keep = {value for value, _ in top}
+            series = {p: {v: c for v, c in counts.items() if v in keep} for p, counts in series.items()}
+        return {
+            'dim': dim,
+            'minutes': minutes,
+            'resolution': 'hour' if hourly else 'minute',
+            'series': [{'period': p, 'counts': c} for p, c in series.items() if c],
+            'totals': dict(top),
+        }
@@ -0,0 +1,171 @@
+"""
+Declarative correlation rules, loaded from a JSON file and compiled into an event_type dispatch table.
+Supported rule types:
+- threshold: >= threshold events of event_type per key within window seconds
+- sequence:  a `then` event for a key within window seconds of a `first` event (at least min_count of them)
+- distinct:  >= threshold distinct values of field per key within window seconds
+- sketch_threshold, sketch_distinct: the same as threshold and distinct, estimated in fixed memory
+  (collector/sketches.py) for keys too many to hold exactly, e.g. every IP of a distributed attack
+Each rule keeps its own bounded window state (collector/windows.py), keyed by the rule's key field. The
+history held per key is capped at `max_per_key` (default: MAX_PER_KEY or the rule's threshold, whichever is
+larger); a rule whose threshold is above its cap could never fire and is rejected.
+Any rule may set `cooldown`: seconds between alerts for one key (default ANALYZER_ALERT_COOLDOWN, 0 for every match).
+"""
+import os
+import json
+from datetime import timedelta
+from collector.windows import WindowStore, DistinctStore, MAX_PER_KEY
+from collector.sketches import CountMinWindow, DistinctWindow, SKETCH_BUCKETS, SKETCH_WIDTH, SKETCH_DEPTH, SKETCH_REGISTERS, SKETCH_VIRTUAL
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(__file__), 'rules.json')
+
+def field_value(doc, field):
+    """Look a field up in doc['parsed'] first, then on the doc itself (e.g. src_ip falls back to the sender)."""
+    return doc.get('parsed', {}).get(field) or doc.get(field)
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+class Rule:
+    def __init__(self, spec, max_keys, max_events):
+        try:
+            self.name = spec['name']
+            self.key = spec.get('key', 'src_ip')
+            self.window = int(spec['window'])
+        except KeyError as e:
+            raise ValueError(f'Rule {spec.get("name", spec)!r} is missing {e}')
+        self.message = spec.get('message', '{rule}: {count} events for {key} in {window}')
+        self.level = spec.get('level', 'info')
+        self.cooldown = spec.get('cooldown')
+        self.max_keys = spec.get('max_keys', max_keys)
+        self.max_events = spec.get('max_events', max_events)
+
+    def _max_per_key(self, spec, needed):
+        """Per-key history cap: at least `needed` events or values, or the rule could never reach it."""
+        cap = int(spec.get('max_per_key', max(MAX_PER_KEY, needed)))
+        if cap < needed:
+            raise ValueError(f'Rule {self.name!r} needs {needed} events per key but max_per_key is {cap}')
+        return cap
+
+    def event_types(self):
+        """Event types this rule consumes; the analyzer only calls the rule for these."""
+        raise NotImplementedError
+
+    def on_event(self, doc, event_type, key, ts):
+        raise NotImplementedError
+
+    def alert(self, key, count=None):
+        alert = {'type': self.name}
+        if self.key == 'src_ip':
+            alert['ip'] = key
+        else:
+            alert['key'] = key
+        if count is not None:
+            alert['count'] = count
+        alert['message'] = self.message.format(rule=self.name, key=key, count=count, window=timedelta(seconds=self.window))
+        return alert
+
+    def stats(self):
+        return self.state.stats()
+
+class ThresholdRule(Rule):
+    def __init__(self, spec, max_keys, max_events):
+        super().__init__(spec, max_keys, max_events)
+        self.event_type = _as_list(spec['event_type'])
+        self.threshold = int(spec['threshold'])
+        self.state = WindowStore(self.window, max_keys=self.max_keys, max_events=self.max_events,
+                                 max_events_per_key=self._max_per_key(spec, self.threshold))
+
+    def event_types(self):
+        return self.event_type
+
+    def on_event(self, doc, event_type, key, ts):
+        count = self.state.add(key, ts)
+        if count >= self.threshold:
+            return self.alert(key, count)
+        return None
+
+class SequenceRule(Rule):
+    def __init__(self, spec, max_keys, max_events):
+        super().__init__(spec, max_keys, max_events)
+        self.first = _as_list(spec['first'])
+        self.then = _as_list(spec['then'])
+        self.min_count = int(spec.get('min_count', 1))
+        self.state = WindowStore(self.window, max_keys=self.max_keys, max_events=self.max_events,
+                                 max_events_per_key=self._max_per_key(spec, self.min_count))
+
+    def event_types(self):
+        return self.first + self.then
+
+    def on_event(self, doc, event_type, key, ts):
+        if event_type in self.first:
+            self.state.add(key, ts)
+            return None
+        last = self.state.last(key)
+        if last is None or ts - last > self.window:
+            return None
+        if self.min_count > 1 and self.state.count(key) < self.min_count:
+            return None
+        return self.alert(key)
+
+class DistinctRule(Rule):
+    def __init__(self, spec, max_keys, max_events):
+        super().__init__(spec, max_keys, max_events)
+        self.event_type = _as_list(spec['event_type'])
+        self.field = spec['field']
+        self.threshold = int(spec['threshold'])
+        self.state = DistinctStore(self.window, max_keys=self.max_keys, max_events=self.max_events,
+                                   max_values_per_key=self._max_per_key(spec, self.threshold))
+
+    def event_types(self):
+        return self.event_type
+
+    def on_event(self, doc, event_type, key, ts):
+        value = field_value(doc, self.field)
+        if value is None:
+            return None
+        count = self.state.add(key, value, ts)
+        if count >= self.threshold:
+            return self.alert(key, count)
+        return None
+
+class SketchThresholdRule(ThresholdRule):
+    def __init__(self, spec, max_keys, max_events):
+        super().__init__(spec, max_keys, max_events)
+        self.state = CountMinWindow(self.window, width=spec.get('width', SKETCH_WIDTH), depth=spec.get('depth', SKETCH_DEPTH),
+                                    buckets=spec.get('buckets', SKETCH_BUCKETS))
+
+class SketchDistinctRule(DistinctRule):
+    def __init__(self, spec, max_keys, max_events):
+        super().__init__(spec, max_keys, max_events)
+        self.state = DistinctWindow(self.window, registers=spec.get('registers', SKETCH_REGISTERS),
+                                    virtual=spec.get('virtual', SKETCH_VIRTUAL), buckets=spec.get('buckets', SKETCH_BUCKETS))
+
+RULE_TYPES = {
+    'threshold': ThresholdRule,
+    'sequence': SequenceRule,
+    'distinct': DistinctRule,
+    'sketch_threshold': SketchThresholdRule,
+    'sketch_distinct': SketchDistinctRule,
+}
+
+def load_rules(path=None):
+    with open(path or DEFAULT_RULES_FILE) as f:
+        specs = json.load(f)
+    return specs['rules'] if isinstance(specs, dict) else specs
+
+def compile_rules(specs, max_keys=200000, max_events=2000000):
+    """Build rule objects and the event_type -> [rule, ...] dispatch table, preserving file order."""
+    rules = []
+    dispatch = {}
+    for spec in specs:
+        if spec.get('enabled', True) is False:
+            continue
+        cls = RULE_TYPES.get(spec.get('type'))
+        if cls is None:
+            raise ValueError(f'Rule {spec.get("name")!r} has unknown type {spec.get("type")!r}, expected one of {sorted(RULE_TYPES)}')
+        rule = cls(spec, max_keys, max_events)
+        rules.append(rule)
+        for et in dict.fromkeys(rule.event_types()):
+            dispatch.setdefault(et, []).append(rule)
+    return rules, dispatch
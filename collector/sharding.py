@@ -0,0 +1,68 @@
+"""
+Analyzer sharding for multi-process ingestion (--workers N).
+Each worker process owns one Analyzer shard. After parsing, a worker routes every event the analyzer
+cares about to the shard that owns its source IP, so per-IP windows see all events for that IP
+no matter which worker the kernel handed the datagram or connection to.
+Rules keyed on another field (e.g. user) only see the events of their own shard.
+"""
+import zlib
+import queue
+import logging
+
+logger = logging.getLogger('sharding')
+
+def shard_for(ip, shards):
+    # crc32 rather than hash(): str hashes are salted per process and every worker must agree
+    return zlib.crc32((ip or '').encode()) % shards
+
+def event_ip(doc):
+    return doc.get('parsed', {}).get('src_ip') or doc.get('src_ip')
+
+class ShardRouter:
+    """Drop-in for Analyzer in a worker: forwards events to the owning shard's inbox.
+    Alerts are raised by the shard's own consumer thread, so process_all() always returns no alerts."""
+    def __init__(self, inboxes, event_types):
+        self.inboxes = inboxes
+        self.event_types = frozenset(event_types)
+        self.routed = 0
+        self.dropped = 0
+
+    def process_all(self, doc):
+        # events no rule consumes never cross process boundaries
+        if doc.get('parsed', {}).get('event_type') not in self.event_types:
+            return []
+        inbox = self.inboxes[shard_for(event_ip(doc), len(self.inboxes))]
+        try:
+            inbox.put_nowait(doc)
+            self.routed += 1
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning('Analyzer shard inbox full, dropped %d events so far', self.dropped)
+        return []
+
+    def stats(self):
+        return {'routed': self.routed, 'dropped': self.dropped}
+
+def run_shard(analyzer, alerting, inbox, checkpointer=None):
+    """Consume routed events for one shard until a None sentinel arrives.
+    The shard's window state is only touched from this thread, so checkpoints are taken here too."""
+    timeout = checkpointer.interval if checkpointer is not None else None
+    while True:
+        try:
+            doc = inbox.get(timeout=timeout)
+        except queue.Empty:
+            doc = False
+        if doc is None:
+            break
+        if doc:
+            try:
+                for alert in analyzer.process_all(doc):
+                    alerting.send(alert)
+            except Exception as e:
+                logger.exception('Analyzer shard failed on event: %s', e)
+        if checkpointer is not None:
+            checkpointer.maybe_save()
+    if checkpointer is not None:
+        checkpointer.save()
+        checkpointer.wait()
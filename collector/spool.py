@@ -0,0 +1,350 @@
+"""
+Disk-backed write-ahead spool between BatchWriter and Storage.
+When the storage backend fails or cannot keep up, batches are appended to local segment files
+(segment-N.log, one JSON doc per line) instead of being dropped, and a replay thread writes them back in
+bulk once a health probe sees the backend again. While anything is spooled, new batches are spooled too,
+and backend calls only ever run on the replay thread, so ingest latency stays flat through an outage.
+A healthy backend never touches disk: batches reach the replay thread through a short in-memory queue, and
+only a backend that is down or stays behind for SPOOL_HANDOFF_TIMEOUT sends them to the spool.
+The replay position is checkpointed to a small `position` file; segments behind it are deleted.
+A failed write only counts as an outage if the backend then fails a ping too. A backend that answers but
+keeps rejecting a replayed batch (a mapping conflict, say) gets SPOOL_MAX_ATTEMPTS tries; then the batch is
+written in halves down to the single docs it rejects, which go to `dead-letter.log` so replay moves on.
+Like any replay, that can write some docs twice; none are lost.
+"""
+import os
+import glob
+import json
+import queue
+import time
+import logging
+import threading
+from collector.event import dumps
+
+logger = logging.getLogger('spool')
+
+# Configure via environment variables
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'spool')
+SPOOL_SEGMENT_BYTES = int(os.getenv('SPOOL_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+SPOOL_FSYNC = os.getenv('SPOOL_FSYNC', '1') not in ('0', 'false', 'no')
+SPOOL_REPLAY_BATCH = int(os.getenv('SPOOL_REPLAY_BATCH', '5000'))
+SPOOL_PROBE_INTERVAL = float(os.getenv('SPOOL_PROBE_INTERVAL', '5'))
+# batches queued for the replay thread, and how long the writer waits for room before spooling one instead
+SPOOL_HANDOFF_BATCHES = int(os.getenv('SPOOL_HANDOFF_BATCHES', '8'))
+SPOOL_HANDOFF_TIMEOUT = float(os.getenv('SPOOL_HANDOFF_TIMEOUT', '1'))
+# replays of a batch the backend rejects while answering pings, before its bad docs are dead-lettered
+SPOOL_MAX_ATTEMPTS = int(os.getenv('SPOOL_MAX_ATTEMPTS', '3'))
+
+class Spool:
+    """Append-only segment files plus a checkpointed read position. Appends are locked; there is one reader."""
+    def __init__(self, directory=SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_BYTES, fsync=SPOOL_FSYNC):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.appended = 0
+        self.replayed = 0
+        self.skipped = 0
+        self.dead_lettered = 0
+        os.makedirs(directory, exist_ok=True)
+        self.position_path = os.path.join(directory, 'position')
+        # docs the backend rejected; kept for inspection, never replayed
+        self.dead_letter_path = os.path.join(directory, 'dead-letter.log')
+        self.read_pos = self._load_position()
+        segments = self._segments()
+        if segments:
+            self.write_seg = segments[-1]
+            self._repair(self.write_seg)
+        else:
+            self.write_seg = self.read_pos[0]
+        self.write_off = self._size(self.write_seg)
+        self.file = open(self._path(self.write_seg), 'ab')
+        if self.pending():
+            logger.info('Spool has %d bytes awaiting replay', self.pending_bytes())
+
+    def _path(self, seg):
+        return os.path.join(self.directory, f'segment-{seg:012d}.log')
+
+    def _size(self, seg):
+        try:
+            return os.path.getsize(self._path(seg))
+        except OSError:
+            return 0
+
+    def _segments(self):
+        paths = glob.glob(os.path.join(self.directory, 'segment-*.log'))
+        return sorted(int(os.path.basename(p)[8:-4]) for p in paths)
+
+    def _load_position(self):
+        try:
+            with open(self.position_path) as f:
+                seg, off = f.read().split()
+            return int(seg), int(off)
+        except (OSError, ValueError):
+            segments = self._segments()
+            return (segments[0] if segments else 1), 0
+
+    def _repair(self, seg):
+        # a crash mid-append can leave a torn last line; cut it so the next append starts cleanly
+        path = self._path(seg)
+        with open(path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                logger.warning('Truncating %d bytes of torn spool record in %s', len(data) - end, path)
+                f.truncate(end)
+
+    def pending(self):
+        return self.read_pos != (self.write_seg, self.write_off)
+
+    def pending_bytes(self):
+        seg, off = self.read_pos
+        return sum(self._size(s) for s in range(seg, self.write_seg + 1)) - off
+
+    def append(self, docs):
+        """Durably append a batch of docs."""
+        data = b''.join(dumps(doc).encode() + b'\n' for doc in docs)
+        with self.lock:
+            if self.write_off and self.write_off + len(data) > self.segment_bytes:
+                self.file.close()
+                self.write_seg += 1
+                self.write_off = 0
+                self.file = open(self._path(self.write_seg), 'ab')
+            self.file.write(data)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.write_off += len(data)
+            self.appended += len(docs)
+
+    def dead_letter(self, docs):
+        """Set aside docs the backend refuses to store, so replay can move past them."""
+        with open(self.dead_letter_path, 'ab') as f:
+            f.write(b''.join(dumps(doc).encode() + b'\n' for doc in docs))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self.dead_lettered += len(docs)
+
+    def read(self, max_docs=SPOOL_REPLAY_BATCH):
+        """Up to max_docs spooled docs from the read position, and the position just after them."""
+        with self.lock:
+            end = (self.write_seg, self.write_off)
+        seg, off = self.read_pos
+        docs = []
+        while len(docs) < max_docs and (seg, off) < end:
+            # never read past what the appender has finished writing to the active segment
+            limit = end[1] if seg == end[0] else None
+            with open(self._path(seg), 'rb') as f:
+                f.seek(off)
+                for line in f:
+                    if limit is not None and off + len(line) > limit:
+                        break
+                    off += len(line)
+                    try:
+                        docs.append(json.loads(line))
+                    except ValueError:
+                        self.skipped += 1
+                        logger.warning('Skipping unreadable spool record in segment %d', seg)
+                    if len(docs) >= max_docs:
+                        break
+            if len(docs) >= max_docs or seg == end[0]:
+                break
+            seg, off = seg + 1, 0
+        return docs, (seg, off)
+
+    def commit(self, position, count=0):
+        """Persist the read position after a successful replay and delete fully replayed segments."""
+        tmp = self.position_path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('%d %d' % position)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.position_path)
+        self.read_pos = position
+        self.replayed += count
+        for seg in self._segments():
+            if seg >= position[0]:
+                break
+            os.remove(self._path(seg))
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def stats(self):
+        return {
+            'pending_bytes': self.pending_bytes(),
+            'appended': self.appended,
+            'replayed': self.replayed,
+            'skipped': self.skipped,
+            'dead_lettered': self.dead_lettered,
+        }
+
+class SpoolReplayer:
+    """Background thread that owns all backend writes once a spool is attached.
+    The writer hands it batches through a queue of `handoff_batches`; if the backend is down, older batches
+    are spooled, or the queue stays full for `handoff_timeout` seconds, the writer appends to the spool
+    instead, so it never waits long on storage. While healthy the thread drains the spool in bulk; while
+    down it probes the backend. A failed write whose ping still succeeds is a rejection, not an outage:
+    the batch is spooled and retried up to `max_attempts` times before its bad docs are dead-lettered."""
+    def __init__(self, spool, storage, probe_interval=SPOOL_PROBE_INTERVAL, batch=SPOOL_REPLAY_BATCH, flush_seconds=None,
+                 handoff_batches=SPOOL_HANDOFF_BATCHES, handoff_timeout=SPOOL_HANDOFF_TIMEOUT, max_attempts=SPOOL_MAX_ATTEMPTS):
+        self.spool = spool
+        self.storage = storage
+        # optional metrics.Histogram of storage write latency
+        self.flush_seconds = flush_seconds
+        self.probe_interval = probe_interval
+        self.batch = batch
+        self.handoff = queue.Queue(maxsize=max(1, handoff_batches))
+        self.handoff_timeout = handoff_timeout
+        self.max_attempts = max(1, max_attempts)
+        # failed replays of the batch at the read position
+        self.attempts = 0
+        self.rejected = 0
+        self.healthy = True
+        self.outages = 0
+        self.written = 0
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='spool-replay', daemon=True)
+            self.thread.start()
+        return self
+
+    def submit(self, batch):
+        """Queue batch for a direct write if the backend is healthy and nothing is spooled; otherwise, or if
+        the queue stays full for handoff_timeout, append it to the spool."""
+        if self.healthy and not self.spool.pending():
+            self.wakeup.set()
+            try:
+                self.handoff.put(batch, timeout=self.handoff_timeout)
+                self.wakeup.set()
+                return True
+            except queue.Full:
+                pass
+        self.spool.append(batch)
+        if self.healthy:
+            self.wakeup.set()
+        return False
+
+    def mark_down(self, reason):
+        if self.healthy:
+            self.outages += 1
+            logger.warning('Storage backend %s, spooling writes to %s', reason, self.spool.directory)
+        self.healthy = False
+
+    def stop(self, timeout=10):
+        """Finish the batch in hand (writing or spooling it) and stop; spooled docs replay on next start."""
+        if self.thread is None:
+            return
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _ping(self):
+        try:
+            return bool(self.storage.ping())
+        except Exception:
+            return False
+
+    def _down(self, e, what):
+        """After a failed write: mark the backend down and return True if it fails a ping too; False means it
+        is up and rejected the docs."""
+        if self._ping():
+            return False
+        self.mark_down(f'{what} failed ({e})')
+        return True
+
+    def probe(self):
+        ok = self._ping()
+        if ok and not self.healthy:
+            logger.info('Storage backend is back, replaying %d spooled bytes', self.spool.pending_bytes())
+        self.healthy = ok
+        return ok
+
+    def _write(self, batch):
+        # a batch that fails here is spooled behind any newer ones the writer already spooled; stored
+        # docs carry their own timestamps, so only arrival order changes
+        if not self.healthy:
+            # queued before the outage was noticed; no point waiting on the backend for each one
+            self.spool.append(batch)
+            return
+        try:
+            self._index(batch)
+            self.written += len(batch)
+        except Exception as e:
+            if not self._down(e, 'write'):
+                # rejected: the replay path retries it and sets aside whatever keeps failing
+                self.rejected += 1
+                logger.warning('Storage backend rejected a batch of %d docs, spooling it for retry: %s', len(batch), e)
+            self.spool.append(batch)
+
+    def _replay(self):
+        docs, position = self.spool.read(self.batch)
+        rejected = []
+        try:
+            if docs and self.attempts >= self.max_attempts:
+                rejected = self._split(docs)
+            elif docs:
+                self._index(docs)
+        except Exception as e:
+            if not self._down(e, 'replay'):
+                self.attempts += 1
+                self.rejected += 1
+                logger.warning('Storage backend rejected %d spooled docs (attempt %d of %d): %s',
+                               len(docs), self.attempts, self.max_attempts, e)
+            return
+        if rejected:
+            logger.error('Storage backend rejected %d spooled docs, moved to %s', len(rejected), self.spool.dead_letter_path)
+            self.spool.dead_letter(rejected)
+        self.attempts = 0
+        self.spool.commit(position, len(docs) - len(rejected))
+
+    def _split(self, docs):
+        """Write docs in halves down to the single docs the backend rejects, and return those. Raises if the
+        backend goes down meanwhile, so nothing is dead-lettered for an outage."""
+        try:
+            self._index(docs)
+            return []
+        except Exception:
+            if len(docs) > 1:
+                mid = len(docs) // 2
+                return self._split(docs[:mid]) + self._split(docs[mid:])
+            if not self._ping():
+                raise
+            return docs
+
+    def _index(self, docs):
+        t0 = time.perf_counter()
+        try:
+            self.storage.index_many(docs)
+        finally:
+            if self.flush_seconds is not None:
+                self.flush_seconds.observe(time.perf_counter() - t0)
+
+    def _run(self):
+        while True:
+            try:
+                self._write(self.handoff.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            if self.stopping:
+                break
+            if self.healthy and self.spool.pending():
+                self._replay()
+                continue
+            self.wakeup.wait(self.probe_interval)
+            self.wakeup.clear()
+            if self.handoff.empty() and not self.stopping and not (self.healthy and self.spool.pending()):
+                # idle or down: a periodic probe is the only thing that brings the backend back
+                self.probe()
+
+    def stats(self):
+        return dict(self.spool.stats(), written=self.written, healthy=self.healthy, outages=self.outages,
+                    rejected=self.rejected)
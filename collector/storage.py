@@ -1,24 +1,186 @@
 """
 Storage abstraction: Elasticsearch (preferred) with SQLite fallback for demo.
+The SQLite fallback keeps one table per day or hour (logs_YYYYMMDD / logs_YYYYMMDDHH) in WAL mode, each
+indexed on (ts), (src_ip, ts) and (event_type, ts). Searches only visit the partitions that overlap the
+requested time range, and retention drops whole partitions. Each partition also has an FTS5 index over
+`raw` (logs_YYYYMMDD_fts), updated in the same transaction as each write batch, for search_text().
+The stored `ts` is the header timestamp only while it lies within STORAGE_MAX_LAG before to STORAGE_MAX_SKEW
+after the doc's receive time, and the receive time otherwise (the raw line keeps the header). Senders
+control their headers, so a forged year or a reset clock must not create partitions, dodge retention or be
+dropped by it on arrival.
+With Elasticsearch, docs go to daily indices (syslogs-YYYY.MM.DD) created from an index template with
+keyword mappings, and searches target only the indices covering the requested time range. Index and
+`timestamp` follow the same receive-time bound, so forged headers cannot create indices (and shards).
 """
 import os
+import re
 import json
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 logger = logging.getLogger('storage')
 
 try:
-    from elasticsearch import Elasticsearch
+    from elasticsearch import Elasticsearch, helpers
     ES_AVAILABLE = True
 except Exception:
     ES_AVAILABLE = False
 
 import sqlite3
+import threading
+from collector.event import LogEvent
+
+# Configure via environment variables
+# SQLite fallback: logs are split into one table per day (or hour) so that time-range queries only touch
+# the partitions they need and retention drops whole tables instead of running DELETE
+SQLITE_PARTITION = os.getenv('SQLITE_PARTITION', 'day')
+SQLITE_RETENTION_DAYS = float(os.getenv('SQLITE_RETENTION_DAYS', '30'))
+# Full-text index over raw messages; costs some insert throughput and disk
+SQLITE_FTS = os.getenv('SQLITE_FTS', '1') not in ('0', 'false', 'no')
+# how far a header timestamp may lag behind or run ahead of receive time and still be stored as the log's time
+STORAGE_MAX_LAG = int(os.getenv('STORAGE_MAX_LAG', '86400'))
+STORAGE_MAX_SKEW = int(os.getenv('STORAGE_MAX_SKEW', '3600'))
+
+# Elasticsearch: daily indices named <prefix>-YYYY.MM.DD, created from an index template
+ES_INDEX_PREFIX = os.getenv('ES_INDEX_PREFIX', 'syslogs')
+ES_REFRESH_INTERVAL = os.getenv('ES_REFRESH_INTERVAL', '30s')
+# beyond this many days a search uses the <prefix>-* wildcard instead of listing indices
+ES_MAX_INDICES = 31
+# how long a paged full-text search keeps its point in time open between pages
+ES_PIT_KEEP_ALIVE = os.getenv('ES_PIT_KEEP_ALIVE', '5m')
+
+ES_TEMPLATE = {
+    'index_patterns': [ES_INDEX_PREFIX + '-*'],
+    'template': {
+        'settings': {
+            # fewer refreshes means cheaper bulk indexing; the dashboard tolerates this much lag
+            'index.refresh_interval': ES_REFRESH_INTERVAL,
+            'index.number_of_shards': 1,
+        },
+        'mappings': {
+            'dynamic_templates': [
+                # extractor fields (user, port, ...) are exact-match values, not full text
+                {'strings_as_keywords': {'match_mapping_type': 'string', 'mapping': {'type': 'keyword', 'ignore_above': 256}}},
+            ],
+            'properties': {
+                'timestamp': {'type': 'date'},
+                'src_ip': {'type': 'keyword'},
+                'host': {'type': 'keyword'},
+                'program': {'type': 'keyword'},
+                'pid': {'type': 'keyword'},
+                'message': {'type': 'text'},
+                'raw': {'type': 'text'},
+                'parsed': {'properties': {'event_type': {'type': 'keyword'}}},
+            },
+        },
+    },
+}
+ES_FIELDS = ['timestamp', 'src_ip', 'host', 'program', 'pid', 'parsed.event_type', 'raw']
+
+COLUMNS = 'ts, src_ip, host, program, pid, event_type, raw'
+INSERT_SQL = 'INSERT INTO {table} (' + COLUMNS + ') VALUES (?, ?, ?, ?, ?, ?, ?)'
+RE_PARTITION = re.compile(r'^logs_(\d{8}|\d{10})$')
+SEARCH_LIMIT = 200
+TEXT_SEARCH_LIMIT = 500
+RE_QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+TEXT_COLUMNS = ', '.join('l.' + c for c in COLUMNS.split(', '))
+RE_CURSOR = re.compile(r'^(logs_\d{8}(?:\d{2})?):(\d+)$')
+
+# receive minute -> (earliest, latest) header time stored as is; receive times of one batch share a few minutes
+_bounds = {}
+
+def stored_ts(ts, received_ts):
+    """The time a doc is stored and partitioned under: its header timestamp if plausible, else receive time.
+    Docs without a receive time (written directly, not through the collector) count as received now."""
+    if not isinstance(received_ts, str) or len(received_ts) < 16:
+        received_ts = datetime.utcnow().isoformat() + 'Z'
+    minute = received_ts[:16]
+    bounds = _bounds.get(minute)
+    if bounds is None:
+        try:
+            t = datetime.fromisoformat(minute)
+        except ValueError:
+            return ts
+        if len(_bounds) >= 1024:
+            _bounds.clear()
+        bounds = _bounds[minute] = ((t - timedelta(seconds=STORAGE_MAX_LAG)).isoformat(),
+                                    (t + timedelta(seconds=STORAGE_MAX_SKEW + 60)).isoformat())
+    # ISO 8601 in UTC compares as text; anything else (an unparsed RFC 3164 header) falls outside the bounds
+    if type(ts) is str and bounds[0] <= ts[:19] <= bounds[1]:
+        return ts
+    return received_ts
+
+def _row(doc):
+    if type(doc) is LogEvent:
+        row = doc.row()
+    else:
+        row = (doc.get('timestamp'), doc.get('src_ip'), doc.get('host'), doc.get('program'), doc.get('pid'),
+               doc.get('parsed', {}).get('event_type'), doc.get('raw'))
+    ts = stored_ts(row[0], doc.get('received_ts'))
+    return row if ts is row[0] else (ts,) + row[1:]
+
+def _source(doc, ts=None):
+    """Doc body for Elasticsearch, with `timestamp` replaced when stored_ts() did not keep the header's."""
+    if ts is not None:
+        return dict(doc.to_dict() if type(doc) is LogEvent else doc, timestamp=ts)
+    # LogEvents go to Elasticsearch as their JSON text, which the client sends without re-serializing
+    return doc.to_json() if type(doc) is LogEvent else doc
+
+def _es_action(doc):
+    header = doc.get('timestamp')
+    ts = stored_ts(header, doc.get('received_ts'))
+    return {'_index': es_index_name(ts), '_source': _source(doc, None if ts is header else ts)}
+
+def partition_key(ts, granularity=SQLITE_PARTITION):
+    """'2024-11-04T10:01:01Z' -> '20241104' (day) or '2024110410' (hour); None if ts is not ISO-like."""
+    if not isinstance(ts, str) or len(ts) < 13 or ts[4] != '-' or ts[7] != '-' or ts[10] not in 'T ':
+        return None
+    key = ts[0:4] + ts[5:7] + ts[8:10]
+    if granularity == 'hour':
+        key += ts[11:13]
+    return key if key.isdigit() else None
+
+def _key_for(dt, granularity=SQLITE_PARTITION):
+    return partition_key(dt.isoformat(), granularity)
+
+def fts_query(q):
+    """Dashboard query -> FTS5 MATCH expression: bare words and "quoted phrases" are ANDed, and a
+    trailing * makes a prefix match. Everything is quoted, so user input cannot inject FTS5 syntax."""
+    parts = []
+    for phrase, word in RE_QUERY_PART.findall(q or ''):
+        text = phrase if phrase else word.rstrip('*')
+        if not text.strip():
+            continue
+        part = '"' + text.replace('"', '""') + '"'
+        if not phrase and word.endswith('*'):
+            part += '*'
+        parts.append(part)
+    return ' AND '.join(parts)
+
+def es_index_name(ts, prefix=ES_INDEX_PREFIX):
+    """Daily index for a doc timestamp: '2024-11-04T10:01:01Z' -> 'syslogs-2024.11.04'."""
+    key = partition_key(ts, 'day') or _key_for(datetime.utcnow(), 'day')
+    return f'{prefix}-{key[0:4]}.{key[4:6]}.{key[6:8]}'
+
+def es_indices_for(start, end, prefix=ES_INDEX_PREFIX):
+    """Comma-separated daily indices covering [start, end], or the wildcard for long ranges."""
+    days = (end.date() - start.date()).days
+    if days > ES_MAX_INDICES:
+        return prefix + '-*'
+    return ','.join(es_index_name((start + timedelta(days=d)).isoformat(), prefix) for d in range(days + 1))
+
+def _flat(source):
+    # same shape as the SQLite rows, so the dashboard renders either backend
+    return dict(ts=source.get('timestamp'), src_ip=source.get('src_ip'), host=source.get('host'), program=source.get('program'),
+                pid=source.get('pid'), event_type=source.get('parsed', {}).get('event_type'), raw=source.get('raw'))
 
 class Storage:
-    def __init__(self, es_host='http://localhost:9200'):
+    def __init__(self, es_host='http://localhost:9200', db_path='syslogs.db'):
         self.es_host = es_host
+        self.db_path = db_path
+        # the sqlite connection is shared between the writer thread and readers
+        self.lock = threading.Lock()
+        self.partitions = set()
         self.es = None
         self.use_es = False
         if ES_AVAILABLE:
@@ -33,67 +195,289 @@ class Storage:
                 if self.es.ping():
                     self.use_es = True
                     logger.info('Connected to Elasticsearch')
+                    self._init_es()
             except Exception as e:
                 logger.warning('Elasticsearch not available: %s', e)
         if not self.use_es:
             logger.info('Using SQLite for storage')
-            self.conn = sqlite3.connect('syslogs.db', check_same_thread=False)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
             self._init_sqlite()
 
+    def _init_es(self):
+        try:
+            self.es.indices.put_index_template(name=ES_INDEX_PREFIX, body=ES_TEMPLATE)
+        except Exception as e:
+            # indices still work with dynamic mapping, just less efficiently
+            logger.warning('Could not install index template %s: %s', ES_INDEX_PREFIX, e)
+
     def _init_sqlite(self):
-        c = self.conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ts TEXT,
-            src_ip TEXT,
-            host TEXT,
-            program TEXT,
-            pid TEXT,
-            event_type TEXT,
-            raw TEXT
-        )''')
-        c.execute('''CREATE INDEX IF NOT EXISTS idx_event ON logs(event_type)''')
+        # WAL lets the dashboard's connection read while the collector writes
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.partitions = set(self._list_partitions())
+        if SQLITE_FTS:
+            for table in self.partitions:
+                self._create_fts(table)
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'logs'").fetchone():
+            self._migrate_legacy()
         self.conn.commit()
 
+    def _create_fts(self, table):
+        # external-content index: stores only the tokens, rows stay in the partition table
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table + '_fts',)).fetchone():
+            return
+        self.conn.execute(f"CREATE VIRTUAL TABLE {table}_fts USING fts5(raw, content='{table}', content_rowid='id', columnsize=0)")
+        # partitions written before the index existed
+        self.conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+    def _list_partitions(self):
+        rows = self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'logs_%'").fetchall()
+        return [r[0] for r in rows if RE_PARTITION.match(r[0])]
+
+    def _partition(self, ts):
+        """Name of the partition table for ts, creating it if needed. Caller holds the lock."""
+        key = partition_key(ts) or _key_for(datetime.utcnow())
+        table = 'logs_' + key
+        if table not in self.partitions:
+            self.conn.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,
+                ts TEXT,
+                src_ip TEXT,
+                host TEXT,
+                program TEXT,
+                pid TEXT,
+                event_type TEXT,
+                raw TEXT
+            )''')
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_ts ON {table}(ts)')
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_src_ip_ts ON {table}(src_ip, ts)')
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_event_ts ON {table}(event_type, ts)')
+            if SQLITE_FTS:
+                self._create_fts(table)
+            self.partitions.add(table)
+        return table
+
+    def _insert_rows(self, rows):
+        by_table = {}
+        for row in rows:
+            by_table.setdefault(self._partition(row[0]), []).append(row)
+        for table, batch in by_table.items():
+            self.conn.executemany(INSERT_SQL.format(table=table), batch)
+            if SQLITE_FTS:
+                # the inserts took the write lock until commit, so no other worker (--workers share the file) can
+                # have added rows since: this batch is exactly the newest len(batch) ids, each max(id) + 1
+                last = self.conn.execute(f'SELECT max(id) FROM {table}').fetchone()[0]
+                # one statement per batch indexes the new rows several times faster than a per-row trigger
+                self.conn.execute(f'INSERT INTO {table}_fts (rowid, raw) SELECT id, raw FROM {table} WHERE id > ?',
+                                  (last - len(batch),))
+
+    def _migrate_legacy(self):
+        # one-time move of the old single `logs` table into partitions
+        cur = self.conn.execute(f'SELECT {COLUMNS} FROM logs ORDER BY id')
+        moved = 0
+        while True:
+            rows = cur.fetchmany(10000)
+            if not rows:
+                break
+            self._insert_rows(rows)
+            moved += len(rows)
+        self.conn.execute('DROP TABLE logs')
+        logger.info('Migrated %d rows from the legacy logs table into %d partitions', moved, len(self.partitions))
+
+    def drop_expired(self, retention_days=SQLITE_RETENTION_DAYS, now=None):
+        """Drop whole partitions older than the retention period. Returns the dropped table names."""
+        if self.use_es or not retention_days or retention_days <= 0:
+            return []
+        cutoff = _key_for((now or datetime.utcnow()) - timedelta(days=retention_days), 'hour')
+        with self.lock:
+            expired = [t for t in self._list_partitions() if t[5:] < cutoff[:len(t) - 5]]
+            with self.conn:
+                for table in expired:
+                    self.conn.execute(f'DROP TABLE IF EXISTS {table}_fts')
+                    self.conn.execute(f'DROP TABLE IF EXISTS {table}')
+            self.partitions.difference_update(expired)
+        if expired:
+            logger.info('Retention dropped %d partitions older than %s days', len(expired), retention_days)
+        return expired
+
+    def ping(self):
+        """Cheap backend health check, used by the spool's prober."""
+        if self.use_es:
+            return bool(self.es.ping())
+        with self.lock:
+            self.conn.execute('SELECT 1').fetchone()
+        return True
+
     def index(self, doc):
         if self.use_es:
             try:
-                idx = 'syslogs'
-                body = doc.copy()
-                self.es.index(index=idx, body=body)
+                action = _es_action(doc)
+                body = action['_source']
+                self.es.index(index=action['_index'], body=body.copy() if body is doc else body)
             except Exception as e:
                 logger.exception('ES index error: %s', e)
         else:
-            c = self.conn.cursor()
-            c.execute('INSERT INTO logs (ts, src_ip, host, program, pid, event_type, raw) VALUES (?, ?, ?, ?, ?, ?, ?)', (
-                doc.get('timestamp'), doc.get('src_ip'), doc.get('host'), doc.get('program'), doc.get('pid'), doc.get('parsed', {}).get('event_type'), doc.get('raw')
-            ))
-            self.conn.commit()
+            with self.lock:
+                with self.conn:
+                    self._insert_rows([_row(doc)])
+
+    def index_many(self, docs):
+        """Write a batch of docs: one ES bulk request, or one SQLite transaction.
+        Errors are raised to the caller so the batch can be retried or spooled."""
+        if not docs:
+            return 0
+        if self.use_es:
+            actions = [_es_action(doc) for doc in docs]
+            helpers.bulk(self.es, actions)
+        else:
+            with self.lock:
+                with self.conn:
+                    self._insert_rows([_row(doc) for doc in docs])
+        return len(docs)
 
     def search_recent(self, minutes=60, event_type=None, src_ip=None):
-        # Basic sqlite search for demo
+        now = datetime.utcnow()
+        start = now - timedelta(minutes=minutes)
         if self.use_es:
-            # ES query implementation (left simple)
-            q = {"query": {"match_all": {}}}
-            res = self.es.search(index='syslogs', body=q, size=100)
-            return [r['_source'] for r in res['hits']['hits']]
+            filters = [{'range': {'timestamp': {'gte': start.isoformat() + 'Z'}}}]
+            if event_type:
+                filters.append({'term': {'parsed.event_type': event_type}})
+            if src_ip:
+                filters.append({'term': {'src_ip': src_ip}})
+            q = {
+                'query': {'bool': {'filter': filters}},
+                'sort': [{'timestamp': {'order': 'desc'}}],
+                '_source': ES_FIELDS,
+                'size': SEARCH_LIMIT,
+            }
+            # only the daily indices the range touches; days with no logs have no index
+            res = self.es.search(index=es_indices_for(start, now), body=q, ignore_unavailable=True, allow_no_indices=True)
+            return [_flat(r['_source']) for r in res['hits']['hits']]
         else:
-            c = self.conn.cursor()
-            q = 'SELECT ts, src_ip, host, program, pid, event_type, raw FROM logs'
-            conditions = []
-            params = []
+            # stored ts is UTC (the parser converts header offsets), so it compares against a UTC cutoff
+            cutoff = start.isoformat()
+            cutoff_key = partition_key(cutoff, 'hour')
+            conditions = ['ts >= ?']
+            params = [cutoff]
             if event_type:
                 conditions.append('event_type = ?')
                 params.append(event_type)
             if src_ip:
                 conditions.append('src_ip = ?')
                 params.append(src_ip)
-            if conditions:
-                q += ' WHERE ' + ' AND '.join(conditions)
-            q += ' ORDER BY id DESC LIMIT 200'
-            c.execute(q, params)
-            rows = c.fetchall()
+            where = ' AND '.join(conditions)
             results = []
-            for r in rows:
-                results.append(dict(ts=r[0], src_ip=r[1], host=r[2], program=r[3], pid=r[4], event_type=r[5], raw=r[6]))
+            with self.lock:
+                # the dashboard runs in another process, so pick up partitions the collector created
+                tables = [t for t in self._list_partitions() if t[5:] >= cutoff_key[:len(t) - 5]]
+                # newest partition first; stop as soon as the page is full
+                for table in sorted(tables, reverse=True):
+                    q = f'SELECT {COLUMNS} FROM {table} WHERE {where} ORDER BY ts DESC LIMIT {SEARCH_LIMIT - len(results)}'
+                    for r in self.conn.execute(q, params):
+                        results.append(dict(ts=r[0], src_ip=r[1], host=r[2], program=r[3], pid=r[4], event_type=r[5], raw=r[6]))
+                    if len(results) >= SEARCH_LIMIT:
+                        break
             return results
+
+    def search_text(self, q, start=None, end=None, limit=50, cursor=None):
+        """Full-text search over raw messages within [start, end) (datetimes, optional), newest partition
+        first and newest arrival first inside it, so no query sorts all of its matches. Returns (rows, next_cursor); pass next_cursor back to get the following page, None at the end."""
+        limit = max(1, min(int(limit), TEXT_SEARCH_LIMIT))
+        match = fts_query(q)
+        if not match:
+            return [], None
+        if self.use_es:
+            return self._search_text_es(q, start, end, limit, cursor)
+        if not SQLITE_FTS:
+            raise RuntimeError('Full-text search is disabled (SQLITE_FTS=0)')
+        after = None
+        if cursor:
+            m = RE_CURSOR.match(cursor)
+            if not m:
+                raise ValueError(f'Invalid cursor {cursor!r}')
+            after = (m.group(1), int(m.group(2)))
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append('l.ts >= ?')
+            params.append(start.isoformat())
+        if end is not None:
+            conditions.append('l.ts < ?')
+            params.append(end.isoformat())
+        lo = _key_for(start, 'hour') if start is not None else ''
+        hi = _key_for(end, 'hour') if end is not None else None
+        results = []
+        with self.lock:
+            tables = sorted((t for t in self._list_partitions()
+                             if t[5:] >= lo[:len(t) - 5] and (hi is None or t[5:] <= hi[:len(t) - 5])), reverse=True)
+            for table in tables:
+                where = [f'{table}_fts MATCH ?'] + conditions
+                args = [match] + params
+                if after is not None:
+                    if table > after[0]:
+                        continue
+                    if table == after[0]:
+                        where.append('f.rowid < ?')
+                        args.append(after[1])
+                # FTS5 walks its doclist in rowid order, so the LIMIT stops it early
+                sql = (f'SELECT l.id, {TEXT_COLUMNS} FROM {table}_fts f '
+                       f'JOIN {table} l ON l.id = f.rowid WHERE {" AND ".join(where)} '
+                       f'ORDER BY f.rowid DESC LIMIT {limit + 1 - len(results)}')
+                for r in self.conn.execute(sql, args):
+                    results.append((table, r[0], dict(ts=r[1], src_ip=r[2], host=r[3], program=r[4], pid=r[5], event_type=r[6], raw=r[7])))
+                if len(results) > limit:
+                    break
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            table, rowid, _ = results[-1]
+            next_cursor = f'{table}:{rowid}'
+        return [row for _, _, row in results], next_cursor
+
+    def _search_text_es(self, q, start, end, limit, cursor):
+        # pages are read from one point in time, sorted by timestamp and then _shard_doc: header timestamps
+        # often tie (RFC 3164 has whole seconds), and search_after on timestamp alone would skip the rest of a tie
+        after = None
+        if cursor:
+            try:
+                state = json.loads(cursor)
+                pit, after = state['pit'], state['after']
+            except (ValueError, TypeError, KeyError):
+                raise ValueError(f'Invalid cursor {cursor!r}')
+            if not isinstance(pit, str) or not isinstance(after, list):
+                raise ValueError(f'Invalid cursor {cursor!r}')
+        else:
+            index = es_indices_for(start, end or datetime.utcnow()) if start is not None else ES_INDEX_PREFIX + '-*'
+            pit = self.es.open_point_in_time(index=index, keep_alive=ES_PIT_KEEP_ALIVE, ignore_unavailable=True)['id']
+        ts_range = {}
+        if start is not None:
+            ts_range['gte'] = start.isoformat() + 'Z'
+        if end is not None:
+            ts_range['lt'] = end.isoformat() + 'Z'
+        filters = [{'range': {'timestamp': ts_range}}] if ts_range else []
+        body = {
+            'query': {'bool': {
+                'must': [{'simple_query_string': {'query': q, 'fields': ['raw'], 'default_operator': 'and'}}],
+                'filter': filters,
+            }},
+            'sort': [{'timestamp': {'order': 'desc'}}, {'_shard_doc': {'order': 'desc'}}],
+            'pit': {'id': pit, 'keep_alive': ES_PIT_KEEP_ALIVE},
+            '_source': ES_FIELDS,
+            'size': limit,
+        }
+        if after is not None:
+            body['search_after'] = after
+        res = self.es.search(body=body)
+        hits = res['hits']['hits']
+        # the point in time id may change from page to page
+        pit = res.get('pit_id', pit)
+        next_cursor = None
+        if len(hits) == limit:
+            next_cursor = json.dumps({'pit': pit, 'after': hits[-1]['sort']})
+        else:
+            try:
+                self.es.close_point_in_time(body={'id': pit})
+            except Exception as e:
+                # it expires after ES_PIT_KEEP_ALIVE anyway
+                logger.debug('Could not close point in time: %s', e)
+        return [_flat(h['_source']) for h in hits], next_cursor
@@ -0,0 +1,122 @@
+"""
+Alert suppression: one alert per (rule, key) per cooldown instead of one per matching event.
+A rule keeps matching on every event past its threshold, so a 10k-attempt brute force would raise ~10k alerts.
+An AlertSuppressor (one per rule) tracks each key's incident from its first alert:
+- the first match is sent as before, with status 'new';
+- later matches within `cooldown` seconds of the last alert sent are only counted;
+- the first match at least `cooldown` after it is sent as an 'ongoing' update with the running totals;
+- a key that has not matched for `cooldown` seconds closes its incident, with an 'ended' summary if matches
+  were suppressed since the last alert sent. Expiry is checked as the rule sees events, so that summary
+  goes out with the rule's next event.
+Sent alerts carry status, first_seen and last_seen (ISO 8601 UTC), matches (in the incident so far) and
+suppressed (since the previous alert sent). Incidents sit in an OrderedDict ordered by last match, like the
+dedupe cache: expiry stops at the first live one, and past max_keys the least recently matched is dropped.
+Times are event times, the clock the rule windows use.
+"""
+from datetime import datetime, timezone
+from collections import OrderedDict
+
+NEW = 'new'
+ONGOING = 'ongoing'
+ENDED = 'ended'
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+class _Incident:
+    __slots__ = ('first_seen', 'last_seen', 'sent_at', 'matches', 'suppressed', 'alert')
+
+    def __init__(self, ts):
+        self.first_seen = ts
+        self.last_seen = ts
+        self.sent_at = ts
+        self.matches = 1
+        self.suppressed = 0
+        # latest suppressed alert, the base of the 'ended' summary
+        self.alert = None
+
+class AlertSuppressor:
+    def __init__(self, cooldown, max_keys=100000):
+        self.cooldown = cooldown
+        self.max_keys = max_keys
+        # key -> _Incident, least recently matched first
+        self.incidents = OrderedDict()
+        self.sent = 0
+        self.suppressed = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def check(self, key, alert, ts):
+        """Called with each alert the rule raises for key at event time ts; returns the alerts to send."""
+        incidents = self.incidents
+        sent = []
+        incident = incidents.get(key)
+        if incident is not None and ts - incident.last_seen >= self.cooldown:
+            # quiet long enough, but out-of-order event times kept expire() from reaching it
+            del incidents[key]
+            self.expired += 1
+            sent.extend(self._close(incident))
+            incident = None
+        if incident is None:
+            incident = incidents[key] = _Incident(ts)
+            if len(incidents) > self.max_keys:
+                incidents.popitem(last=False)
+                self.evicted += 1
+            sent.append(self._send(incident, alert, NEW))
+            return sent
+        incidents.move_to_end(key)
+        incident.last_seen = max(incident.last_seen, ts)
+        incident.matches += 1
+        if ts - incident.sent_at < self.cooldown:
+            incident.suppressed += 1
+            incident.alert = alert
+            self.suppressed += 1
+            return sent
+        sent.append(self._send(incident, alert, ONGOING))
+        return sent
+
+    def expire(self, ts):
+        """Close incidents quiet for `cooldown` seconds as of event time ts; returns their 'ended' summaries."""
+        incidents = self.incidents
+        cutoff = ts - self.cooldown
+        sent = []
+        while incidents:
+            key, incident = next(iter(incidents.items()))
+            if incident.last_seen > cutoff:
+                break
+            incidents.popitem(last=False)
+            self.expired += 1
+            sent.extend(self._close(incident))
+        return sent
+
+    def _close(self, incident):
+        if not incident.suppressed:
+            return []
+        return [self._send(incident, incident.alert, ENDED)]
+
+    def _send(self, incident, alert, status):
+        alert['status'] = status
+        alert['first_seen'] = _iso(incident.first_seen)
+        alert['last_seen'] = _iso(incident.last_seen)
+        alert['matches'] = incident.matches
+        alert['suppressed'] = incident.suppressed
+        if status != NEW:
+            alert['message'] += (f' ({status}: {incident.matches} matches since {alert["first_seen"]}, '
+                                 f'{incident.suppressed} since the last alert)')
+        incident.sent_at = incident.last_seen
+        incident.suppressed = 0
+        incident.alert = None
+        self.sent += 1
+        return alert
+
+    def __len__(self):
+        return len(self.incidents)
+
+    def stats(self):
+        return {
+            'incidents': len(self.incidents),
+            'alerts_sent': self.sent,
+            'alerts_suppressed': self.suppressed,
+            'incidents_expired': self.expired,
+            'incidents_evicted': self.evicted,
+        }
@@ -0,0 +1,208 @@
+"""
+Live tail: the collector publishes every normalized doc into a fixed-size in-memory ring buffer, and a small
+Server-Sent Events server fans it out to any number of clients (GET /tail?ip=&event_type=&host=).
+Each client only holds a cursor into the ring, so clients never cost the pipeline more than one slot write
+per doc. A client that falls more than the ring's capacity behind skips ahead (it gets a `skipped` event
+with the number of docs it missed); one whose socket stays backed up for TAIL_SLOW_TIMEOUT is dropped.
+Docs are JSON-encoded at most once, on first read, and shared by every client that receives them.
+The stream carries every raw log unauthenticated, so it listens on localhost unless TAIL_HOST says otherwise,
+and browsers may only read it from the dashboard origins in TAIL_ALLOW_ORIGIN; a request from any other
+origin is refused.
+"""
+import os
+import asyncio
+import logging
+from urllib.parse import urlsplit, parse_qs
+from collector.event import dumps
+
+logger = logging.getLogger('tail')
+
+# Configure via environment variables
+TAIL_PORT = int(os.getenv('TAIL_PORT', '5516') or 0)
+TAIL_HOST = os.getenv('TAIL_HOST', '127.0.0.1')
+# comma-separated origins of the dashboard pages allowed to open the stream (the dashboard's default address)
+TAIL_ALLOW_ORIGIN = [o.strip().rstrip('/') for o in
+                     os.getenv('TAIL_ALLOW_ORIGIN', 'http://localhost:5000,http://127.0.0.1:5000').split(',') if o.strip()]
+TAIL_BUFFER_SIZE = int(os.getenv('TAIL_BUFFER_SIZE', '10000'))
+TAIL_MAX_CLIENTS = int(os.getenv('TAIL_MAX_CLIENTS', '100'))
+TAIL_SLOW_TIMEOUT = float(os.getenv('TAIL_SLOW_TIMEOUT', '5'))
+
+# a client is flushed at most this often, so a burst reaches it as one write
+TAIL_INTERVAL = 0.2
+# bytes queued on a client socket before we stop reading the ring for it and wait for it to drain
+TAIL_CLIENT_BUFFER = 256 * 1024
+TAIL_READ_BATCH = 1000
+FILTERS = ('ip', 'event_type', 'host')
+
+class TailBuffer:
+    """Ring of the last `capacity` docs, addressed by a global sequence number. Written and read on the
+    event loop thread."""
+    def __init__(self, capacity=TAIL_BUFFER_SIZE):
+        self.capacity = capacity
+        # [doc, encoded json or None]
+        self.slots = [None] * capacity
+        self.seq = 0
+        self.waiter = None
+
+    def append(self, doc):
+        self.slots[self.seq % self.capacity] = [doc, None]
+        self.seq += 1
+        if self.waiter is not None:
+            if not self.waiter.done():
+                self.waiter.set_result(None)
+            self.waiter = None
+
+    def read(self, cursor, max_docs=TAIL_READ_BATCH):
+        """([(seq, slot)], next_cursor, skipped) for docs from cursor on; skipped counts docs that were
+        overwritten before this reader got to them."""
+        oldest = max(0, self.seq - self.capacity)
+        skipped = 0
+        if cursor < oldest:
+            skipped = oldest - cursor
+            cursor = oldest
+        end = min(self.seq, cursor + max_docs)
+        slots = self.slots
+        cap = self.capacity
+        return [(i, slots[i % cap]) for i in range(cursor, end)], end, skipped
+
+    async def wait(self, cursor):
+        """Return once there is something at or after cursor."""
+        if cursor < self.seq:
+            return
+        if self.waiter is None:
+            self.waiter = asyncio.get_running_loop().create_future()
+        # shared by every waiting client; shielded so one client going away does not cancel it for all
+        await asyncio.shield(self.waiter)
+
+def _encoded(slot):
+    if slot[1] is None:
+        slot[1] = dumps(slot[0])
+    return slot[1]
+
+def matcher(ip=None, event_type=None, host=None):
+    """Predicate for the /tail filters; None when nothing is filtered."""
+    if not (ip or event_type or host):
+        return None
+    def match(doc):
+        parsed = doc.get('parsed') or {}
+        if ip and doc.get('src_ip') != ip and parsed.get('src_ip') != ip:
+            return False
+        if event_type and parsed.get('event_type') != event_type:
+            return False
+        if host and doc.get('host') != host:
+            return False
+        return True
+    return match
+
+def format_events(entries, match=None):
+    # one SSE event per doc; the id lets EventSource resume with Last-Event-ID after a reconnect
+    return [f'id: {seq + 1}\ndata: {_encoded(slot)}\n\n' for seq, slot in entries if match is None or match(slot[0])]
+
+class TailServer:
+    """Minimal HTTP server speaking just enough to serve GET /tail as text/event-stream."""
+    def __init__(self, buffer, max_clients=TAIL_MAX_CLIENTS, slow_timeout=TAIL_SLOW_TIMEOUT, interval=TAIL_INTERVAL,
+                 allow_origins=TAIL_ALLOW_ORIGIN):
+        self.buffer = buffer
+        self.allow_origins = set(allow_origins)
+        self.max_clients = max_clients
+        self.slow_timeout = slow_timeout
+        self.interval = interval
+        self.clients = 0
+        self.served = 0
+        self.sent = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.server = None
+
+    async def start(self, host=TAIL_HOST, port=TAIL_PORT):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode('latin-1').split('\r\n')
+        parts = lines[0].split()
+        headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+        headers = {k.strip().lower(): v.strip() for k, v in headers.items()}
+        url = urlsplit(parts[1]) if len(parts) == 3 else None
+        if url is None or parts[0] != 'GET' or url.path != '/tail':
+            await self._reply(writer, '404 Not Found', 'not found\n')
+            return
+        # browsers send Origin on cross-origin EventSource requests; other web pages must not read the logs
+        origin = headers.get('origin')
+        if origin is not None and origin not in self.allow_origins:
+            await self._reply(writer, '403 Forbidden', 'origin not allowed\n')
+            return
+        if self.clients >= self.max_clients:
+            await self._reply(writer, '503 Service Unavailable', 'too many tail clients\n')
+            return
+        args = {k: v[0] for k, v in parse_qs(url.query).items()}
+        match = matcher(*(args.get(f) for f in FILTERS))
+        cursor = self.buffer.seq
+        try:
+            # resume after a reconnect, or start with up to ?backlog= recent docs
+            if headers.get('last-event-id'):
+                cursor = min(int(headers['last-event-id']), cursor)
+            elif args.get('backlog'):
+                cursor = max(0, cursor - int(args['backlog']))
+        except ValueError:
+            await self._reply(writer, '400 Bad Request', 'bad cursor\n')
+            return
+        cors = b'Access-Control-Allow-Origin: %s\r\nVary: Origin\r\n' % origin.encode('latin-1') if origin else b''
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n' + cors +
+                     b'Connection: keep-alive\r\n\r\nretry: 2000\n\n')
+        self.clients += 1
+        self.served += 1
+        try:
+            await self._stream(writer, cursor, match)
+        except (ConnectionError, asyncio.TimeoutError, asyncio.CancelledError):
+            # disconnected, timed out, or the collector is shutting down
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def _stream(self, writer, cursor, match):
+        transport = writer.transport
+        while not transport.is_closing():
+            await self.buffer.wait(cursor)
+            entries, cursor, skipped = self.buffer.read(cursor)
+            if skipped:
+                self.skipped += skipped
+                writer.write(f'event: skipped\ndata: {skipped}\n\n'.encode())
+            events = format_events(entries, match)
+            if events:
+                writer.write(''.join(events).encode())
+                self.sent += len(events)
+            if transport.get_write_buffer_size() > TAIL_CLIENT_BUFFER:
+                # stop reading the ring for this client until its socket drains; give up if it never does
+                try:
+                    await asyncio.wait_for(writer.drain(), self.slow_timeout)
+                except asyncio.TimeoutError:
+                    self.dropped += 1
+                    logger.info('Dropping tail client %s, not reading for %.0fs', writer.get_extra_info('peername'), self.slow_timeout)
+                    transport.abort()
+                    return
+            if cursor < self.buffer.seq:
+                await asyncio.sleep(self.interval)
+
+    async def _reply(self, writer, status, body):
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n'
+                     f'Connection: close\r\n\r\n{body}'.encode())
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def stats(self):
+        return {'clients': self.clients, 'served': self.served, 'sent': self.sent, 'skipped': self.skipped,
+                'dropped': self.dropped, 'buffered': min(self.buffer.seq, self.buffer.capacity)}
@@ -0,0 +1,238 @@
+"""
+Online log-template mining for messages no extractor recognizes, after Drain (He et al., ICWS 2017).
+Tokens containing a digit are masked to <*> up front. A message is routed down a fixed-depth tree (program
+and token count, then its first TEMPLATE_DEPTH - 2 tokens, with masked tokens and overflow past
+TEMPLATE_MAX_CHILDREN going to a <*> child) to a leaf holding a few clusters, and joins the most similar one
+(share of positions with equal tokens >= TEMPLATE_SIMILARITY), whose template then turns the differing
+positions into <*>; otherwise it starts a new cluster. The message's values at <*> positions are its params.
+Template ids are a hash of program + template text, so separate processes (collector workers, replay pool
+workers, a restart) that learn the same template give it the same id.
+Clusters are kept in LRU order and capped at TEMPLATE_MAX_CLUSTERS. Most traffic repeats a few shapes, so two
+memos sit in front of the tree: the message bytes with every digit turned into '0' (bytes.translate, a few
+hundred ns), then the message with its variable tokens masked (a regex pass, a couple of us). Either hit
+skips the tree and the similarity scan.
+"""
+import os
+import re
+import json
+import logging
+import hashlib
+from collections import OrderedDict
+
+logger = logging.getLogger('templates')
+
+# Configure via environment variables
+TEMPLATE_MINING = os.getenv('TEMPLATE_MINING', '1') not in ('0', 'false', 'no')
+TEMPLATE_DEPTH = int(os.getenv('TEMPLATE_DEPTH', '4'))
+TEMPLATE_SIMILARITY = float(os.getenv('TEMPLATE_SIMILARITY', '0.4'))
+TEMPLATE_MAX_CHILDREN = int(os.getenv('TEMPLATE_MAX_CHILDREN', '100'))
+TEMPLATE_MAX_CLUSTERS = int(os.getenv('TEMPLATE_MAX_CLUSTERS', '5000'))
+
+WILDCARD = '<*>'
+# a whitespace-separated token with a digit in it; lazy and anchored at token starts, which is several
+# times faster than the equivalent \S*\d\S* on long lines
+RE_VARIABLE = re.compile(r'(?<!\S)\S*?[0-9]\S*')
+ZERO_DIGITS = bytes.maketrans(b'123456789', b'000000000')
+# entries and key bytes per memo; a full memo is cleared. Keys are whole messages (up to TCP_MAX_MESSAGE), so
+# the byte cap is what bounds memory on long lines, and a message over MEMO_MAX_KEY is never memoized
+MEMO_MAX = 20000
+MEMO_MAX_BYTES = 8 * 1024 * 1024
+MEMO_MAX_KEY = 4096
+
+def _template_id(program, template):
+    return hashlib.blake2b(f'{program} {template}'.encode('utf-8', 'surrogatepass'), digest_size=4).hexdigest()
+
+class _Cluster:
+    __slots__ = ('program', 'tokens', 'template', 'id', 'slots', 'count', 'leaf')
+
+    def __init__(self, program, tokens, count=1):
+        self.program = program
+        self.tokens = tokens
+        self.count = count
+        self.leaf = None
+        self._rename()
+
+    def _rename(self):
+        self.template = ' '.join(self.tokens)
+        self.id = _template_id(self.program, self.template)
+        # token positions that are params
+        self.slots = [i for i, t in enumerate(self.tokens) if t == WILDCARD]
+
+    def similarity(self, tokens):
+        # share of positions where the template has this exact token; <*> positions never count
+        same = 0
+        for t, tok in zip(self.tokens, tokens):
+            if t == tok and t != WILDCARD:
+                same += 1
+        return same / len(tokens)
+
+    def absorb(self, tokens):
+        """Generalize the template to cover tokens; True if it changed."""
+        merged = [t if t == tok else WILDCARD for t, tok in zip(self.tokens, tokens)]
+        if merged == self.tokens:
+            return False
+        self.tokens = merged
+        self._rename()
+        return True
+
+class TemplateMiner:
+    def __init__(self, depth=TEMPLATE_DEPTH, similarity=TEMPLATE_SIMILARITY, max_children=TEMPLATE_MAX_CHILDREN,
+                 max_clusters=TEMPLATE_MAX_CLUSTERS):
+        # levels below the (program, length) root that route on a token
+        self.prefix = max(0, depth - 2)
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        # (program, token count) -> nested dicts of prefix tokens -> leaf list of clusters
+        self.root = {}
+        # every live cluster, least recently matched first
+        self.clusters = OrderedDict()
+        # (program, message bytes with digits zeroed) -> cluster
+        self.memo = {}
+        # (program, message with variable tokens collapsed to '0') -> cluster
+        self.shapes = {}
+        self.memo_bytes = 0
+        self.shapes_bytes = 0
+        self.matched = 0
+        self.created = 0
+        self.evicted = 0
+        self.memo_hits = 0
+        self.shape_hits = 0
+
+    def match(self, program, message):
+        """The parsed dict for an unclassified message: event_type plus template_id, template and params."""
+        key = (program, message.encode('utf-8', 'surrogatepass').translate(ZERO_DIGITS))
+        cluster = self.memo.get(key)
+        if cluster is not None and cluster.leaf is not None:
+            self.memo_hits += 1
+        else:
+            cluster = self._find(program, message)
+            if cluster is None:
+                return {'event_type': 'unclassified'}
+            size = len(key[1])
+            if size <= MEMO_MAX_KEY:
+                if len(self.memo) >= MEMO_MAX or self.memo_bytes + size > MEMO_MAX_BYTES:
+                    self.memo.clear()
+                    self.memo_bytes = 0
+                self.memo[key] = cluster
+                self.memo_bytes += size
+        cluster.count += 1
+        self.matched += 1
+        self.clusters.move_to_end(cluster)
+        values = message.split()
+        return {'event_type': 'unclassified', 'template_id': cluster.id, 'template': cluster.template,
+                'params': [values[i] for i in cluster.slots]}
+
+    def _find(self, program, message):
+        shape = RE_VARIABLE.sub('0', message)
+        key = (program, shape)
+        cluster = self.shapes.get(key)
+        if cluster is not None and cluster.leaf is not None:
+            self.shape_hits += 1
+            return cluster
+        # every token with a digit is exactly '0' in shape
+        tokens = [WILDCARD if tok == '0' else tok for tok in shape.split()]
+        if not tokens:
+            return None
+        cluster = self._add(program, tokens)
+        size = len(shape)
+        if size <= MEMO_MAX_KEY:
+            if len(self.shapes) >= MEMO_MAX or self.shapes_bytes + size > MEMO_MAX_BYTES:
+                self.shapes.clear()
+                self.shapes_bytes = 0
+            self.shapes[key] = cluster
+            self.shapes_bytes += size
+        return cluster
+
+    def _leaf(self, program, tokens, create):
+        # the leaf list for these tokens, or None when the path does not exist and create is False
+        node = self.root.get((program, len(tokens)))
+        if node is None:
+            if not create:
+                return None
+            node = self.root[(program, len(tokens))] = {}
+        for tok in tokens[:self.prefix]:
+            child = node.get(tok)
+            if child is None:
+                if create and len(node) < self.max_children:
+                    child = node[tok] = {}
+                else:
+                    # unseen tokens, and every new token once a node is full, share the <*> branch
+                    child = node.get(WILDCARD)
+                    if child is None:
+                        if not create:
+                            return None
+                        child = node[WILDCARD] = {}
+            node = child
+        if create:
+            return node.setdefault(None, [])
+        return node.get(None)
+
+    def _add(self, program, tokens):
+        leaf = self._leaf(program, tokens, create=False)
+        if leaf:
+            best, score = None, -1.0
+            for cluster in leaf:
+                s = cluster.similarity(tokens)
+                if s > score:
+                    best, score = cluster, s
+            if score >= self.similarity:
+                best.absorb(tokens)
+                return best
+        cluster = _Cluster(program, tokens, count=0)
+        self._insert(cluster)
+        return cluster
+
+    def _insert(self, cluster):
+        leaf = self._leaf(cluster.program, cluster.tokens, create=True)
+        leaf.append(cluster)
+        cluster.leaf = leaf
+        self.clusters[cluster] = None
+        self.created += 1
+        while len(self.clusters) > self.max_clusters:
+            old, _ = self.clusters.popitem(last=False)
+            old.leaf.remove(old)
+            old.leaf = None
+            self.evicted += 1
+
+    def templates(self):
+        """[(template_id, program, template, count)], most recently matched first."""
+        return [(c.id, c.program, c.template, c.count) for c in reversed(self.clusters)]
+
+    def snapshot(self):
+        # JSON-ready; cheap enough to take on the event loop and write elsewhere
+        return {'version': 1, 'clusters': [[c.program, c.tokens, c.count] for c in self.clusters]}
+
+    def restore(self, snapshot):
+        for program, tokens, count in snapshot.get('clusters', []):
+            self._insert(_Cluster(program, list(tokens), count))
+        self.created = 0
+        return len(self.clusters)
+
+    def save(self, path, snapshot=None):
+        snapshot = snapshot if snapshot is not None else self.snapshot()
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """Restore templates saved by save(); a missing or unreadable file starts empty."""
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning('Ignoring unreadable template file %s: %s', path, e)
+            return 0
+        n = self.restore(snapshot)
+        logger.info('Loaded %d log templates from %s', n, path)
+        return n
+
+    def stats(self):
+        return {'templates': len(self.clusters), 'matched': self.matched, 'created': self.created,
+                'evicted': self.evicted, 'memo_hits': self.memo_hits, 'shape_hits': self.shape_hits}
+
+# used by collector.parser for messages no extractor matched; None when mining is disabled
+MINER = TemplateMiner() if TEMPLATE_MINING else None
@@ -0,0 +1,302 @@
+"""
+Memory-bounded sliding-window state for the analyzer.
+Each key (usually a source IP) maps to a compact array of int64 epoch seconds instead of a deque of datetimes.
+Keys are kept in least-recently-touched order so that keys idle for longer than idle_ttl expire, and the
+least recently touched keys are evicted first when the global key/event caps are reached.
+State restored from a checkpoint stays "cold" in its columnar form and a key is only materialized when it
+is next touched, so a warm restart does not build millions of per-key objects up front.
+"""
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from collections import OrderedDict
+
+# default per-key history: event times (WindowStore) or distinct values (DistinctStore) kept for one key
+MAX_PER_KEY = 1024
+
+class _ColdEntries:
+    # Columnar entries loaded from a checkpoint snapshot. Keys are sorted so lookups are a bisect rather than
+    # a dict built at load time; `order` lists key positions least recently touched first, and `alive` marks
+    # positions not yet promoted to the live map or dropped.
+    def __init__(self, keys, counts, times, values=None, order=None):
+        self.keys = keys
+        self.counts = counts
+        self.ends = array('q', accumulate(counts))
+        self.times = times
+        self.values = values
+        self.order = order if order is not None else range(len(keys))
+        self.alive = bytearray(b'\x01') * len(keys)
+        self.live = len(keys)
+        self.pos = 0
+
+    def find(self, key):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key and self.alive[i]:
+            return i
+        return None
+
+    def remove(self, i):
+        self.alive[i] = 0
+        self.live -= 1
+
+    def entry(self, i):
+        end = self.ends[i]
+        start = end - self.counts[i]
+        if self.values is None:
+            return self.times[start:end]
+        return dict(zip(self.values[start:end], self.times[start:end]))
+
+    def newest(self, i):
+        return self.times[self.ends[i] - 1]
+
+    def oldest(self):
+        order, alive = self.order, self.alive
+        while self.pos < len(order):
+            i = order[self.pos]
+            if alive[i]:
+                return i
+            self.pos += 1
+        return None
+
+    def ordered_keys(self):
+        return [self.keys[i] for i in self.order if self.alive[i]]
+
+class _KeyedState:
+    # Shared LRU bookkeeping: subclasses store one entry per key and report its size and newest event time.
+    def __init__(self, window, idle_ttl=None, max_keys=200000, max_events=2000000):
+        self.window = int(window)
+        self.idle_ttl = int(idle_ttl or window)
+        self.max_keys = max_keys
+        self.max_events = max_events
+        self.keys = OrderedDict()
+        self.cold = None
+        self.events = 0
+        # newest event time seen; idle expiry is measured against event time, not wall-clock time
+        # (the analyzer caps event times at receive time + ANALYZER_MAX_SKEW, so one future header cannot jump it)
+        self.high_water = 0
+        self.expired_at = None
+        # set of keys changed since the last checkpoint, when a Checkpointer is tracking this store
+        self.dirty = None
+        self.evictions = 0
+        self.expirations = 0
+
+    def _newest(self, entry):
+        raise NotImplementedError
+
+    def _take_cold(self, key):
+        """Move a checkpointed key into the live (hot) map; returns its entry or None."""
+        cold = self.cold
+        if cold is None:
+            return None
+        i = cold.find(key)
+        if i is None:
+            return None
+        entry = self.keys[key] = cold.entry(i)
+        self._remove_cold(i)
+        return entry
+
+    def _remove_cold(self, i):
+        self.cold.remove(i)
+        if not self.cold.live:
+            self.cold = None
+
+    def peek(self, key):
+        """Entry for key without touching it or promoting it from the checkpoint base, or None."""
+        entry = self.keys.get(key)
+        if entry is None and self.cold is not None:
+            i = self.cold.find(key)
+            if i is not None:
+                return self.cold.entry(i)
+        return entry
+
+    def __len__(self):
+        return len(self.keys) + (self.cold.live if self.cold else 0)
+
+    def __contains__(self, key):
+        return key in self.keys or (self.cold is not None and self.cold.find(key) is not None)
+
+    def ordered_keys(self):
+        """All keys, least recently touched first."""
+        cold = self.cold.ordered_keys() if self.cold else []
+        return cold + list(self.keys)
+
+    def _drop_key(self, key, count):
+        self.events -= count
+        if self.dirty is not None:
+            self.dirty.add(key)
+
+    def _drop_oldest(self):
+        # checkpointed keys were all touched before any live key
+        cold = self.cold
+        i = cold.oldest() if cold is not None else None
+        if i is not None:
+            self._drop_key(cold.keys[i], cold.counts[i])
+            self._remove_cold(i)
+            return
+        key, entry = self.keys.popitem(last=False)
+        self._drop_key(key, len(entry))
+
+    def _oldest_newest(self, current):
+        """Newest event time of the least recently touched key, or None if that key is `current`."""
+        cold = self.cold
+        if cold is not None:
+            i = cold.oldest()
+            if i is not None:
+                return cold.newest(i)
+        if not self.keys:
+            return None
+        key, entry = next(iter(self.keys.items()))
+        return None if key == current else self._newest(entry)
+
+    def _enforce_limits(self, current):
+        # expiry can only make progress once event time has moved on
+        if self.expired_at != self.high_water:
+            self.expired_at = self.high_water
+            cutoff = self.high_water - self.idle_ttl
+            while True:
+                newest = self._oldest_newest(current)
+                if newest is None or newest >= cutoff:
+                    break
+                self._drop_oldest()
+                self.expirations += 1
+        while len(self) > 1 and (len(self) > self.max_keys or self.events > self.max_events):
+            self._drop_oldest()
+            self.evictions += 1
+
+    def restore(self, keys, counts, times, values, high_water, order=None, replace=True, deleted=()):
+        """Load checkpointed columnar state. A snapshot (sorted keys plus LRU order) becomes the cold base;
+        deltas (keys in LRU order) are applied eagerly on top of it."""
+        if replace:
+            self.keys = OrderedDict()
+            self.cold = _ColdEntries(keys, counts, times, values, order) if keys else None
+            self.events = len(times)
+        else:
+            delta = _ColdEntries(keys, counts, times, values)
+            for key in deleted:
+                self._discard(key)
+            for i, key in enumerate(keys):
+                self._discard(key)
+                entry = self.keys[key] = delta.entry(i)
+                self.events += len(entry)
+        self.high_water = max(self.high_water, high_water)
+
+    def _discard(self, key):
+        entry = self.keys.pop(key, None)
+        if entry is not None:
+            self.events -= len(entry)
+        elif self.cold is not None:
+            i = self.cold.find(key)
+            if i is not None:
+                self.events -= self.cold.counts[i]
+                self._remove_cold(i)
+
+    def stats(self):
+        return {
+            'keys': len(self),
+            'events': self.events,
+            'approx_bytes': self.approx_bytes(),
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+class WindowStore(_KeyedState):
+    """Per-key event times within a sliding window; add() returns the in-window count."""
+    def __init__(self, window, idle_ttl=None, max_keys=200000, max_events=2000000, max_events_per_key=MAX_PER_KEY):
+        super().__init__(window, idle_ttl, max_keys, max_events)
+        self.max_events_per_key = max_events_per_key
+
+    def _newest(self, arr):
+        return arr[-1]
+
+    def add(self, key, ts):
+        """Record an event at epoch second ts and return how many events key has within the window."""
+        ts = int(ts)
+        if ts > self.high_water:
+            self.high_water = ts
+        arr = self.keys.get(key)
+        if arr is not None:
+            self.keys.move_to_end(key)
+        else:
+            arr = self._take_cold(key)
+            if arr is None:
+                arr = self.keys[key] = array('q')
+        before = len(arr)
+        if not arr or ts >= arr[-1]:
+            arr.append(ts)
+        else:
+            # events can arrive slightly out of order; keep the ring sorted
+            arr.insert(bisect_right(arr, ts), ts)
+        # drop events that fell out of the window, plus the oldest if the key is over its own cap
+        cut = bisect_right(arr, arr[-1] - self.window - 1)
+        cut = max(cut, len(arr) - self.max_events_per_key)
+        if cut:
+            del arr[:cut]
+        self.events += len(arr) - before
+        if self.dirty is not None:
+            self.dirty.add(key)
+        self._enforce_limits(key)
+        return len(arr)
+
+    def last(self, key):
+        """Most recent event time for key, or None. Never allocates state for unknown keys."""
+        arr = self.keys.get(key)
+        if arr is None and self.cold is not None:
+            i = self.cold.find(key)
+            return None if i is None else self.cold.newest(i)
+        return arr[-1] if arr else None
+
+    def count(self, key):
+        arr = self.keys.get(key)
+        if arr is None and self.cold is not None:
+            i = self.cold.find(key)
+            return 0 if i is None else self.cold.counts[i]
+        return len(arr) if arr else 0
+
+    def approx_bytes(self):
+        # 8 bytes per event plus the array and dict-slot overhead per key
+        return self.events * 8 + len(self) * (sys.getsizeof(array('q')) + 100)
+
+class DistinctStore(_KeyedState):
+    """Per-key distinct values within a sliding window (e.g. usernames tried from one IP)."""
+    def __init__(self, window, idle_ttl=None, max_keys=200000, max_events=2000000, max_values_per_key=MAX_PER_KEY):
+        super().__init__(window, idle_ttl, max_keys, max_events)
+        self.max_values_per_key = max_values_per_key
+
+    def _newest(self, values):
+        return next(reversed(values.values()))
+
+    def add(self, key, value, ts):
+        """Record value for key at epoch second ts and return the number of distinct values in the window."""
+        ts = int(ts)
+        if ts > self.high_water:
+            self.high_water = ts
+        values = self.keys.get(key)
+        if values is not None:
+            self.keys.move_to_end(key)
+        else:
+            values = self._take_cold(key)
+            if values is None:
+                values = self.keys[key] = {}
+        before = len(values)
+        # dicts keep insertion order, so re-inserting keeps values ordered by last sighting
+        values.pop(value, None)
+        values[value] = ts
+        cutoff = ts - self.window
+        while len(values) > self.max_values_per_key or next(iter(values.values())) < cutoff:
+            del values[next(iter(values))]
+        self.events += len(values) - before
+        if self.dirty is not None:
+            self.dirty.add(key)
+        self._enforce_limits(key)
+        return len(values)
+
+    def count(self, key):
+        values = self.keys.get(key)
+        if values is None and self.cold is not None:
+            i = self.cold.find(key)
+            return 0 if i is None else self.cold.counts[i]
+        return len(values) if values else 0
+
+    def approx_bytes(self):
+        return self.events * 100 + len(self) * 300
@@ -0,0 +1,136 @@
+"""
+Buffered write stage between the ingest loop and Storage.
+Docs are queued in-process and flushed from a background thread when either the batch size
+or the flush interval is reached, so storage I/O (SQLite commits, ES round trips) never blocks the event loop.
+With a Spool attached, storage calls move to the spool's background thread, and batches the backend
+cannot take right now go to disk and are replayed later (see collector/spool.py) instead of being lost.
+"""
+import os
+import time
+import queue
+import logging
+import threading
+from collector.spool import SpoolReplayer
+from collector.metrics import Histogram
+
+logger = logging.getLogger('writer')
+
+# Configure via environment variables
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '500'))
+WRITE_FLUSH_INTERVAL = float(os.getenv('WRITE_FLUSH_INTERVAL', '1.0'))
+WRITE_QUEUE_MAX = int(os.getenv('WRITE_QUEUE_MAX', '100000'))
+
+_STOP = object()
+
+class BatchWriter:
+    def __init__(self, storage, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL, max_queue=WRITE_QUEUE_MAX, spool=None):
+        self.storage = storage
+        self.spool = spool
+        # storage write latency, whichever thread does the writing
+        self.flush_seconds = Histogram()
+        self.replayer = SpoolReplayer(spool, storage, flush_seconds=self.flush_seconds) if spool is not None else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        # counters, read through stats()
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+        self.dropped = 0
+        self.spooled = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.last_batch_size = 0
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='batch-writer', daemon=True)
+            self.thread.start()
+            if self.replayer is not None:
+                self.replayer.start()
+        return self
+
+    def submit(self, doc):
+        """Queue a doc for writing. Never blocks; a full queue drops the doc and counts it."""
+        try:
+            self.queue.put_nowait(doc)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning('Write queue full (%d), dropped %d docs so far', self.queue.maxsize, self.dropped)
+            return False
+
+    def stop(self, timeout=10):
+        """Flush whatever is queued and stop the writer thread."""
+        if self.thread is None:
+            return
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+        self.thread = None
+        if self.replayer is not None:
+            # whatever is still spooled is replayed on the next start
+            self.replayer.stop()
+            self.spool.close()
+
+    def stats(self):
+        stats = {
+            'queue_depth': self.queue.qsize(),
+            'flushes': self.flushes,
+            'written': self.written,
+            'errors': self.errors,
+            'dropped': self.dropped,
+            'spooled': self.spooled,
+            'last_batch_size': self.last_batch_size,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'max_flush_ms': round(self.max_flush_ms, 3),
+        }
+        if self.replayer is not None:
+            stats['spool'] = self.replayer.stats()
+        return stats
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch):
+        if self.replayer is not None:
+            # backend writes happen on the replay thread; this only waits on local disk if it spools
+            if not self.replayer.submit(batch):
+                self.spooled += len(batch)
+            return
+        t0 = time.perf_counter()
+        try:
+            self.storage.index_many(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.errors += 1
+            logger.exception('Batch write of %d docs failed: %s', len(batch), e)
+        elapsed = time.perf_counter() - t0
+        self.flush_seconds.observe(elapsed)
+        ms = elapsed * 1000
+        self.flushes += 1
+        self.last_flush_ms = ms
+        self.last_batch_size = len(batch)
+        if ms > self.max_flush_ms:
+            self.max_flush_ms = ms
+        logger.debug('Flushed %d docs in %.1f ms (queue depth %d)', len(batch), ms, self.queue.qsize())
@@ -0,0 +1,120 @@
+import json
+import time
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from collector.alerting import Alerting, EmailSink, SlackSink, SinkWorker, RateLimiter
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Just enough SMTP to accept messages; records connections and message subjects."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        self.connections = 0
+        self.subjects = []
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connections += 1
+        self.wfile.write(b'220 standin ESMTP\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line[:4].upper()
+            if cmd == b'DATA':
+                self.wfile.write(b'354 go ahead\r\n')
+                body = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b'.\r\n', b''):
+                        break
+                    body.append(data)
+                subject = [l for l in body if l.startswith(b'Subject:')]
+                self.server.subjects.append(subject[0].decode().strip() if subject else '')
+                self.wfile.write(b'250 queued\r\n')
+            elif cmd == b'QUIT':
+                self.wfile.write(b'221 bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 ok\r\n')
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    posts = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        WebhookHandler.posts.append(json.loads(body))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+def _wait_for(cond, timeout=5):
+    deadline = time.time() + timeout
+    while not cond() and time.time() < deadline:
+        time.sleep(0.01)
+    return cond()
+
+def _alert(i):
+    return {'type': 'ssh_bruteforce_threshold', 'ip': '10.0.0.%d' % i, 'message': 'alert %d' % i}
+
+def test_email_digest_reuses_connection():
+    server = SMTPStandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sink = EmailSink(host='127.0.0.1', port=server.server_address[1])
+    alerting = Alerting(sinks=[(sink, 600)])
+    alerting.workers[0].coalesce_window = 0.2
+    for i in range(5):
+        alerting.send(_alert(i))
+    assert _wait_for(lambda: server.subjects)
+    alerting.send(_alert(9))
+    assert _wait_for(lambda: len(server.subjects) == 2)
+    stats = alerting.stats()['email']
+    alerting.close()
+    server.shutdown()
+    assert server.subjects[0] == 'Subject: Syslog Alerts: 5 alerts (ssh_bruteforce_threshold)'
+    assert server.connections == 1
+    assert stats['delivered'] == 6 and stats['digests'] == 2
+
+def test_slack_sink_posts_digest():
+    WebhookHandler.posts = []
+    httpd = HTTPServer(('127.0.0.1', 0), WebhookHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    worker = SinkWorker(SlackSink('http://127.0.0.1:%d/hook' % httpd.server_address[1]), rate=600, coalesce_window=0.1)
+    worker.submit(_alert(1))
+    worker.submit(_alert(2))
+    assert _wait_for(lambda: worker.stats()['delivered'] == 2)
+    worker.stop()
+    httpd.shutdown()
+    assert len(WebhookHandler.posts) == 1
+    assert 'alert 1' in WebhookHandler.posts[0]['text'] and 'alert 2' in WebhookHandler.posts[0]['text']
+
+def test_failed_delivery_retries_then_gives_up():
+    class Broken:
+        name = 'broken'
+        calls = 0
+        def deliver(self, alerts):
+            Broken.calls += 1
+            raise OSError('down')
+        def close(self):
+            pass
+    worker = SinkWorker(Broken(), rate=600, coalesce_window=0, max_retries=2, backoff=0.01)
+    worker.submit(_alert(1))
+    assert _wait_for(lambda: worker.stats()['failed'] == 1)
+    worker.stop()
+    assert Broken.calls == 3
+    assert worker.stats()['retries'] == 2
+
+def test_rate_limiter_waits_when_bucket_empty():
+    now = [0.0]
+    limiter = RateLimiter(rate=60, burst=1, clock=lambda: now[0])
+    assert limiter.wait_time() == 0
+    limiter.acquire()
+    assert limiter.wait_time() == 1.0
+    now[0] = 1.0
+    assert limiter.wait_time() == 0
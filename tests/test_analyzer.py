@@ -18,3 +18,19 @@ def test_bruteforce_then_success():
     res2 = a.process(doc2)
     assert res2 is not None
     assert res2['type'] == 'intrusion_suspected'
+
+def test_future_timestamp_does_not_expire_live_windows():
+    a = Analyzer(DummyStorage(), rules=[{'name': 'bf', 'type': 'threshold', 'event_type': 'ssh_failed', 'window': 600, 'threshold': 5}])
+    rule = a.rules[0]
+
+    def doc(ip, ts, received):
+        return {'parsed': {'event_type': 'ssh_failed', 'src_ip': ip}, 'timestamp': ts, 'received_ts': received}
+
+    for i in range(3):
+        a.process(doc('1.2.3.4', '2024-11-04T10:00:0%dZ' % i, '2024-11-04T10:00:0%dZ' % i))
+    # a forged header decades ahead is capped to its receive time plus the allowed skew
+    a.process(doc('6.6.6.6', '2099-01-01T00:00:00Z', '2024-11-04T10:00:05Z'))
+    assert rule.state.high_water < a._epoch('2024-11-04T10:10:00Z')
+    assert '1.2.3.4' in rule.state
+    alerts = [a.process(doc('1.2.3.4', '2024-11-04T10:00:1%dZ' % i, '2024-11-04T10:00:1%dZ' % i)) for i in range(2)]
+    assert alerts[1] is not None and alerts[1]['count'] == 5
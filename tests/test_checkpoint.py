@@ -0,0 +1,97 @@
+import os
+from collector.analyzer import Analyzer
+from collector.checkpoint import Checkpointer
+
+RULES = [
+    {'name': 'fails', 'type': 'threshold', 'event_type': 'ssh_failed', 'window': 600, 'threshold': 5},
+    {'name': 'users', 'type': 'distinct', 'event_type': 'ssh_failed', 'field': 'user', 'window': 600, 'threshold': 3},
+]
+
+def analyzer():
+    return Analyzer(None, rules=RULES)
+
+def restart(directory):
+    a = analyzer()
+    cp = Checkpointer(a, directory=str(directory))
+    cp.load()
+    return a, cp
+
+def test_round_trip_through_snapshot(tmp_path):
+    a = analyzer()
+    cp = Checkpointer(a, directory=str(tmp_path))
+    fails, users = a.rules[0].state, a.rules[1].state
+    for t in (100, 110, 120):
+        fails.add('10.0.0.1', t)
+    fails.add('10.0.0.2', 130)
+    users.add('10.0.0.1', 'root', 100)
+    users.add('10.0.0.1', 'admin', 105)
+    cp.save(compact=True)
+    cp.wait()
+    assert os.path.exists(cp.snapshot_path)
+    assert not [f for f in os.listdir(tmp_path) if '.delta.' in f]
+
+    b, _ = restart(tmp_path)
+    fails, users = b.rules[0].state, b.rules[1].state
+    assert fails.count('10.0.0.1') == 3
+    assert fails.last('10.0.0.2') == 130
+    assert users.count('10.0.0.1') == 2
+    # restored keys keep counting where they left off
+    assert fails.add('10.0.0.1', 140) == 4
+    assert users.add('10.0.0.1', 'guest', 150) == 3
+    assert fails.ordered_keys() == ['10.0.0.2', '10.0.0.1']
+
+def test_deltas_apply_on_top_of_snapshot(tmp_path):
+    a = analyzer()
+    cp = Checkpointer(a, directory=str(tmp_path), compact_every=100)
+    fails = a.rules[0].state
+    fails.add('a', 100)
+    fails.add('b', 100)
+    cp.save(compact=True)
+    cp.wait()
+    fails.add('a', 200)
+    fails.keys.pop('b')
+    fails._drop_key('b', 1)
+    cp.save()
+    cp.wait()
+
+    b, cp2 = restart(tmp_path)
+    fails = b.rules[0].state
+    assert fails.count('a') == 2
+    assert 'b' not in fails
+    assert cp2.seq == 2
+    # the next delta continues the numbering rather than overwriting an existing file
+    fails.add('c', 300)
+    cp2.save()
+    cp2.wait()
+    assert os.path.exists(os.path.join(str(tmp_path), 'analyzer.delta.3'))
+
+def test_compaction_drops_folded_deltas(tmp_path):
+    a = analyzer()
+    cp = Checkpointer(a, directory=str(tmp_path), compact_every=2)
+    fails = a.rules[0].state
+    for i, key in enumerate(['a', 'b', 'c']):
+        fails.add(key, i)
+        cp.save()
+    cp.wait()
+    assert sorted(os.listdir(tmp_path)) == ['analyzer.delta.3', 'analyzer.snap']
+
+    b, _ = restart(tmp_path)
+    assert b.rules[0].state.ordered_keys() == ['a', 'b', 'c']
+
+def test_stale_deltas_are_ignored(tmp_path):
+    a = analyzer()
+    cp = Checkpointer(a, directory=str(tmp_path))
+    a.rules[0].state.add('a', 100)
+    cp.save(compact=True)
+    cp.wait()
+    # a delta already folded into the snapshot, e.g. left behind by a crash during compaction
+    with open(os.path.join(str(tmp_path), 'analyzer.delta.1'), 'wb') as f:
+        f.write(b'garbage')
+
+    b, _ = restart(tmp_path)
+    assert b.rules[0].state.count('a') == 1
+
+def test_missing_checkpoint_starts_cold(tmp_path):
+    a, cp = restart(tmp_path / 'state')
+    assert len(a.rules[0].state) == 0
+    assert cp.save() == 0
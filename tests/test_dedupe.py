@@ -0,0 +1,49 @@
+from collector.dedupe import DedupeCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_duplicate_within_ttl_is_suppressed():
+    c = DedupeCache(ttl=10, max_entries=100, clock=FakeClock())
+    assert not c.seen('msg', '1.2.3.4')
+    assert c.seen('msg', '1.2.3.4')
+    assert not c.seen('msg', '1.2.3.5')
+    assert c.stats()['hits'] == 1
+    assert c.stats()['misses'] == 2
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    c = DedupeCache(ttl=10, max_entries=100, clock=clock)
+    c.seen('msg', '1.2.3.4')
+    clock.now = 11
+    assert not c.seen('msg', '1.2.3.4')
+    assert c.stats()['expirations'] == 1
+
+def test_cap_evicts_oldest_first():
+    clock = FakeClock()
+    c = DedupeCache(ttl=100, max_entries=3, clock=clock)
+    for i in range(3):
+        clock.now = i
+        c.seen('msg %d' % i, 'ip')
+    # a repeat of msg 0 does not make it any younger
+    assert c.seen('msg 0', 'ip')
+    c.seen('msg 3', 'ip')
+    assert len(c) == 3
+    assert c.stats()['evictions'] == 1
+    assert c.seen('msg 1', 'ip')
+    assert not c.seen('msg 0', 'ip')
+
+def test_repeats_faster_than_ttl_still_pass_once_per_ttl():
+    clock = FakeClock()
+    c = DedupeCache(ttl=10, max_entries=100, clock=clock)
+    passed = []
+    # the same line every 2 seconds for a minute
+    for t in range(0, 60, 2):
+        clock.now = t
+        if not c.seen('Failed password for root from 10.0.0.9', '10.0.0.9'):
+            passed.append(t)
+    assert passed == [0, 10, 20, 30, 40, 50]
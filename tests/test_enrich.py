@@ -0,0 +1,84 @@
+import os
+import asyncio
+from collector import main as collector
+from collector.analyzer import Analyzer
+from collector.dedupe import DedupeCache
+from collector.enrich import CidrTable, Enricher
+
+ROWS = [
+    ('10.0.0.0/8', {'site': 'corp'}),
+    ('10.1.0.0/16', {'site': 'hq', 'owner': 'netops'}),
+    ('10.1.2.0/24', {'site': 'hq', 'owner': 'dc-team', 'asset': 'db cluster'}),
+    ('10.2.0.0/16', {'site': 'branch'}),
+    ('2001:db8::/32', {'site': 'v6lab'}),
+]
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    # make sure the change is visible even on coarse mtime filesystems
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+
+def test_longest_prefix_wins():
+    t = CidrTable(ROWS)
+    assert t.lookup('10.1.2.3') == {'cidr': '10.1.2.0/24', 'site': 'hq', 'owner': 'dc-team', 'asset': 'db cluster'}
+    assert t.lookup('10.1.3.1')['cidr'] == '10.1.0.0/16'
+    # the parent covers the gaps around and after its children
+    assert t.lookup('10.0.0.1')['cidr'] == '10.0.0.0/8'
+    assert t.lookup('10.1.255.255')['cidr'] == '10.1.0.0/16'
+    assert t.lookup('10.3.0.1')['cidr'] == '10.0.0.0/8'
+    assert t.lookup('10.255.255.255')['cidr'] == '10.0.0.0/8'
+    assert t.lookup('2001:db8::1')['site'] == 'v6lab'
+    assert t.lookup('11.0.0.1') is None
+    assert t.lookup('9.255.255.255') is None
+    assert t.lookup('not-an-ip') is None and t.lookup(None) is None
+
+def test_cache_is_lru_and_reset_on_swap():
+    e = Enricher(table=CidrTable(ROWS), cache_size=2)
+    for ip in ('10.1.2.3', '10.2.0.1', '10.1.2.3', '192.0.2.1'):
+        e.lookup(ip)
+    assert e.stats()['cache_hits'] == 1
+    # 10.2.0.1 was least recently used
+    assert list(e.cache) == ['10.1.2.3', '192.0.2.1']
+    e.swap(CidrTable([('10.1.2.0/24', {'site': 'moved'})]))
+    assert e.lookup('10.1.2.3')['site'] == 'moved'
+
+def test_enriched_docs_and_alerts(monkeypatch):
+    e = Enricher(table=CidrTable(ROWS))
+    stored, sent = [], []
+
+    class Writer:
+        def submit(self, doc):
+            stored.append(doc)
+
+    class Alerting:
+        def send(self, alert):
+            sent.append(alert)
+
+    monkeypatch.setattr(collector, 'RECENT_MSGS', DedupeCache())
+    analyzer = Analyzer(None, rules=[{'name': 'fails', 'type': 'threshold', 'event_type': 'ssh_failed', 'window': 600, 'threshold': 2}])
+    for i in range(2):
+        raw = 'Nov  4 10:01:0%d lab-server sshd[1]: Failed password for root from 10.1.2.9 port 22 ssh2' % i
+        asyncio.run(collector.process_message(raw, '192.0.2.50', Writer(), analyzer, Alerting(), enricher=e))
+    assert stored[0]['parsed']['asset']['owner'] == 'dc-team'
+    assert '"asset":{"cidr":"10.1.2.0/24"' in stored[0].to_json()
+    assert sent[0]['ip'] == '10.1.2.9' and sent[0]['asset']['cidr'] == '10.1.2.0/24'
+
+def test_reload_on_change_keeps_old_table_on_error(tmp_path):
+    path = str(tmp_path / 'assets.csv')
+    _write(path, '# site map\ncidr,site,owner\n10.0.0.0/8,corp,\n10.1.0.0/16,hq,netops\n')
+    e = Enricher(path)
+    assert e.lookup('10.1.0.1') == {'cidr': '10.1.0.0/16', 'site': 'hq', 'owner': 'netops'}
+    assert e.lookup('10.9.0.1') == {'cidr': '10.0.0.0/8', 'site': 'corp'}
+    assert not e.changed()
+    _write(path, 'cidr,site\n10.1.0.0/16,moved\n')
+    assert e.changed()
+    e.reload(e.load_changed())
+    assert e.lookup('10.1.0.1')['site'] == 'moved' and e.lookup('10.9.0.1') is None
+    _write(path, 'cidr,site\n10.1.0.0/99,broken\n')
+    assert e.changed() and e.load_changed() is None
+    # still serving the last good table, and not retrying the same broken file
+    assert e.lookup('10.1.0.1')['site'] == 'moved'
+    assert not e.changed()
+    assert e.stats()['reloads'] == 1 and e.stats()['reload_errors'] == 1
@@ -0,0 +1,56 @@
+import json
+import pickle
+from collector.event import LogEvent, dumps
+from collector.parser import normalize_syslog
+from collector.storage import Storage, COLUMNS
+
+RAW = 'Nov  4 10:01:01 lab-server sshd[12345]: Failed password for invalid user alice from 10.0.0.42 port 34567 ssh2'
+
+def event():
+    return normalize_syslog(RAW, '10.0.0.9', '2024-11-04T10:01:02Z')
+
+def test_behaves_like_the_old_dict():
+    doc = event()
+    assert doc['host'] == 'lab-server'
+    assert doc.get('program') == 'sshd'
+    assert doc.get('parsed', {}).get('src_ip') == '10.0.0.42'
+    assert doc.get('missing', 'x') == 'x'
+    assert 'raw' in doc and 'missing' not in doc
+    assert list(doc) == ['raw', 'src_ip', 'received_ts', 'timestamp', 'host', 'program', 'pid', 'severity', 'message', 'parsed']
+    assert doc == doc.to_dict()
+    doc['asset'] = 'db-01'
+    assert doc['asset'] == 'db-01' and len(doc) == 11
+    del doc['asset']
+    assert 'asset' not in doc
+
+def test_timestamp_is_converted_lazily():
+    doc = event()
+    assert doc._timestamp is None
+    assert doc['timestamp'].endswith('-11-04T10:01:01')
+    assert doc._timestamp is not None
+    no_header = normalize_syslog('garbage', '10.0.0.9', 'R')
+    assert no_header['timestamp'] == 'R'
+    bad = LogEvent('x', '10.0.0.9', 'R', ts_text='Foo 99 99:99:99')
+    assert bad.timestamp == 'R'
+
+def test_serializes_without_a_dict():
+    doc = event()
+    doc['note'] = 'ünïcode "quoted"'
+    assert json.loads(doc.to_json()) == doc.to_dict()
+    assert doc.to_json() == json.dumps(doc.to_dict(), separators=(',', ':'), ensure_ascii=True)
+    assert dumps({'a': 1}) == '{"a":1}'
+    assert doc.row() == (doc['timestamp'], '10.0.0.9', 'lab-server', 'sshd', '12345', 'ssh_failed', RAW)
+    assert len(doc.row()) == len(COLUMNS.split(', '))
+
+def test_pickles_for_shard_inboxes():
+    doc = event()
+    doc['asset'] = 'db-01'
+    copy = pickle.loads(pickle.dumps(doc))
+    assert copy == doc
+    assert not hasattr(copy, '__dict__')
+
+def test_storage_writes_events(tmp_path):
+    s = Storage(es_host='http://invalid:9999', db_path=str(tmp_path / 'logs.db'))
+    doc = normalize_syslog(RAW.replace('Nov  4 10:01:01', '2024-11-04T10:01:01'), '10.0.0.9', '2024-11-04T10:01:02Z')
+    s.index_many([doc])
+    assert s.conn.execute('SELECT src_ip, event_type, raw FROM logs_20241104').fetchall() == [('10.0.0.9', 'ssh_failed', doc['raw'])]
@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from collector import main as collector
+from collector.framing import Framer, FramingError, FramingStats, NEWLINE, OCTET_COUNTING
+from collector.ingest import IngestQueue
+from collector.parser import normalize_syslog
+
+def _feed_bytewise(framer, data):
+    out = []
+    for i in range(len(data)):
+        out.extend(framer.feed(data[i:i + 1]))
+    return out
+
+def test_newline_framing_across_chunks():
+    f = Framer()
+    assert f.feed(b'<13>one\r\n\n<13>tw') == ['<13>one']
+    assert f.feed(b'o\n<13>three') == ['<13>two']
+    # the unterminated last line still counts at end of stream
+    assert f.flush() == ['<13>three']
+    assert f.mode == NEWLINE and f.frames == 3
+
+def test_detection_does_not_mistake_leading_digits():
+    f = Framer()
+    assert f.feed(b'2024-11-04T10:00:00Z host sshd[1]: hi\n') == ['2024-11-04T10:00:00Z host sshd[1]: hi']
+    assert f.mode == NEWLINE
+    f = Framer()
+    assert f.feed(b'17 ') == [] and f.mode is None
+    assert f.feed(b'hosts are up\n') == ['17 hosts are up']
+
+def test_octet_counting_keeps_embedded_newlines():
+    frames = [b'<34>1 2024-11-04T10:00:00Z h app - - - line one\nline two', b'<13>plain', b'<13>' + 'ünï'.encode()]
+    data = b''.join(b'%d %s' % (len(m), m) for m in frames) + b'\n12 <13>short'
+    expected = [m.decode() for m in frames]
+    f = Framer()
+    assert f.feed(data) == expected and f.mode == OCTET_COUNTING
+    # same result however the stream is cut up, and the trailing partial frame is held back
+    g = Framer()
+    assert _feed_bytewise(g, data) == expected
+    assert g.feed(b'ish') == ['<13>shortish']
+
+def test_multiline_octet_counted_messages_parse():
+    # a stack trace or banner kept whole by octet counting, in RFC 3164 with and without a PRI
+    frames = [b'<38>Nov  4 10:00:00 web1 sshd[12]: Failed password for root from 1.2.3.4 port 22 ssh2\nsecond line',
+              b'Nov  4 10:00:01 web2 sshd[13]: Failed password for admin from 1.2.3.5 port 22 ssh2\n\tat frame']
+    f = Framer()
+    messages = f.feed(b''.join(b'%d %s' % (len(m), m) for m in frames))
+    docs = [normalize_syslog(m, '10.0.0.1', 'R') for m in messages]
+    assert [(d['host'], d['program'], d['parsed'].get('event_type')) for d in docs] == [
+        ('web1', 'sshd', 'ssh_failed'), ('web2', 'sshd', 'ssh_failed')]
+    assert docs[0]['raw'].endswith('second line')
+
+def test_oversized_messages_are_truncated_not_buffered():
+    f = Framer(max_message=8)
+    assert f.feed(b'<13>abcdefghij\n<13>ok\n') == ['<13>abcd', '<13>ok']
+    # an endless line is cut at the limit and the rest dropped until its newline
+    assert f.feed(b'<13>0123456789') == ['<13>0123']
+    assert f.feed(b'x' * 1000) == [] and len(f.buf) == 0
+    assert f.feed(b'yy\n<13>next\n') == ['<13>next']
+    assert f.truncated == 2
+    g = Framer(max_message=8)
+    assert g.feed(b'1000000 <13>012') == []
+    assert g.feed(b'34567' + b'z' * 100) == ['<13>0123']
+    assert g.skip == 1000000 - 8 - 104
+    assert g.feed(b'z' * g.skip + b'5 <13>a') == ['<13>a']
+
+def test_bad_octet_header_is_an_error():
+    f = Framer()
+    assert f.feed(b'6 <13>a\n') == ['<13>a']
+    with pytest.raises(FramingError) as e:
+        f.feed(b'six <13>b')
+    assert e.value.messages == []
+    # frames ahead of the bad header in the same chunk are not lost
+    g = Framer()
+    with pytest.raises(FramingError) as e:
+        g.feed(b'6 <13>a\n6 <13>b xx <13>c')
+    assert e.value.messages == ['<13>a', '<13>b'] and g.frames == 2
+
+def test_tcp_handler_batches_into_queue(monkeypatch):
+    monkeypatch.setattr(collector, 'TCP_FRAMING', FramingStats())
+
+    async def run():
+        ingest = IngestQueue(maxsize=100000)
+        server = await asyncio.start_server(lambda r, w: collector.tcp_client_handler(r, w, ingest), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        r, w = await asyncio.open_connection('127.0.0.1', port)
+        # a malformed header right behind the last valid frame, likely in the same read
+        w.write(b''.join(b'%d %s' % (len(m), m) for m in (b'<13>m%d' % i for i in range(5000))) + b'xx <13>bad')
+        await w.drain()
+        # the handler closes the connection on the framing error
+        await r.read()
+        w.close()
+        server.close()
+        await server.wait_closed()
+        return [await ingest.get() for _ in range(len(ingest))]
+    items = asyncio.run(run())
+    assert items[0] == ('<13>m0', '127.0.0.1') and items[-1][0] == '<13>m4999' and len(items) == 5000
+    stats = collector.TCP_FRAMING.stats()
+    assert stats['connections'] == 1 and stats['open'] == 0 and stats['octet_counting'] == 1 and stats['messages'] == 5000
+    assert stats['errors'] == 1
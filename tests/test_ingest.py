@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+from collector.ingest import IngestQueue
+
+def _drain(q):
+    async def run():
+        return [await q.get() for _ in range(len(q))]
+    return asyncio.run(run())
+
+def test_drop_newest_keeps_first_items():
+    q = IngestQueue(maxsize=3, policy='drop_newest')
+    results = [q.offer(i) for i in range(5)]
+    assert results == [True, True, True, False, False]
+    assert _drain(q) == [0, 1, 2]
+    assert q.stats()['dropped'] == 2
+
+def test_drop_oldest_keeps_latest_items():
+    q = IngestQueue(maxsize=3, policy='drop_oldest')
+    for i in range(5):
+        q.offer(i)
+    assert _drain(q) == [2, 3, 4]
+    assert q.stats()['dropped'] == 2
+
+def test_sample_admits_every_nth_overflow():
+    q = IngestQueue(maxsize=2, policy='sample', sample_every=3)
+    for i in range(8):
+        q.offer(i)
+    # overflows are 2..7; the 3rd and 6th (items 4 and 7) replace the oldest entries
+    assert _drain(q) == [4, 7]
+
+def test_unknown_policy_rejected():
+    with pytest.raises(ValueError):
+        IngestQueue(policy='drop_everything')
+
+def test_put_waits_for_space():
+    async def run():
+        q = IngestQueue(maxsize=1)
+        await q.put('a')
+        blocked = asyncio.create_task(q.put('b'))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        assert await q.get() == 'a'
+        await asyncio.wait_for(blocked, 1)
+        assert await q.get() == 'b'
+    asyncio.run(run())
+
+def test_put_many_keeps_order_and_waits_when_full():
+    async def run():
+        q = IngestQueue(maxsize=2)
+        batch = asyncio.create_task(q.put_many(['a', 'b', 'c', 'd']))
+        await asyncio.sleep(0.01)
+        assert not batch.done() and len(q) == 2
+        got = [await q.get() for _ in range(4)]
+        await asyncio.wait_for(batch, 1)
+        assert got == ['a', 'b', 'c', 'd']
+        assert q.stats()['enqueued'] == 4
+    asyncio.run(run())
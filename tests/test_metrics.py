@@ -0,0 +1,113 @@
+import time
+import asyncio
+import threading
+from collector import main as collector
+from collector.dedupe import DedupeCache
+from collector.metrics import Histogram, StageTimings, Metrics, MetricsServer, Profiler, render_stats, collapsed
+
+class Stats:
+    def __init__(self, stats):
+        self._stats = stats
+
+    def stats(self):
+        return self._stats
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram(bounds=(0.001, 0.01))
+    for v in (0.0005, 0.001, 0.005, 2.0):
+        h.observe(v)
+    assert h.counts == [2, 1, 1]
+    assert h.count == 4
+    metrics = Metrics({})
+    metrics.add_histogram('x_seconds', h, 'test', {'stage': 'parse'})
+    text = metrics.render()
+    assert 'x_seconds_bucket{stage="parse",le="0.001"} 2' in text
+    assert 'x_seconds_bucket{stage="parse",le="0.01"} 3' in text
+    assert 'x_seconds_bucket{stage="parse",le="+Inf"} 4' in text
+    assert 'x_seconds_count{stage="parse"} 4' in text
+
+def test_stage_timing_is_sampled():
+    stages = StageTimings(sample_every=4)
+    timed = [stages.clock() for _ in range(8)]
+    assert sum(c is not None for c in timed) == 2
+    clock = timed[3]
+    clock.mark(stages.parse)
+    clock.mark(stages.analyze)
+    assert stages.parse.count == 1 and stages.analyze.count == 1 and stages.decode.count == 0
+    # receivers are sampled on their own count
+    assert [stages.decode_clock() is not None for _ in range(4)] == [False, False, False, True]
+
+def test_component_stats_become_samples():
+    lines = render_stats('analyzer', {'ssh_bruteforce_threshold': {'keys': 3, 'events': 7}, 'policy': 'x', 'depth': 2})
+    assert 'collector_analyzer_keys{name="ssh_bruteforce_threshold"} 3' in lines
+    assert 'collector_analyzer_depth 2' in lines
+    assert not any('policy' in line for line in lines)
+
+def test_profiler_samples_a_busy_thread():
+    stop = threading.Event()
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+    t = threading.Thread(target=busy_loop, name='busy')
+    t.start()
+    try:
+        counts = Profiler(interval=0.001).sample(0.2, t.ident)
+    finally:
+        stop.set()
+        t.join()
+    assert counts
+    assert all('test_metrics.py:busy_loop' in stack for stack in counts)
+    assert collapsed(counts).endswith('\n')
+
+def test_server_serves_metrics_and_profiles():
+    async def get(port, path):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: x\r\n\r\n'.encode())
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return data.decode()
+
+    async def run():
+        stages = StageTimings(sample_every=1)
+        stages.clock().mark(stages.dedupe)
+        server = await MetricsServer(Metrics({'ingest': Stats({'depth': 5})}, stages), Profiler(interval=0.001)).start('127.0.0.1', 0)
+        port = server.server.sockets[0].getsockname()[1]
+        text = await get(port, '/metrics')
+        assert text.startswith('HTTP/1.1 200')
+        assert 'collector_stage_seconds_count{stage="dedupe"} 1' in text
+        assert 'collector_ingest_depth 5' in text
+        # the profile is taken while the loop keeps serving
+        profile = asyncio.ensure_future(get(port, '/profile?seconds=0.3'))
+        await asyncio.sleep(0.05)
+        assert (await get(port, '/profile?seconds=1')).startswith('HTTP/1.1 409')
+        assert (await get(port, '/metrics')).startswith('HTTP/1.1 200')
+        body = (await profile).split('\r\n\r\n', 1)[1]
+        assert 'base_events.py:run_forever' in body
+        assert (await get(port, '/nope')).startswith('HTTP/1.1 404')
+        assert server.stats() == {'scrapes': 2, 'profiles': 1}
+        server.close()
+    asyncio.run(run())
+
+def test_process_message_times_each_stage(monkeypatch):
+    class Writer:
+        def submit(self, doc):
+            pass
+
+    class Analyzer:
+        def process_all(self, doc):
+            return [{'type': 'x'}]
+
+    class Alerting:
+        def send(self, alert):
+            pass
+
+    stages = StageTimings(sample_every=1)
+    monkeypatch.setattr(collector, 'STAGE', stages)
+    monkeypatch.setattr(collector, 'RECENT_MSGS', DedupeCache())
+    raw = 'Nov  4 10:01:01 lab-server sshd[1]: Failed password for root from 10.0.0.42 port 22 ssh2'
+    for _ in range(2):
+        asyncio.run(collector.process_message(raw, '10.0.0.9', Writer(), Analyzer(), Alerting()))
+    counts = {stage: h.count for stage, h in stages.histograms().items()}
+    # the second copy is a retransmit: only its dedupe check is timed
+    assert counts == {'decode': 0, 'dedupe': 2, 'parse': 1, 'enrich': 0, 'submit': 1, 'observe': 1, 'analyze': 1, 'alert': 1}
@@ -0,0 +1,51 @@
+from datetime import datetime
+from collector.parser import normalize_syslog, parse_rfc3164_timestamp, parse_timestamp
+
+def test_rfc3164_timestamp_matches_current_year():
+    now = datetime(2024, 11, 20)
+    assert parse_rfc3164_timestamp('Nov  4 10:01:01', now) == '2024-11-04T10:01:01'
+
+def test_rfc3164_year_rollover():
+    # a late-December message received in early January belongs to the previous year
+    assert parse_rfc3164_timestamp('Dec 31 23:59:59', datetime(2025, 1, 1)) == '2024-12-31T23:59:59'
+
+def test_rfc3164_malformed_returns_none():
+    assert parse_rfc3164_timestamp('Foo  4 10:01:01', datetime(2024, 1, 1)) is None
+    assert parse_rfc3164_timestamp('Feb 30 10:01:01', datetime(2024, 3, 1)) is None
+
+def test_iso_and_fallback_timestamps():
+    assert parse_timestamp('2003-10-11T22:14:15.003+00:00') == '2003-10-11T22:14:15.003000+00:00'
+    # odd formats still go through dateutil
+    assert parse_timestamp('Nov 4 2024 10:01:01') == '2024-11-04T10:01:01'
+
+def test_rfc5424_header():
+    raw = '<34>1 2003-10-11T22:14:15.003Z mymachine sshd 812 ID47 [origin ip="10.0.0.1"] Accepted publickey for bob from 10.0.0.9 port 22'
+    doc = normalize_syslog(raw, '10.0.0.1', 'R')
+    assert doc['host'] == 'mymachine'
+    assert doc['program'] == 'sshd'
+    assert doc['pid'] == '812'
+    assert doc['timestamp'].startswith('2003-10-11T22:14:15.003')
+    assert doc['parsed'] == {'event_type': 'ssh_success', 'user': 'bob', 'src_ip': '10.0.0.9'}
+
+def test_cisco_dispatch_by_facility():
+    raw = 'Nov  4 10:01:01 router1 %SEC-6-IPACCESSLOGP: line vty0: Login Authentication for user admin, src 10.1.1.1'
+    doc = normalize_syslog(raw, '10.1.1.254', 'R')
+    assert doc['parsed'] == {'event_type': 'cisco_login', 'user': 'admin', 'src_ip': '10.1.1.1'}
+
+def test_full_path_program_and_later_facility_tag():
+    raw = 'Nov  4 10:01:01 lab-server /usr/sbin/sshd[77]: Failed password for root from 10.0.0.5 port 22 ssh2'
+    doc = normalize_syslog(raw, '10.0.0.254', 'R')
+    assert doc['program'] == '/usr/sbin/sshd' and doc['parsed']['event_type'] == 'ssh_failed'
+    # a '%' before the real %FACILITY- tag must not hide it
+    raw = 'Nov  4 10:01:01 router1 42: 100% up: %SEC-6-IPACCESSLOGP: line vty0: Login Authentication for user admin, src 10.1.1.1'
+    assert normalize_syslog(raw, '10.1.1.254', 'R')['parsed']['event_type'] == 'cisco_login'
+
+def test_registry_only_checks_matching_program():
+    from collector.parser import ExtractorRegistry, Extractor
+    reg = ExtractorRegistry()
+    reg.register(Extractor('sudo_fail', r'authentication failure; user=(?P<user>\S+) rhost=(?P<ip>[\d.]+)', ['authentication failure']), programs=['sudo'])
+    msg = 'pam_unix: authentication failure; user=bob rhost=10.0.0.5'
+    assert reg.classify('sudo', msg) == {'event_type': 'sudo_fail', 'user': 'bob', 'src_ip': '10.0.0.5'}
+    assert reg.classify('sshd', msg) is None
+    # the literal prefilter keeps the regex from running at all
+    assert reg.classify('sudo', 'session opened for user root') is None
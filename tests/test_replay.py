@@ -0,0 +1,49 @@
+import gzip
+import os
+from collector.analyzer import Analyzer
+from collector.storage import Storage
+from collector.replay import Replay, read_blocks
+
+def write_log(path, lines, compress=False):
+    data = ''.join(line + '\n' for line in lines).encode()
+    with (gzip.open(path, 'wb') if compress else open(path, 'wb')) as f:
+        f.write(data)
+    # an archive from early 2024: RFC3164 years are inferred from the mtime, not from today
+    os.utime(path, (1706745600, 1706745600))
+
+def failures(ip, start, n):
+    return ['Jan 31 10:%02d:%02d web1 sshd[1]: Failed password for root from %s port 22 ssh2' % ((start + i) // 60, (start + i) % 60, ip)
+            for i in range(n)]
+
+def test_blocks_end_on_line_boundaries(tmp_path):
+    path = str(tmp_path / 'a.log')
+    write_log(path, ['line %d' % i for i in range(1000)], compress=True)
+    blocks = list(read_blocks(path, chunk_bytes=100))
+    assert len(blocks) > 10
+    assert all(b.endswith(b'\n') for b in blocks)
+    assert b''.join(blocks).decode().split('\n')[:-1] == ['line %d' % i for i in range(1000)]
+
+def test_replay_merges_files_in_event_time_order(tmp_path):
+    a, b = str(tmp_path / 'auth.log'), str(tmp_path / 'auth2.log.gz')
+    # failures land in one file and the successful login in the other; only the merged order connects them
+    write_log(a, failures('10.9.9.9', 0, 5) + ['Jan 31 10:05:00 web1 CRON[2]: (root) CMD (true)'])
+    write_log(b, ['Jan 31 10:00:30 web2 kernel: noise'] * 5 +
+              ['Jan 31 10:01:00 web2 sshd[3]: Accepted password for root from 10.9.9.9 port 22 ssh2'], compress=True)
+    storage = Storage(es_host='http://invalid:9999', db_path=str(tmp_path / 'logs.db'))
+    seen = []
+    analyzer = Analyzer(storage)
+    process_all = analyzer.process_all
+    analyzer.process_all = lambda doc: seen.append(doc['timestamp']) or process_all(doc)
+    stats = Replay(analyzer, storage, workers=2, chunk_bytes=200).run([a, b])
+    assert stats['lines'] == 12 and stats['docs'] == 12 and stats['stored'] == 12
+    assert seen == sorted(seen)
+    assert seen[0].startswith('2024-01-31T10:00:00')
+    assert stats['alerts'] == {'ssh_bruteforce_threshold': 1, 'intrusion_suspected': 1}
+    assert storage.conn.execute('SELECT count(*) FROM logs_20240131').fetchone()[0] == 12
+
+def test_replay_without_storage_only_analyzes(tmp_path):
+    path = str(tmp_path / 'a.log')
+    write_log(path, failures('10.1.1.1', 0, 5))
+    stats = Replay(Analyzer(None), workers=1).run([path])
+    assert stats['stored'] == 0
+    assert stats['alerts'] == {'ssh_bruteforce_threshold': 1}
@@ -0,0 +1,85 @@
+import random
+from collections import Counter
+from datetime import datetime
+from collector.rollups import SpaceSaving, Rollup, RollupStore
+
+def test_space_saving_finds_heavy_hitters_in_fixed_memory():
+    rng = random.Random(7)
+    sketch = SpaceSaving(20)
+    true = Counter()
+    for _ in range(20000):
+        value = 'hot%d' % rng.randrange(5) if rng.random() < 0.4 else 'ip%d' % rng.randrange(50000)
+        sketch.add(value)
+        true[value] += 1
+    assert len(sketch.counts) == 20
+    top = dict(sketch.top(5))
+    assert set(top) == {'hot%d' % i for i in range(5)}
+    for value, count in top.items():
+        # never underestimates, and the overestimate is bounded by n/k
+        assert true[value] <= count <= true[value] + 20000 // 20
+    assert sketch.min_count == min(sketch.counts.values())
+
+def doc(minute, event_type, host='web1', ip='10.0.0.1'):
+    return {'timestamp': '2024-11-04T10:%02d:30.5Z' % minute, 'host': host, 'src_ip': '192.168.0.1',
+            'parsed': {'event_type': event_type, 'src_ip': ip}}
+
+def test_rollup_flushes_closed_minutes_to_store(tmp_path):
+    r = Rollup(top_k=10)
+    for _ in range(3):
+        r.observe(doc(1, 'ssh_failed'))
+    r.observe(doc(1, 'ssh_success', ip='10.0.0.2'))
+    r.observe(doc(2, 'ssh_failed', host='web2'))
+    store = RollupStore(str(tmp_path / 'rollups.db'))
+    # minute 02 and hour 10 are still open at 10:02
+    minute_rows, hour_rows = r.drain(now=datetime(2024, 11, 4, 10, 2, 10))
+    assert list(r.minutes) == ['2024-11-04T10:02'] and hour_rows == []
+    store.write(minute_rows)
+    store.write(*r.drain(everything=True))
+    # a late event for an already flushed minute is added, not overwritten
+    r.observe(doc(1, 'ssh_failed'))
+    store.write(*r.drain(everything=True))
+
+    now = datetime(2024, 11, 4, 10, 30)
+    stats = store.query('event_type', minutes=60, now=now)
+    assert stats['totals'] == {'ssh_failed': 5, 'ssh_success': 1}
+    assert stats['series'][0] == {'period': '2024-11-04T10:01', 'counts': {'ssh_failed': 4, 'ssh_success': 1}}
+    assert store.query('src_ip', minutes=60, limit=1, now=now)['totals'] == {'10.0.0.1': 5}
+    assert store.query('total', minutes=60, now=now)['totals'] == {'': 6}
+    assert store.query('event_type', minutes=5, now=now)['series'] == []
+    # long ranges come from the hourly table, merged from the same minutes
+    daily = store.query('event_type', minutes=24 * 60, now=datetime(2024, 11, 5, 9, 30))
+    assert daily['resolution'] == 'hour'
+    assert daily['series'] == [{'period': '2024-11-04T10', 'counts': {'ssh_failed': 5, 'ssh_success': 1}}]
+    assert store.prune(retention_days=1, now=datetime(2024, 11, 6)) > 10
+
+def test_minutes_follow_receive_time_not_header_time():
+    r = Rollup(top_k=10)
+    received = '2024-11-04T10:01:40.1Z'
+    r.observe(dict(doc(1, 'ssh_failed'), timestamp='2099-01-01T00:00:00Z', received_ts=received))
+    r.observe(dict(doc(1, 'ssh_failed'), timestamp='2024-11-04T15:31:00+05:00', received_ts=received))
+    assert list(r.minutes) == ['2024-11-04T10:01']
+    minute_rows, _ = r.drain(now=datetime(2024, 11, 4, 10, 2))
+    assert r.minutes == {} and ('2024-11-04T10:01', 'total', '', 2) in minute_rows
+
+def test_stats_endpoint(tmp_path, monkeypatch):
+    import webapp.app as app
+    store = RollupStore(str(tmp_path / 'rollups.db'))
+    r = Rollup()
+    r.observe({'timestamp': datetime.utcnow().isoformat() + 'Z', 'host': 'web1', 'parsed': {'event_type': 'ssh_failed'}})
+    store.write(*r.drain(everything=True))
+    monkeypatch.setattr(app, 'rollups', store)
+    client = app.app.test_client()
+    assert client.get('/api/stats?dim=host').get_json()['totals'] == {'web1': 1}
+    assert client.get('/api/stats?dim=bogus').status_code == 400
+
+def test_mined_templates_are_a_dimension(tmp_path):
+    r = Rollup(top_k=10)
+    for i in range(3):
+        d = doc(1, 'unclassified')
+        d['parsed']['template'] = 'Started Session <*> of user <*>'
+        r.observe(d)
+    r.observe(doc(1, 'ssh_failed'))
+    store = RollupStore(str(tmp_path / 'rollups.db'))
+    store.write(*r.drain(everything=True))
+    stats = store.query('template', minutes=60, now=datetime(2024, 11, 4, 10, 30))
+    assert stats['totals'] == {'Started Session <*> of user <*>': 3}
@@ -0,0 +1,79 @@
+import pytest
+from collector.analyzer import Analyzer
+from collector.rules import compile_rules
+
+def _ev(et, ip, ts, user=None):
+    return {'parsed': {'event_type': et, 'src_ip': ip, 'user': user}, 'timestamp': '2024-11-04T10:%02d:%02d' % divmod(ts, 60)}
+
+def test_default_rules_keep_alert_format():
+    a = Analyzer(None)
+    alerts = [a.process(_ev('ssh_failed', '10.0.0.42', t)) for t in range(5)]
+    assert alerts[:4] == [None] * 4
+    assert alerts[4] == {
+        'type': 'ssh_bruteforce_threshold',
+        'ip': '10.0.0.42',
+        'count': 5,
+        'message': 'Suspected brute force: 5 failed SSH logins from 10.0.0.42 in 0:10:00',
+        'status': 'new',
+        'first_seen': '2024-11-04T10:00:04Z',
+        'last_seen': '2024-11-04T10:00:04Z',
+        'matches': 1,
+        'suppressed': 0,
+    }
+    assert a.process(_ev('ssh_success', '10.0.0.42', 60)) == {
+        'type': 'intrusion_suspected',
+        'ip': '10.0.0.42',
+        'message': 'Failed SSH attempts followed by success from 10.0.0.42',
+        'status': 'new',
+        'first_seen': '2024-11-04T10:01:00Z',
+        'last_seen': '2024-11-04T10:01:00Z',
+        'matches': 1,
+        'suppressed': 0,
+    }
+    # success long after the failures is not correlated
+    assert a.process(_ev('ssh_success', '10.0.0.42', 60 * 59)) is None
+
+def test_dispatch_only_holds_consuming_rules():
+    specs = [
+        {'name': 'a', 'type': 'threshold', 'event_type': 'x', 'window': 60, 'threshold': 2},
+        {'name': 'b', 'type': 'sequence', 'first': 'x', 'then': 'y', 'window': 60},
+        {'name': 'c', 'type': 'threshold', 'event_type': 'z', 'window': 60, 'threshold': 2, 'enabled': False},
+    ]
+    rules, dispatch = compile_rules(specs)
+    assert [r.name for r in rules] == ['a', 'b']
+    assert {et: [r.name for r in rs] for et, rs in dispatch.items()} == {'x': ['a', 'b'], 'y': ['b']}
+
+def test_distinct_rule_counts_usernames_per_ip():
+    a = Analyzer(None, rules=[{'name': 'password_spray', 'type': 'distinct', 'event_type': 'ssh_failed',
+                               'field': 'user', 'window': 600, 'threshold': 3}])
+    assert a.process(_ev('ssh_failed', '1.1.1.1', 0, 'alice')) is None
+    assert a.process(_ev('ssh_failed', '1.1.1.1', 1, 'alice')) is None
+    assert a.process(_ev('ssh_failed', '1.1.1.1', 2, 'bob')) is None
+    alert = a.process(_ev('ssh_failed', '1.1.1.1', 3, 'root'))
+    assert alert['type'] == 'password_spray' and alert['count'] == 3
+
+def test_multiple_alerts_from_one_event():
+    a = Analyzer(None, rules=[
+        {'name': 'r1', 'type': 'threshold', 'event_type': 'x', 'window': 60, 'threshold': 1},
+        {'name': 'r2', 'type': 'threshold', 'event_type': 'x', 'key': 'user', 'window': 60, 'threshold': 1},
+    ])
+    alerts = a.process_all(_ev('x', '1.1.1.1', 0, 'bob'))
+    assert [al['type'] for al in alerts] == ['r1', 'r2']
+    assert alerts[1]['key'] == 'bob'
+
+def test_unknown_rule_type_rejected():
+    with pytest.raises(ValueError):
+        compile_rules([{'name': 'bad', 'type': 'ml_magic', 'window': 60}])
+
+def test_thresholds_above_the_default_per_key_cap():
+    a = Analyzer(None, rules=[
+        {'name': 'flood', 'type': 'threshold', 'event_type': 'ssh_failed', 'window': 3600, 'threshold': 2000, 'cooldown': 0},
+        {'name': 'spray', 'type': 'distinct', 'event_type': 'ssh_failed', 'field': 'user', 'window': 3600, 'threshold': 1500, 'cooldown': 0},
+    ])
+    alerts = []
+    for i in range(2500):
+        alerts.extend(a.process_all(_ev('ssh_failed', '1.1.1.1', i // 2, 'u%d' % i)))
+    assert min(al['count'] for al in alerts if al['type'] == 'flood') == 2000
+    assert min(al['count'] for al in alerts if al['type'] == 'spray') == 1500
+    with pytest.raises(ValueError):
+        compile_rules([{'name': 'never', 'type': 'threshold', 'event_type': 'x', 'window': 60, 'threshold': 2000, 'max_per_key': 100}])
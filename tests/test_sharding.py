@@ -0,0 +1,32 @@
+import queue
+from collector.sharding import ShardRouter, shard_for, run_shard
+
+def test_shard_for_is_stable_and_in_range():
+    assert shard_for('10.0.0.42', 4) == shard_for('10.0.0.42', 4)
+    assert all(0 <= shard_for('10.0.%d.1' % i, 4) < 4 for i in range(256))
+    assert shard_for(None, 4) == shard_for('', 4)
+
+def test_router_sends_same_ip_to_same_shard_and_skips_noise():
+    inboxes = [queue.Queue() for _ in range(4)]
+    router = ShardRouter(inboxes, ['ssh_failed'])
+    for _ in range(3):
+        router.process_all({'parsed': {'event_type': 'ssh_failed', 'src_ip': '10.0.0.42'}, 'src_ip': 'relay'})
+    router.process_all({'parsed': {'event_type': 'unclassified'}, 'src_ip': '10.0.0.42'})
+    sizes = [q.qsize() for q in inboxes]
+    assert sizes[shard_for('10.0.0.42', 4)] == 3
+    assert sum(sizes) == 3
+
+def test_run_shard_raises_alerts_until_sentinel():
+    class OneAlert:
+        def process_all(self, doc):
+            return [{'type': 't', 'ip': doc['src_ip']}]
+    class Sink:
+        sent = []
+        def send(self, alert):
+            self.sent.append(alert)
+    inbox = queue.Queue()
+    inbox.put({'src_ip': '1.2.3.4'})
+    inbox.put(None)
+    sink = Sink()
+    run_shard(OneAlert(), sink, inbox)
+    assert sink.sent == [{'type': 't', 'ip': '1.2.3.4'}]
@@ -0,0 +1,86 @@
+from collector.analyzer import Analyzer
+from collector.checkpoint import Checkpointer
+from collector.sketches import CountMinWindow, DistinctWindow
+
+def _ev(et, ip, user, ts):
+    return {'parsed': {'event_type': et, 'src_ip': ip, 'user': user}, 'timestamp': '2024-11-04T10:%02d:%02d' % divmod(ts, 60)}
+
+def test_distinct_estimates_with_other_keys_sharing_registers():
+    d = DistinctWindow(600, registers=1 << 18, virtual=128)
+    # background: many keys with a couple of values each
+    for i in range(20000):
+        d.add('10.0.%d.%d' % divmod(i, 256), 'user%d' % (i % 7), 100)
+        d.add('10.0.%d.%d' % divmod(i, 256), 'user%d' % (i % 5), 100)
+    for i in range(500):
+        n = d.add('203.0.113.9', 'name%d' % i, 100)
+    # standard error is about 1.04 / sqrt(128), 9%; allow three of them
+    assert 350 <= n <= 650
+    assert d.count('192.0.2.1') < 15
+    # repeats do not count again
+    assert d.add('203.0.113.9', 'name1', 101) == n
+
+def test_distinct_window_expires_by_bucket():
+    d = DistinctWindow(60, registers=1 << 12, virtual=16, buckets=6)
+    for i in range(10):
+        d.add('ip', 'u%d' % i, 0)
+    n = d.count('ip')
+    assert 8 <= n <= 12
+    # still within window + one bucket
+    d.add('other', 'x', 65)
+    assert d.count('ip') == n
+    d.add('other', 'x', 70)
+    assert d.count('ip') == 0
+    assert d.stats()['rotations'] == 1
+    # older than every live bucket: ignored
+    d.add('ip', 'late', 0)
+    assert d.count('ip') == 0 and d.stats()['too_old'] == 1
+
+def test_count_min_never_undercounts_and_memory_is_fixed():
+    c = CountMinWindow(600, width=256, depth=4)
+    size = c.approx_bytes()
+    for i in range(20000):
+        c.add('ip%d' % i, 100)
+    for _ in range(50):
+        n = c.add('attacker', 100)
+    assert 50 <= n < 50 + 20000 * 2.72 / 256
+    assert c.approx_bytes() == size
+    # the bucket holding everything expires; counts subtract back to zero
+    c.add('attacker', 800)
+    assert c.count('attacker') == 1 and c.stats()['window_events'] == 1
+
+def test_default_rules_detect_spraying_and_distributed_bruteforce():
+    a = Analyzer(None)
+    alerts = []
+    for i in range(70):
+        alerts += a.process_all(_ev('ssh_failed', '198.51.100.7', 'user%d' % i, i))
+    spray = [al for al in alerts if al['type'] == 'password_spraying']
+    assert spray and spray[0]['ip'] == '198.51.100.7' and 50 <= spray[0]['count'] <= 70
+    alerts = []
+    for i in range(70):
+        alerts += a.process_all(_ev('cisco_login', '192.0.2.%d' % i, 'admin', 100 + i))
+    dist = [al for al in alerts if al['type'] == 'distributed_bruteforce']
+    assert dist and dist[0]['key'] == 'admin'
+    assert 'from about' in dist[0]['message']
+
+def test_future_header_does_not_blind_sketch_rules():
+    a = Analyzer(None)
+    rule = next(r for r in a.rules if r.name == 'password_spraying')
+    forged = dict(_ev('ssh_failed', '203.0.113.66', 'root', 0), timestamp='2099-01-01T00:00:00Z', received_ts='2024-11-04T10:00:00Z')
+    a.process_all(forged)
+    alerts = []
+    for i in range(200):
+        doc = _ev('ssh_failed', '198.51.100.7', 'user%d' % i, i)
+        doc['received_ts'] = doc['timestamp'] + 'Z'
+        alerts += a.process_all(doc)
+    assert any(al['type'] == 'password_spraying' for al in alerts)
+    assert rule.state.stats()['too_old'] == 0
+
+def test_checkpoint_skips_sketch_rules(tmp_path):
+    a = Analyzer(None, rules=[
+        {'name': 'fails', 'type': 'threshold', 'event_type': 'ssh_failed', 'window': 600, 'threshold': 5},
+        {'name': 'spray', 'type': 'sketch_distinct', 'event_type': 'ssh_failed', 'field': 'user', 'window': 600, 'threshold': 5},
+    ])
+    cp = Checkpointer(a, directory=str(tmp_path))
+    a.process_all(_ev('ssh_failed', '10.0.0.1', 'root', 0))
+    assert list(cp.stores) == ['fails']
+    assert cp.save(compact=True) == 1
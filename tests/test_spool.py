@@ -0,0 +1,132 @@
+import time
+from collector.spool import Spool
+from collector.writer import BatchWriter
+
+def docs(start, n):
+    return [{'raw': 'line %d' % i} for i in range(start, start + n)]
+
+def test_append_read_commit_across_segments(tmp_path):
+    s = Spool(str(tmp_path), segment_bytes=100, fsync=False)
+    for i in range(0, 20, 5):
+        s.append(docs(i, 5))
+    assert len(s._segments()) > 1
+    got, pos = s.read(12)
+    assert [d['raw'] for d in got] == ['line %d' % i for i in range(12)]
+    s.commit(pos, len(got))
+    s.close()
+
+    # the position survives a restart and replayed segments are gone
+    s = Spool(str(tmp_path), segment_bytes=100, fsync=False)
+    assert s._segments()[0] == pos[0]
+    got, pos = s.read(100)
+    assert [d['raw'] for d in got] == ['line %d' % i for i in range(12, 20)]
+    s.commit(pos)
+    assert not s.pending()
+
+def test_torn_record_is_truncated_on_open(tmp_path):
+    s = Spool(str(tmp_path), fsync=False)
+    s.append(docs(0, 2))
+    s.file.write(b'{"raw": "tor')
+    s.close()
+    s = Spool(str(tmp_path), fsync=False)
+    s.append(docs(2, 1))
+    got, _ = s.read()
+    assert [d['raw'] for d in got] == ['line 0', 'line 1', 'line 2']
+
+class FlakyStorage:
+    def __init__(self):
+        self.up = True
+        self.docs = []
+
+    def ping(self):
+        return self.up
+
+    def index_many(self, batch):
+        if not self.up:
+            raise ConnectionError('backend down')
+        self.docs.extend(batch)
+        return len(batch)
+
+def wait_for(cond, timeout=5):
+    deadline = time.time() + timeout
+    while not cond() and time.time() < deadline:
+        time.sleep(0.01)
+    return cond()
+
+def test_outage_spools_and_replays_without_loss(tmp_path):
+    storage = FlakyStorage()
+    w = BatchWriter(storage, batch_size=10, flush_interval=0.01, spool=Spool(str(tmp_path), fsync=False))
+    w.replayer.probe_interval = 0.05
+    w.start()
+    for d in docs(0, 10):
+        w.submit(d)
+    assert wait_for(lambda: len(storage.docs) == 10)
+
+    storage.up = False
+    for d in docs(10, 30):
+        w.submit(d)
+    assert wait_for(lambda: w.stats()['spool']['appended'] == 30)
+    assert not w.replayer.healthy
+
+    storage.up = True
+    for d in docs(40, 10):
+        w.submit(d)
+    assert wait_for(lambda: len(storage.docs) == 50)
+    # nothing lost or duplicated; the batch that failed mid-write lands behind ones spooled after it
+    assert sorted(d['raw'] for d in storage.docs) == sorted('line %d' % i for i in range(50))
+    w.stop()
+    assert w.stats()['spool']['pending_bytes'] == 0
+    # writes timed from the replay thread too, successful or not
+    assert w.flush_seconds.count >= 3
+
+class SlowStorage(FlakyStorage):
+    def index_many(self, batch):
+        time.sleep(0.005)
+        return super().index_many(batch)
+
+def test_slow_but_healthy_backend_never_spools(tmp_path):
+    from collector.spool import SpoolReplayer
+    storage = SlowStorage()
+    spool = Spool(str(tmp_path), fsync=False)
+    r = SpoolReplayer(spool, storage).start()
+    # the writer flushes faster than the backend takes batches, but the backend keeps up on average
+    results = [r.submit(docs(i * 10, 10)) for i in range(40)]
+    assert all(results)
+    assert wait_for(lambda: len(storage.docs) == 400)
+    r.stop()
+    assert spool.stats()['appended'] == 0 and spool.pending_bytes() == 0
+
+class PickyStorage(FlakyStorage):
+    """Up, but refuses the whole batch if any doc is bad, like a rolled-back SQLite transaction."""
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def index_many(self, batch):
+        self.calls += 1
+        if any(d['raw'] == 'bad' for d in batch):
+            raise ValueError('mapping conflict')
+        return super().index_many(batch)
+
+def test_rejected_doc_is_dead_lettered_not_an_outage(tmp_path):
+    import json
+    from collector.spool import SpoolReplayer
+    storage = PickyStorage()
+    spool = Spool(str(tmp_path), fsync=False)
+    spool.append(docs(0, 5) + [{'raw': 'bad'}] + docs(5, 5))
+    r = SpoolReplayer(spool, storage, probe_interval=0.05, batch=100, max_attempts=3).start()
+    assert wait_for(lambda: not spool.pending())
+    assert sorted(d['raw'] for d in storage.docs) == sorted('line %d' % i for i in range(10))
+    # a bad doc in a direct write, then good batches: all of those are stored, directly once it is set aside
+    r.submit(docs(10, 5) + [{'raw': 'bad'}])
+    for i in range(2, 22):
+        r.submit(docs(i * 10, 10))
+    assert wait_for(lambda: len(storage.docs) == 215)
+    assert wait_for(lambda: not spool.pending())
+    r.stop()
+    assert sorted(d['raw'] for d in storage.docs) == sorted('line %d' % i for i in list(range(15)) + list(range(20, 220)))
+    stats = r.stats()
+    assert stats['outages'] == 0 and stats['healthy'] and stats['dead_lettered'] == 2
+    with open(spool.dead_letter_path) as f:
+        assert [json.loads(line) for line in f] == [{'raw': 'bad'}, {'raw': 'bad'}]
+    assert storage.calls < 100
@@ -0,0 +1,299 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta
+import pytest
+from collector.storage import Storage, partition_key, fts_query
+
+def doc(ts, ip='10.0.0.1', event_type='ssh_failed', raw='msg', received=None):
+    return {'timestamp': ts.isoformat() + 'Z', 'received_ts': (received or ts).isoformat() + 'Z', 'src_ip': ip, 'host': 'h', 'program': 'sshd',
+            'parsed': {'event_type': event_type}, 'raw': raw}
+
+def storage(tmp_path):
+    return Storage(es_host='http://invalid:9999', db_path=str(tmp_path / 'logs.db'))
+
+def test_partition_key():
+    assert partition_key('2024-11-04T10:01:01Z') == '20241104'
+    assert partition_key('2024-11-04T10:01:01Z', 'hour') == '2024110410'
+    assert partition_key('Nov  4 10:01:01') is None
+
+def test_writes_go_to_daily_partitions_in_wal_mode(tmp_path):
+    s = storage(tmp_path)
+    now = datetime.utcnow()
+    s.index_many([doc(now), doc(now - timedelta(days=3))])
+    assert s.partitions == {'logs_' + partition_key(now.isoformat()), 'logs_' + partition_key((now - timedelta(days=3)).isoformat())}
+    assert s.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+def test_search_recent_prunes_by_time(tmp_path):
+    s = storage(tmp_path)
+    now = datetime.utcnow()
+    s.index_many([doc(now - timedelta(minutes=5)), doc(now - timedelta(minutes=1), ip='10.0.0.2'),
+                  doc(now - timedelta(hours=3)), doc(now - timedelta(days=2))])
+    rows = s.search_recent(minutes=60)
+    assert [r['src_ip'] for r in rows] == ['10.0.0.2', '10.0.0.1']
+    assert len(s.search_recent(minutes=60 * 24 * 7)) == 4
+    assert [r['src_ip'] for r in s.search_recent(minutes=60, src_ip='10.0.0.1')] == ['10.0.0.1']
+    plan = s.conn.execute('EXPLAIN QUERY PLAN SELECT ts FROM %s WHERE ts >= ? AND src_ip = ? ORDER BY ts DESC' % sorted(s.partitions)[-1], ('', '')).fetchall()
+    assert 'src_ip_ts' in str(plan)
+
+def test_search_recent_with_offset_timestamps(tmp_path):
+    from datetime import timezone
+    from collector.parser import normalize_syslog
+    s = storage(tmp_path)
+    now = datetime.now(timezone.utc)
+
+    def line(dt, hours, host):
+        local = dt.astimezone(timezone(timedelta(hours=hours)))
+        return normalize_syslog(f'<38>1 {local.isoformat()} {host} sshd 1 - - Failed password', '10.0.0.1', 'R')
+
+    # just now on a US west coast clock, and three hours ago on a +05:00 clock
+    s.index_many([line(now, -8, 'west'), line(now - timedelta(hours=3), 5, 'east')])
+    assert [r['host'] for r in s.search_recent(minutes=60)] == ['west']
+    assert s.search_recent(minutes=60)[0]['ts'].endswith('+00:00')
+
+def test_forged_header_years_do_not_pick_partitions(tmp_path):
+    s = storage(tmp_path)
+    now = datetime(2024, 11, 30, 12)
+    # RFC 5424 headers from 300 different years, a clock reset to 1970, a device a few minutes fast, and a late relay
+    docs = [doc(datetime(1700 + y, 6, 1), received=now) for y in range(300)]
+    docs += [doc(datetime(1970, 1, 1), raw='reset', received=now), doc(now + timedelta(minutes=5), raw='fast', received=now),
+             doc(now - timedelta(hours=20), raw='late', received=now)]
+    s.index_many(docs)
+    assert s.partitions == {'logs_20241130', 'logs_20241129'}
+    ts = dict(s.conn.execute("SELECT raw, ts FROM logs_20241130 WHERE raw != 'msg'").fetchall())
+    assert ts == {'reset': '2024-11-30T12:00:00Z', 'fast': '2024-11-30T12:05:00Z'}
+    # kept for the retention period from arrival, not dropped for looking old
+    assert s.drop_expired(retention_days=30, now=now) == []
+    assert s.conn.execute('SELECT count(*) FROM logs_20241130').fetchone()[0] == 302
+
+def test_retention_drops_whole_partitions(tmp_path):
+    s = storage(tmp_path)
+    now = datetime(2024, 11, 30, 12)
+    s.index_many([doc(now - timedelta(days=d)) for d in (0, 10, 40, 45)])
+    dropped = s.drop_expired(retention_days=30, now=now)
+    assert sorted(dropped) == ['logs_20241016', 'logs_20241021']
+    assert s.partitions == {'logs_20241130', 'logs_20241120'}
+
+def test_legacy_table_is_migrated(tmp_path):
+    path = str(tmp_path / 'logs.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT, src_ip TEXT, host TEXT, program TEXT, pid TEXT, event_type TEXT, raw TEXT)')
+    conn.execute("INSERT INTO logs (ts, src_ip, raw) VALUES ('2024-11-04T10:01:01Z', '10.0.0.9', 'old')")
+    conn.commit()
+    conn.close()
+    s = Storage(es_host='http://invalid:9999', db_path=path)
+    assert s.partitions == {'logs_20241104'}
+    assert s.conn.execute("SELECT count(*) FROM sqlite_master WHERE name = 'logs'").fetchone()[0] == 0
+
+def test_fts_query_quotes_user_input():
+    assert fts_query('failed  "invalid user" adm*') == '"failed" AND "invalid user" AND "adm"*'
+    assert fts_query('NOT OR (') == '"NOT" AND "OR" AND "("'
+    assert fts_query('  * ') == ''
+
+def test_search_text_pages_across_partitions(tmp_path):
+    s = storage(tmp_path)
+    now = datetime(2024, 11, 30, 12)
+    # in arrival order, as the collector writes them
+    docs = [doc(now - timedelta(days=d, minutes=m), raw=f'Failed password for invalid user u{d}{m} from 10.0.0.{m}')
+            for d in (2, 1, 0) for m in (3, 2, 1, 0)]
+    docs.append(doc(now, raw='Accepted password for root'))
+    s.index_many(docs)
+    seen = []
+    rows, cursor = s.search_text('"invalid user"', limit=5)
+    while True:
+        seen.extend(rows)
+        assert len(rows) <= 5
+        if cursor is None:
+            break
+        rows, cursor = s.search_text('"invalid user"', limit=5, cursor=cursor)
+    assert len(seen) == 12
+    assert [r['ts'] for r in seen] == sorted((r['ts'] for r in seen), reverse=True)
+    assert [r['raw'] for r in s.search_text('passw* root')[0]] == ['Accepted password for root']
+    rows, _ = s.search_text('failed', start=now - timedelta(days=1, hours=1), end=now - timedelta(hours=1))
+    assert {r['ts'][:10] for r in rows} == {'2024-11-29'}
+    assert s.search_text('"user u0"')[0] == []
+    with pytest.raises(ValueError):
+        s.search_text('failed', cursor='logs_x; DROP TABLE logs_20241130')
+
+def test_fts_index_is_built_for_existing_partitions(tmp_path):
+    path = str(tmp_path / 'logs.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE logs_20241104 (id INTEGER PRIMARY KEY, ts TEXT, src_ip TEXT, host TEXT, program TEXT, pid TEXT, event_type TEXT, raw TEXT)')
+    conn.execute("INSERT INTO logs_20241104 (ts, raw) VALUES ('2024-11-04T10:01:01Z', 'kernel panic')")
+    conn.commit()
+    conn.close()
+    s = Storage(es_host='http://invalid:9999', db_path=path)
+    assert [r['raw'] for r in s.search_text('panic')[0]] == ['kernel panic']
+    s.drop_expired(retention_days=1, now=datetime(2024, 11, 30))
+    assert s.conn.execute("SELECT count(*) FROM sqlite_master WHERE name LIKE 'logs_20241104%'").fetchone()[0] == 0
+
+def test_fts_sync_covers_only_its_own_batch_with_concurrent_writers(tmp_path):
+    # two --workers processes sharing one file: B commits a row just before A writes its batch
+    a, b = storage(tmp_path), storage(tmp_path)
+    now = datetime(2024, 11, 4, 10)
+    a.index_many([doc(now, raw='first alpha')])
+    synced = []
+
+    class Interleaved:
+        def __init__(self, conn):
+            self.conn = conn
+            self.other = lambda: b.index_many([doc(now, raw='worker beta')])
+
+        def __getattr__(self, name):
+            return getattr(self.conn, name)
+
+        def __enter__(self):
+            return self.conn.__enter__()
+
+        def __exit__(self, *exc):
+            return self.conn.__exit__(*exc)
+
+        def execute(self, sql, *args):
+            if sql.startswith('INSERT INTO logs_20241104_fts'):
+                synced.extend(r[0] for r in self.conn.execute('SELECT id FROM logs_20241104 WHERE id > ?', *args))
+            return self.conn.execute(sql, *args)
+
+        def executemany(self, *args):
+            if self.other is not None:
+                other, self.other = self.other, None
+                other()
+            return self.conn.executemany(*args)
+
+    a.conn = Interleaved(a.conn)
+    a.index_many([doc(now, raw='second alpha')])
+    raw = dict(a.conn.execute('SELECT id, raw FROM logs_20241104').fetchall())
+    # B indexed its own row; A indexes only the one it inserted
+    assert [raw[i] for i in synced] == ['second alpha']
+    assert sorted(r['raw'] for r in a.search_text('alpha')[0]) == ['first alpha', 'second alpha']
+    assert [r['raw'] for r in a.search_text('beta')[0]] == ['worker beta']
+
+class FakeIndices:
+    def __init__(self):
+        self.templates = {}
+
+    def put_index_template(self, name, body):
+        self.templates[name] = body
+
+class FakeES:
+    """Stand-in for the Elasticsearch client: records bulk writes and answers searches from them."""
+    def __init__(self):
+        self.indices = FakeIndices()
+        self.docs = {}
+        self.searches = []
+        self.pits = {}
+
+    def open_point_in_time(self, index, keep_alive, **params):
+        pit = 'pit%d' % len(self.pits)
+        self.pits[pit] = index
+        return {'id': pit}
+
+    def close_point_in_time(self, body):
+        del self.pits[body['id']]
+
+    def search(self, index=None, body=None, **params):
+        self.searches.append((index, body, params))
+        if 'pit' in body:
+            index = self.pits[body['pit']['id']]
+        names = index.split(',')
+        docs = [d for name in sorted(self.docs) for d in self.docs[name]
+                if any(name == i or (i.endswith('*') and name.startswith(i[:-1])) for i in names)]
+        # (timestamp, _shard_doc) per doc; the shard doc is its position in the searched indices
+        hits = [(d['timestamp'], n, d) for n, d in enumerate(docs)]
+        query = body['query']['bool']
+        for m in query.get('must', []):
+            words = m['simple_query_string']['query'].lower().split()
+            hits = [h for h in hits if all(w in h[2]['raw'].lower() for w in words)]
+        for f in query['filter']:
+            if 'term' in f:
+                (field, value), = f['term'].items()
+                hits = [h for h in hits if (h[2]['parsed'] if field.startswith('parsed.') else h[2]).get(field.split('.')[-1]) == value]
+            else:
+                r = f['range']['timestamp']
+                hits = [h for h in hits if h[0] >= r.get('gte', '') and ('lt' not in r or h[0] < r['lt'])]
+        # sort values as ES returns them: timestamp, then _shard_doc if the search asked for it
+        width = len(body['sort'])
+        hits = [((h[0], h[1])[:width], h[2]) for h in hits]
+        hits.sort(key=lambda h: h[0], reverse=True)
+        if 'search_after' in body:
+            hits = [h for h in hits if h[0] < tuple(body['search_after'])]
+        res = {'hits': {'hits': [{'_source': d, 'sort': list(key)} for key, d in hits[:body['size']]]}}
+        if 'pit' in body:
+            res['pit_id'] = body['pit']['id']
+        return res
+
+class FakeHelpers:
+    @staticmethod
+    def bulk(es, actions):
+        for a in actions:
+            source = a['_source']
+            # LogEvents arrive as JSON text, which Elasticsearch parses like any other body
+            es.docs.setdefault(a['_index'], []).append(json.loads(source) if isinstance(source, str) else source)
+
+def es_storage(tmp_path, monkeypatch):
+    import collector.storage
+    monkeypatch.setattr(collector.storage, 'helpers', FakeHelpers, raising=False)
+    s = storage(tmp_path)
+    s.es = FakeES()
+    s.use_es = True
+    s._init_es()
+    return s
+
+def test_es_template_maps_keywords(tmp_path, monkeypatch):
+    s = es_storage(tmp_path, monkeypatch)
+    template = s.es.indices.templates['syslogs']
+    props = template['template']['mappings']['properties']
+    assert template['index_patterns'] == ['syslogs-*']
+    assert props['src_ip']['type'] == 'keyword'
+    assert props['parsed']['properties']['event_type']['type'] == 'keyword'
+    assert template['template']['settings']['index.refresh_interval'] == '30s'
+
+def test_es_writes_daily_indices_and_searches_only_covering_ones(tmp_path, monkeypatch):
+    s = es_storage(tmp_path, monkeypatch)
+    now = datetime.utcnow()
+    s.index_many([doc(now - timedelta(minutes=5)), doc(now - timedelta(minutes=1), ip='10.0.0.2', event_type='ssh_success'),
+                  doc(now - timedelta(days=3))])
+    assert len(s.es.docs) == 2
+    rows = s.search_recent(minutes=30)
+    assert [r['src_ip'] for r in rows] == ['10.0.0.2', '10.0.0.1']
+    assert rows[0]['event_type'] == 'ssh_success'
+    index, body, params = s.es.searches[-1]
+    assert index.split(',')[-1] == 'syslogs-' + now.strftime('%Y.%m.%d')
+    assert len(index.split(',')) <= 2
+    assert params['ignore_unavailable']
+    assert [r['src_ip'] for r in s.search_recent(minutes=30, event_type='ssh_failed')] == ['10.0.0.1']
+    assert len(s.search_recent(minutes=60 * 24 * 7)) == 3
+
+def test_es_indices_follow_receive_time_not_forged_headers(tmp_path, monkeypatch):
+    from collector.parser import normalize_syslog
+    s = es_storage(tmp_path, monkeypatch)
+    now = datetime.utcnow()
+    received = now.isoformat() + 'Z'
+    events = [normalize_syslog(f'<38>1 {1700 + y}-06-01T00:00:00Z dev sshd 1 - - Failed password', '10.0.0.9', received)
+              for y in range(300)]
+    s.index_many(events + [doc(now - timedelta(minutes=2))])
+    assert list(s.es.docs) == ['syslogs-' + now.strftime('%Y.%m.%d')]
+    assert {d['timestamp'] for d in s.es.docs['syslogs-' + now.strftime('%Y.%m.%d')][:300]} == {received}
+    # the raw line keeps what the sender claimed
+    assert s.es.docs['syslogs-' + now.strftime('%Y.%m.%d')][0]['raw'].startswith('<38>1 1700-06-01')
+    # and searches by time find them
+    assert len(s.search_recent(minutes=30, src_ip='10.0.0.1')) == 1
+    assert len(s.search_recent(minutes=30, src_ip='10.0.0.9')) == 200
+
+def test_es_text_search_pages_through_tied_timestamps(tmp_path, monkeypatch):
+    s = es_storage(tmp_path, monkeypatch)
+    now = datetime.utcnow().replace(microsecond=0)
+    # RFC 3164 headers have whole seconds, so a burst shares one timestamp
+    s.index_many([doc(now, raw=f'Failed password for root id={i}') for i in range(12)] +
+                 [doc(now - timedelta(seconds=1), raw=f'Failed password for admin id={i}') for i in range(3)])
+    seen = []
+    rows, cursor = s.search_text('failed password', start=now - timedelta(hours=1), limit=5)
+    while True:
+        seen.extend(rows)
+        if cursor is None:
+            break
+        rows, cursor = s.search_text('failed password', limit=5, cursor=cursor)
+    assert len(seen) == 15
+    assert {r['raw'] for r in seen} == {f'Failed password for {u} id={i}' for u, n in (('root', 12), ('admin', 3)) for i in range(n)}
+    # every page came from the same point in time, closed after the last one
+    assert {b['pit']['id'] for _, b, _ in s.es.searches} == {'pit0'} and s.es.pits == {}
+    with pytest.raises(ValueError):
+        s.search_text('failed', cursor='[1]')
@@ -0,0 +1,50 @@
+from collector.analyzer import Analyzer
+from collector.suppression import AlertSuppressor
+
+def _alert(n):
+    return {'type': 'r', 'ip': '10.0.0.1', 'count': n, 'message': f'{n} failures'}
+
+def _ev(ip, ts):
+    return {'parsed': {'event_type': 'ssh_failed', 'src_ip': ip}, 'timestamp': '2024-11-04T%02d:%02d:%02d' % (ts // 3600, ts // 60 % 60, ts % 60)}
+
+def test_one_alert_per_cooldown_with_running_totals():
+    s = AlertSuppressor(cooldown=60)
+    sent = [s.check('10.0.0.1', _alert(n), n) for n in range(150)]
+    assert [n for n, out in enumerate(sent) if out] == [0, 60, 120]
+    first, update = sent[0][0], sent[60][0]
+    assert first['status'] == 'new' and first['matches'] == 1 and first['message'] == '0 failures'
+    assert update['status'] == 'ongoing' and update['matches'] == 61 and update['suppressed'] == 59
+    assert update['first_seen'] == '1970-01-01T00:00:00Z' and update['last_seen'] == '1970-01-01T00:01:00Z'
+    assert update['message'] == '60 failures (ongoing: 61 matches since 1970-01-01T00:00:00Z, 59 since the last alert)'
+    # quiet for a cooldown: the incident ends with a summary of what was held back since the last alert
+    assert s.expire(149 + 59) == []
+    ended = s.expire(149 + 60)
+    assert len(ended) == 1 and ended[0]['status'] == 'ended' and ended[0]['count'] == 149
+    assert ended[0]['matches'] == 150 and ended[0]['suppressed'] == 29 and len(s) == 0
+    # a later match starts a new incident
+    assert s.check('10.0.0.1', _alert(1), 1000)[0]['status'] == 'new'
+
+def test_memory_is_bounded():
+    s = AlertSuppressor(cooldown=60, max_keys=100)
+    for i in range(1000):
+        s.check(i, _alert(i), 0)
+    assert len(s) == 100 and s.stats()['incidents_evicted'] == 900
+    # only the most recently matched keys are kept
+    assert min(s.incidents) == 900
+
+def test_analyzer_alert_volume_follows_incidents_not_events():
+    rules = [{'name': 'bf', 'type': 'threshold', 'event_type': 'ssh_failed', 'window': 600, 'threshold': 5, 'cooldown': 300},
+             {'name': 'every', 'type': 'threshold', 'event_type': 'ssh_failed', 'window': 600, 'threshold': 5, 'cooldown': 0}]
+    a = Analyzer(None, rules=rules)
+    alerts = []
+    # 10k failures from one IP over about 50 minutes, then a different IP later on
+    for i in range(10000):
+        alerts.extend(a.process_all(_ev('203.0.113.9', i * 3 // 10)))
+    alerts.extend(a.process_all(_ev('198.51.100.7', 4000)))
+    bf = [x for x in alerts if x['type'] == 'bf']
+    assert [x['status'] for x in bf] == ['new'] + ['ongoing'] * 9 + ['ended']
+    assert bf[-1]['matches'] == 9996 and bf[-1]['ip'] == '203.0.113.9'
+    # cooldown 0 keeps the old behaviour: an alert on every match
+    assert sum(x['type'] == 'every' for x in alerts) == 9996
+    stats = a.stats()['bf']
+    assert stats['alerts_sent'] == 11 and stats['alerts_suppressed'] == 9986 and stats['incidents'] == 0
@@ -0,0 +1,119 @@
+import asyncio
+from collector.tail import TailBuffer, TailServer, format_events, matcher
+
+def doc(i, ip='10.0.0.1', event_type='ssh_failed'):
+    return {'timestamp': '2024-11-04T10:00:%02dZ' % i, 'src_ip': ip, 'host': 'h', 'parsed': {'event_type': event_type}, 'raw': f'line {i}'}
+
+def test_ring_skips_ahead_when_overwritten():
+    ring = TailBuffer(capacity=4)
+    for i in range(10):
+        ring.append(doc(i))
+    entries, cursor, skipped = ring.read(3)
+    assert skipped == 3
+    assert [slot[0]['raw'] for _, slot in entries] == ['line 6', 'line 7', 'line 8', 'line 9']
+    assert cursor == 10
+    assert ring.read(10) == ([], 10, 0)
+
+def test_filters_and_shared_encoding():
+    ring = TailBuffer(capacity=8)
+    ring.append(doc(1))
+    ring.append(doc(2, ip='10.0.0.2', event_type='ssh_success'))
+    entries, _, _ = ring.read(0)
+    assert len(format_events(entries, matcher(ip='10.0.0.2'))) == 1
+    assert len(format_events(entries, matcher(event_type='ssh_failed', host='h'))) == 1
+    events = format_events(entries)
+    assert events[0].startswith('id: 1\ndata: {')
+    # encoded once, reused for the next client
+    assert entries[0][1][1] is not None
+
+async def _tail(port, path, headers=''):
+    # keep the writer referenced; dropping it closes the connection
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: x\r\n{headers}\r\n'.encode())
+    await writer.drain()
+    return reader, writer
+
+async def _events(reader, n):
+    events = []
+    while len(events) < n:
+        block = (await asyncio.wait_for(reader.readuntil(b'\n\n'), 2)).decode()
+        if 'data: ' in block and not block.startswith('retry'):
+            events.append(block)
+    return events
+
+def test_sse_fans_out_with_filters_and_resume():
+    async def run():
+        ring = TailBuffer(capacity=100)
+        tail = await TailServer(ring, interval=0).start('127.0.0.1', 0)
+        port = tail.server.sockets[0].getsockname()[1]
+        everything, w1 = await _tail(port, '/tail')
+        only, w2 = await _tail(port, '/tail?ip=10.0.0.2')
+        head = await asyncio.wait_for(everything.readuntil(b'\r\n\r\n'), 2)
+        assert b'text/event-stream' in head
+        await asyncio.sleep(0.05)
+        for i in range(3):
+            ring.append(doc(i, ip='10.0.0.%d' % i))
+        assert len(await _events(everything, 3)) == 3
+        got = await _events(only, 1)
+        assert '"src_ip":"10.0.0.2"' in got[0]
+        # a reconnecting client picks up after the last id it saw
+        resumed, w3 = await _tail(port, '/tail', 'Last-Event-ID: 1\r\n')
+        got = await _events(resumed, 2)
+        assert [e.split('\n')[0] for e in got] == ['id: 2', 'id: 3']
+        missing, w = await _tail(port, '/nope')
+        assert (await missing.readline()).startswith(b'HTTP/1.1 404')
+        assert tail.stats()['clients'] == 3
+        tail.close()
+    asyncio.run(run())
+
+def test_lagging_client_is_told_what_it_missed():
+    async def run():
+        ring = TailBuffer(capacity=5)
+        for i in range(20):
+            ring.append(doc(i))
+        tail = await TailServer(ring, interval=0).start('127.0.0.1', 0)
+        port = tail.server.sockets[0].getsockname()[1]
+        reader, w = await _tail(port, '/tail', 'Last-Event-ID: 10\r\n')
+        events = await _events(reader, 6)
+        assert events[0].startswith('event: skipped\ndata: 5')
+        assert events[1].startswith('id: 16')
+        tail.close()
+    asyncio.run(run())
+
+def test_client_that_stops_reading_is_dropped():
+    async def run():
+        ring = TailBuffer(capacity=50000)
+        tail = await TailServer(ring, interval=0, slow_timeout=0.2).start('127.0.0.1', 0)
+        port = tail.server.sockets[0].getsockname()[1]
+        reader, w = await _tail(port, '/tail')
+        await asyncio.sleep(0.05)
+        # never read: the socket buffers fill up and the server gives up on this client
+        for i in range(40000):
+            ring.append({'src_ip': '10.0.0.1', 'raw': 'x' * 1000 + str(i)})
+            if i % 1000 == 0:
+                await asyncio.sleep(0)
+        for _ in range(50):
+            if tail.dropped:
+                break
+            await asyncio.sleep(0.1)
+        assert tail.stats()['dropped'] == 1
+        assert tail.stats()['clients'] == 0
+        tail.close()
+    asyncio.run(run())
+
+def test_only_the_dashboard_origin_may_read_the_stream():
+    async def run():
+        tail = await TailServer(TailBuffer(capacity=8), interval=0, allow_origins=['http://dash:5000']).start(port=0)
+        host, port = tail.server.sockets[0].getsockname()[:2]
+        assert host == '127.0.0.1'
+        page, w1 = await _tail(port, '/tail', 'Origin: https://evil.example\r\n')
+        assert (await page.readline()).startswith(b'HTTP/1.1 403')
+        dash, w2 = await _tail(port, '/tail', 'Origin: http://dash:5000\r\n')
+        head = await asyncio.wait_for(dash.readuntil(b'\r\n\r\n'), 2)
+        assert b'Access-Control-Allow-Origin: http://dash:5000\r\n' in head
+        # same-origin and non-browser clients send no Origin and get no CORS header
+        cli, w3 = await _tail(port, '/tail')
+        head = await asyncio.wait_for(cli.readuntil(b'\r\n\r\n'), 2)
+        assert head.startswith(b'HTTP/1.1 200') and b'Access-Control' not in head
+        tail.close()
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+from collector.templates import TemplateMiner
+from collector.parser import normalize_syslog
+
+def test_similar_messages_share_a_template_with_params():
+    miner = TemplateMiner()
+    first = miner.match('systemd', 'Started Session 12 of user bob.')
+    second = miner.match('systemd', 'Started Session 13 of user alice.')
+    assert second['template'] == 'Started Session <*> of user <*>'
+    assert second['params'] == ['13', 'alice.']
+    assert first['template_id'] != second['template_id']
+    third = miner.match('systemd', 'Started Session 99 of user root.')
+    assert third['template_id'] == second['template_id']
+    assert third['params'] == ['99', 'root.']
+    # other program, other token count, other leading words: separate templates
+    assert miner.match('sshd', 'Started Session 12 of user bob.')['template_id'] != third['template_id']
+    assert miner.match('systemd', 'Started Session 12 of user bob now')['template_id'] != third['template_id']
+    assert miner.match('systemd', 'Stopped Session 12 of user bob.')['template_id'] != third['template_id']
+    assert miner.stats()['templates'] == 4
+
+def test_cache_is_bounded_and_least_recent_goes_first():
+    miner = TemplateMiner(max_clusters=3)
+    for word in ('alpha', 'beta', 'gamma'):
+        miner.match('app', f'{word} job done')
+    miner.match('app', 'alpha job done')
+    miner.match('app', 'delta job done')
+    assert [t[2] for t in miner.templates()] == ['delta job done', 'alpha job done', 'gamma job done']
+    assert miner.stats()['evicted'] == 1
+    # a memoized message whose template was evicted is mined again
+    miner.match('app', 'beta job done')
+    assert miner.stats()['created'] == 5
+
+def test_full_nodes_route_new_tokens_to_the_wildcard_branch():
+    miner = TemplateMiner(max_children=2, similarity=0.9)
+    for word in ('one', 'two', 'three', 'four'):
+        miner.match('app', f'{word} thing happened here')
+    assert len(miner.templates()) == 4
+    leaves = miner.root[('app', 4)]
+    assert set(leaves) == {'one', 'two', '<*>'}
+
+def test_templates_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'templates.json')
+    miner = TemplateMiner()
+    miner.match('app', 'session opened for bob from 10.0.0.1')
+    before = miner.match('app', 'session opened for eve from 10.0.0.2')
+    miner.save(path)
+    restored = TemplateMiner()
+    assert restored.load(path) == 1
+    after = restored.match('app', 'session opened for joe from 10.0.0.3')
+    assert after['template_id'] == before['template_id']
+    assert after['params'] == ['joe', '10.0.0.3']
+    assert restored.stats()['created'] == 0
+    assert TemplateMiner().load(str(tmp_path / 'missing.json')) == 0
+
+def test_parser_mines_only_unclassified_messages():
+    noise = normalize_syslog('Nov  4 10:01:01 h CRON[123]: (root) CMD (run-parts /etc/cron.hourly)', '10.0.0.1', 'x')
+    assert noise['parsed']['event_type'] == 'unclassified'
+    assert noise['parsed']['template'] == '(root) CMD (run-parts /etc/cron.hourly)'
+    assert 'template_id' in noise['parsed']
+    ssh = normalize_syslog('Nov  4 10:01:01 h sshd[1]: Failed password for root from 10.0.0.42 port 22 ssh2', '10.0.0.1', 'x')
+    assert 'template_id' not in ssh['parsed']
+
+def test_memos_are_bounded_by_bytes(monkeypatch):
+    from collector import templates
+    monkeypatch.setattr(templates, 'MEMO_MAX_BYTES', 20000)
+    m = TemplateMiner()
+    for i in range(200):
+        word = ''.join(chr(97 + int(c)) for c in str(i))
+        m.match('app', f'request {word} ' + 'x' * 1000)
+    assert m.memo_bytes <= 20000 and sum(len(k[1]) for k in m.memo) == m.memo_bytes
+    assert m.shapes_bytes <= 20000 and len(m.shapes) < 200
+    # a huge line is still mined, just never kept as a memo key
+    huge = 'blob ' + 'y' * 65536
+    assert m.match('app', huge)['template'].startswith('blob ')
+    assert all(len(k[1]) < 65536 for k in m.memo) and all(len(k[1]) < 65536 for k in m.shapes)
@@ -0,0 +1,49 @@
+from collector.windows import WindowStore
+
+def test_counts_within_window():
+    w = WindowStore(window=60)
+    assert [w.add('ip', t) for t in (0, 10, 20)] == [1, 2, 3]
+    # event at 75 pushes 0 and 10 out of the 60s window
+    assert w.add('ip', 75) == 2
+    assert w.last('ip') == 75
+    assert w.stats()['events'] == 2
+
+def test_last_does_not_allocate():
+    w = WindowStore(window=60)
+    assert w.last('unknown') is None
+    assert len(w) == 0
+
+def test_idle_keys_expire():
+    w = WindowStore(window=60, idle_ttl=120)
+    w.add('old', 0)
+    w.add('new', 100)
+    assert 'old' in w
+    w.add('new', 200)
+    assert 'old' not in w
+    assert w.stats()['expirations'] == 1
+
+def test_global_key_cap_evicts_least_recent():
+    w = WindowStore(window=600, max_keys=3)
+    for i, key in enumerate(['a', 'b', 'c']):
+        w.add(key, i)
+    w.add('a', 3)
+    w.add('d', 4)
+    assert 'b' not in w
+    assert all(k in w for k in ('a', 'c', 'd'))
+    assert w.stats()['evictions'] == 1
+
+def test_event_caps():
+    w = WindowStore(window=600, max_events_per_key=4, max_events=6)
+    for t in range(10):
+        w.add('a', t)
+    assert w.count('a') == 4
+    for t in range(3):
+        w.add('b', t)
+    # 7 events > 6: the least recently touched key goes
+    assert 'a' not in w and w.count('b') == 3
+
+def test_out_of_order_events_stay_sorted():
+    w = WindowStore(window=60)
+    for t in (10, 30, 20):
+        w.add('ip', t)
+    assert list(w.keys['ip']) == [10, 20, 30]
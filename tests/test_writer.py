@@ -0,0 +1,47 @@
+import time
+from collector.storage import Storage
+from collector.writer import BatchWriter
+
+class RecordingStorage:
+    def __init__(self):
+        self.batches = []
+
+    def index_many(self, docs):
+        self.batches.append(list(docs))
+        return len(docs)
+
+def _doc(i):
+    return {'timestamp': '2024-11-04T10:01:01', 'received_ts': '2024-11-04T10:01:02Z', 'src_ip': '10.0.0.%d' % i, 'host': 'h', 'program': 'sshd',
+            'pid': str(i), 'parsed': {'event_type': 'ssh_failed'}, 'raw': 'line %d' % i}
+
+def test_flushes_on_batch_size():
+    storage = RecordingStorage()
+    w = BatchWriter(storage, batch_size=10, flush_interval=60).start()
+    for i in range(25):
+        w.submit(_doc(i))
+    w.stop()
+    assert [len(b) for b in storage.batches] == [10, 10, 5]
+    assert w.stats()['written'] == 25
+    assert w.flush_seconds.count == 3
+
+def test_flushes_on_interval():
+    storage = RecordingStorage()
+    w = BatchWriter(storage, batch_size=1000, flush_interval=0.05).start()
+    w.submit(_doc(1))
+    deadline = time.time() + 2
+    while not storage.batches and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(storage.batches) == 1
+    w.stop()
+
+def test_full_queue_drops_and_counts():
+    w = BatchWriter(RecordingStorage(), max_queue=2)
+    assert w.submit(_doc(1)) and w.submit(_doc(2))
+    assert not w.submit(_doc(3))
+    assert w.stats()['dropped'] == 1
+    assert w.stats()['queue_depth'] == 2
+
+def test_sqlite_index_many(tmp_path):
+    storage = Storage(es_host='http://invalid:9999', db_path=str(tmp_path / 'logs.db'))
+    storage.index_many([_doc(i) for i in range(100)])
+    assert storage.conn.execute('SELECT COUNT(*) FROM logs_20241104').fetchone()[0] == 100
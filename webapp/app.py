@@ -2,11 +2,18 @@ import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
+from datetime import datetime, timezone
 from flask import Flask, render_template_string, request, jsonify
 from collector.storage import Storage
+from collector.rollups import RollupStore, ROLLUP_DB
+
+# Collector's live tail endpoint (collector/tail.py); by default the dashboard's host on TAIL_PORT
+TAIL_URL = os.getenv('TAIL_URL', '')
+TAIL_PORT = os.getenv('TAIL_PORT', '5516')
 
 app = Flask(__name__)
 storage = Storage()
+rollups = RollupStore(ROLLUP_DB)
 
 INDEX_HTML = '''
 <!doctype html>
@@ -22,17 +29,40 @@ INDEX_HTML = '''
   <form method="get" class="row g-2 mb-3">
     <div class="col-auto"><input class="form-control" name="ip" placeholder="src ip" value="{{ip}}"></div>
     <div class="col-auto"><input class="btn btn-primary" type="submit" value="Search"></div>
+    <div class="col-auto"><button class="btn btn-outline-secondary" type="button" id="live">Live tail</button></div>
   </form>
   <h4>Recent Logs</h4>
   <table class="table table-sm">
     <thead><tr><th>TS</th><th>IP</th><th>Type</th><th>Host</th><th>Raw</th></tr></thead>
-    <tbody>
+    <tbody id="rows">
     {% for r in rows %}
       <tr><td>{{r.ts|e}}</td><td>{{r.src_ip|e}}</td><td>{{r.event_type|e}}</td><td>{{r.host|e}}</td><td><code>{{r.raw|e}}</code></td></tr>
     {% endfor %}
     </tbody>
   </table>
 </div>
+<script>
+// streams new docs from the collector instead of reloading the page (and re-querying storage)
+var source = null;
+document.getElementById('live').onclick = function () {
+  if (source) { source.close(); source = null; this.classList.remove('active'); return; }
+  this.classList.add('active');
+  var url = {{ tail_url|tojson }} || (location.protocol + '//' + location.hostname + ':' + {{ tail_port|tojson }} + '/tail');
+  source = new EventSource(url + '?ip=' + encodeURIComponent({{ ip|tojson }}));
+  var body = document.getElementById('rows');
+  source.onmessage = function (e) {
+    var d = JSON.parse(e.data), p = d.parsed || {};
+    var tr = document.createElement('tr');
+    [d.timestamp, d.src_ip, p.event_type, d.host, d.raw].forEach(function (v, i) {
+      var td = document.createElement('td');
+      if (i == 4) { td.appendChild(document.createElement('code')).textContent = v; } else { td.textContent = v || ''; }
+      tr.appendChild(td);
+    });
+    body.insertBefore(tr, body.firstChild);
+    while (body.rows.length > 500) body.deleteRow(-1);
+  };
+};
+</script>
 </body>
 </html>
 '''
@@ -40,14 +70,52 @@ INDEX_HTML = '''
 @app.route('/')
 def index():
     ip = request.args.get('ip')
-    rows = storage.search_recent(event_type=None, src_ip=ip)
-    return render_template_string(INDEX_HTML, rows=rows, ip=ip or '')
+    minutes = request.args.get('minutes', 60, type=int)
+    rows = storage.search_recent(minutes=minutes, event_type=None, src_ip=ip)
+    return render_template_string(INDEX_HTML, rows=rows, ip=ip or '', tail_url=TAIL_URL, tail_port=TAIL_PORT)
 
 @app.route('/api/search')
 def api_search():
     ip = request.args.get('ip')
-    rows = storage.search_recent(event_type=None, src_ip=ip)
+    minutes = request.args.get('minutes', 60, type=int)
+    rows = storage.search_recent(minutes=minutes, event_type=None, src_ip=ip)
     return jsonify(rows)
 
+def _time_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value.rstrip('Z'))
+    if dt.tzinfo is not None:
+        # storage compares naive UTC, like the timestamps it stores
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+@app.route('/api/logs/search')
+def api_logs_search():
+    """Full-text search: ?q=word "a phrase" prefix*&start=ISO&end=ISO&limit=50&cursor=<next_cursor>"""
+    q = request.args.get('q', '')
+    limit = request.args.get('limit', 50, type=int)
+    try:
+        rows, next_cursor = storage.search_text(q, start=_time_arg('start'), end=_time_arg('end'),
+                                                limit=limit, cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        # full-text search disabled (SQLITE_FTS=0)
+        return jsonify({'error': str(e)}), 501
+    return jsonify({'results': rows, 'next_cursor': next_cursor})
+
+@app.route('/api/stats')
+def api_stats():
+    """Precomputed per-minute counts: ?dim=event_type|host|src_ip|template|total&minutes=60&limit=10"""
+    dim = request.args.get('dim', 'event_type')
+    minutes = request.args.get('minutes', 60, type=int)
+    limit = request.args.get('limit', 10, type=int)
+    try:
+        return jsonify(rollups.query(dim, minutes=minutes, limit=limit))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False)